@@ -0,0 +1,286 @@
+from features import Features
+from similarity import Similarity
+from similarity import GRAM_SIMILARITY_TYPES
+from planner import parse_memory
+from planner import format_memory
+
+from scipy import sparse
+
+import pandas as pd
+import numpy as np
+
+import json
+import os
+import shutil
+
+
+class AttributeGrams(object):
+    """
+    Gram matrices of the one hot features of every source column, stored in "{grams_dir}" (grams, indexes and columns)
+    and memory mapped when opened.
+
+    One hot blocks of different source columns add up in the dot product, so the similarities of any subset or
+    weighting of source columns are derived from the sum of their gram matrices without preprocessing again.
+
+    """
+
+    def __init__(self, grams_dir):
+        """
+        Opens the gram matrices of grams_dir.
+
+        :param grams_dir: string, e.g. "output/20210101_1200/grams"
+        """
+
+        self.grams_dir = grams_dir
+
+        with open(f'{grams_dir}/meta.json') as file:
+            meta = json.load(file)
+
+        self.columns = meta['columns']
+        self.index_column = meta['index_column']
+        self.indexes = np.load(f'{grams_dir}/indexes.npy').astype(object)
+        self.grams = np.load(f'{grams_dir}/grams.npy', mmap_mode='r')
+
+    @staticmethod
+    def build(features, vocabulary, grams_dir, block_size=1000, max_bytes=None):
+        """
+        Calculates the gram matrix of every source column of vocabulary, block_size rows at a time, and writes them to
+        grams_dir as one array of shape (source columns, indexes, indexes).
+
+        Features of source column col are named col+'_'+label as in Preprocess and Features.from_labels. Gram matrices
+        of binary features are stored as uint8 counts, others as float32. Nothing is written if the grams need more
+        than the free disk space of grams_dir or than max_bytes.
+
+        :param features: Features
+        :param vocabulary: dictionary, source column to sorted labels
+        :param grams_dir: string
+        :param block_size: int
+        :param max_bytes: int or string such as "10g", see planner.parse_memory
+        :return: AttributeGrams
+        """
+
+        column_positions = AttributeGrams._find_column_positions(features, vocabulary)
+        row_count = len(features.indexes)
+
+        values = features.matrix.data if features.is_sparse else features.matrix
+        is_binary = np.isin(values, [0, 1]).all() \
+            and all(len(positions) <= np.iinfo(np.uint8).max for positions in column_positions.values())
+        dtype = np.uint8 if is_binary else np.float32
+
+        os.makedirs(grams_dir, exist_ok=True)
+        AttributeGrams._check_size(len(column_positions) * row_count * row_count * np.dtype(dtype).itemsize, grams_dir,
+                                   max_bytes)
+        grams = np.lib.format.open_memmap(f'{grams_dir}/grams.npy', mode='w+', dtype=dtype,
+                                          shape=(len(column_positions), row_count, row_count))
+
+        for position, positions in enumerate(column_positions.values()):
+            mat_column = features.matrix[:, positions].astype(np.float32)
+
+            for start in range(0, row_count, block_size):
+                stop = min(start + block_size, row_count)
+                mat_gram = mat_column[start:stop] @ mat_column.T
+                grams[position, start:stop] = mat_gram.toarray() if sparse.issparse(mat_gram) else mat_gram
+
+        grams.flush()
+        del grams
+
+        np.save(f'{grams_dir}/indexes.npy', np.asarray(features.indexes, dtype=str))
+        with open(f'{grams_dir}/meta.json', 'w') as file:
+            json.dump({'columns': list(column_positions), 'index_column': features.index_column}, file)
+
+        return AttributeGrams(grams_dir)
+
+    @staticmethod
+    def _check_size(grams_bytes, grams_dir, max_bytes=None):
+        """
+        Checks the grams fit in the free disk space of grams_dir and in max_bytes.
+
+        :param grams_bytes: int
+        :param grams_dir: string
+        :param max_bytes: int or string, see planner.parse_memory
+        :return:
+        """
+
+        free_bytes = shutil.disk_usage(grams_dir).free
+        assert grams_bytes <= free_bytes, \
+            f'Attribute grams need {format_memory(grams_bytes)}, only {format_memory(free_bytes)} are free on disk.'
+
+        if max_bytes is not None:
+            assert grams_bytes <= parse_memory(max_bytes), \
+                f'Attribute grams need {format_memory(grams_bytes)}, more than "max_bytes" ' \
+                f'({format_memory(parse_memory(max_bytes))}).'
+
+    @staticmethod
+    def _find_column_positions(features, vocabulary):
+        """
+        Finds the feature positions of every source column of vocabulary.
+
+        :param features: Features
+        :param vocabulary: dictionary, source column to sorted labels
+        :return: dictionary, source column to list of ints
+        """
+
+        feature_positions = {col: position for position, col in enumerate(features.columns)}
+        column_positions = {}
+
+        for col, labels in vocabulary.items():
+            missing_features = [col+'_'+label for label in labels if col+'_'+label not in feature_positions]
+            assert not missing_features, f'Feature "{missing_features[0]}" of "vocabulary" is not in "features".'
+            column_positions[col] = [feature_positions[col+'_'+label] for label in labels]
+
+        assert sum(len(positions) for positions in column_positions.values()) == len(features.columns), \
+            'Not all features belong to a column of "vocabulary".'
+
+        return column_positions
+
+    def _create_weights(self, columns=None, weights=None):
+        """
+        Creates the weight of every source column, 1 for columns and 0 for the others.
+
+        :param columns: list of strings, source columns to use, all if None
+        :param weights: dictionary, source column to non negative weight, 1 if missing
+        :return: numpy array
+        """
+
+        columns = self.columns if columns is None else columns
+        weights = {} if weights is None else weights
+
+        unknown_columns = [col for col in list(columns) + list(weights) if col not in self.columns]
+        assert not unknown_columns, f'"{unknown_columns[0]}" is not one of {self.columns}.'
+        assert all(weight >= 0 for weight in weights.values()), '"weights" have to be non negative.'
+
+        return np.array([weights.get(col, 1.) if col in columns else 0. for col in self.columns])
+
+    def combine(self, columns=None, weights=None, start=0, stop=None):
+        """
+        Sums the gram matrices of columns multiplied by their weights, which equals the gram matrix of features
+        preprocessed with only those columns and each column's one hot features scaled by the root of its weight.
+
+        :param columns: list of strings, source columns to use, all if None
+        :param weights: dictionary, source column to non negative weight, 1 if missing
+        :param start: int, first row
+        :param stop: int, row after the last row, all rows if None
+        :return: numpy array of shape (stop - start, indexes), float64
+        """
+
+        column_weights = self._create_weights(columns, weights)
+        stop = len(self.indexes) if stop is None else stop
+
+        mat_gram = np.zeros((stop - start, len(self.indexes)))
+        for position in np.flatnonzero(column_weights):
+            mat_gram += column_weights[position] * self.grams[position, start:stop]
+
+        return mat_gram
+
+    def _create_similarity(self, columns, weights, similarity_type, top_k, block_size, precision, seed):
+        """
+        Creates a Similarity ranking and storing similarities derived from combined gram matrices.
+
+        Its features only hold the norm of every combined feature row, which is all quantisation needs. As in
+        Similarity, similarities are calculated in float32 unless "precision" is "float64".
+
+        :param columns: list of strings
+        :param weights: dictionary
+        :param similarity_type: string
+        :param top_k: int
+        :param block_size: int
+        :param precision: string
+        :param seed: int
+        :return: Similarity, Features, numpy array (squared norms of the combined features)
+        """
+
+        assert similarity_type in GRAM_SIMILARITY_TYPES, f'"similarity_type" has to be one of {GRAM_SIMILARITY_TYPES}.'
+
+        column_weights = self._create_weights(columns, weights)
+        norms = np.zeros(len(self.indexes))
+        for position in np.flatnonzero(column_weights):
+            norms += column_weights[position] * np.diagonal(self.grams[position])
+        if precision != 'float64':
+            norms = norms.astype(np.float32)
+
+        features = Features(indexes=self.indexes,
+                            matrix=np.sqrt(norms)[:, None],
+                            columns=['norm'],
+                            index_column=self.index_column)
+
+        similarity = Similarity(df_features=features,
+                                index_column=self.index_column,
+                                similarity_type=similarity_type,
+                                top_k=top_k,
+                                block_size=block_size,
+                                check_nulls=False,
+                                seed=seed,
+                                precision=precision)
+
+        if precision == 'uint8':
+            similarity._set_quantisation(features.matrix)
+
+        return similarity, features, norms
+
+    def generate(self, columns=None, weights=None, similarity_type='cosine', top_k=None, block_size=1000,
+                 precision='float64', seed=None):
+        """
+        Generates similarities of a subset or weighting of source columns from the gram matrices, in the format of
+        Similarity.generate. In top_k mode the wide matrix is not built and None is returned in its place.
+
+        :param columns: list of strings, source columns to use, all if None
+        :param weights: dictionary, source column to non negative weight, 1 if missing
+        :param similarity_type: string, one of GRAM_SIMILARITY_TYPES
+        :param top_k: int
+        :param block_size: int
+        :param precision: string, one of PRECISIONS
+        :param seed: int
+        :return: pandas data frame (wide), pandas data frame (long)
+        """
+
+        if top_k is not None:
+            pd_df_similarity_long = pd.concat(list(self.generate_long_blocks(columns=columns,
+                                                                             weights=weights,
+                                                                             similarity_type=similarity_type,
+                                                                             top_k=top_k,
+                                                                             block_size=block_size,
+                                                                             precision=precision,
+                                                                             seed=seed)), ignore_index=True)
+            return None, pd_df_similarity_long
+
+        similarity, features, norms = self._create_similarity(columns, weights, similarity_type, top_k, block_size,
+                                                              precision, seed)
+
+        mat_gram = self.combine(columns, weights).astype(norms.dtype, copy=False)
+        mat_similarity = similarity._derive_similarity(mat_gram, norms, norms, is_same=True)
+
+        pd_df_similarity_with_prefix = similarity._convert_to_wide_format(features, mat_similarity)
+        pd_df_similarity_long = pd.concat(list(similarity._generate_long_blocks(features, mat_similarity)),
+                                          ignore_index=True)
+
+        return pd_df_similarity_with_prefix, pd_df_similarity_long
+
+    def generate_long_blocks(self, columns=None, weights=None, similarity_type='cosine', top_k=None, block_size=1000,
+                             precision='float64', seed=None):
+        """
+        Generates long similarities of a subset or weighting of source columns block_size rows at a time, in the
+        format of Similarity.generate_long_blocks.
+
+        :param columns: list of strings, source columns to use, all if None
+        :param weights: dictionary, source column to non negative weight, 1 if missing
+        :param similarity_type: string, one of GRAM_SIMILARITY_TYPES
+        :param top_k: int
+        :param block_size: int
+        :param precision: string, one of PRECISIONS
+        :param seed: int
+        :return: generator of pandas data frames
+        """
+
+        similarity, features, norms = self._create_similarity(columns, weights, similarity_type, top_k, block_size,
+                                                              precision, seed)
+
+        row_count = len(self.indexes)
+        top_k = row_count if top_k is None else min(top_k, row_count)
+
+        for start in range(0, row_count, block_size):
+            stop = min(start + block_size, row_count)
+            mat_gram = self.combine(columns, weights, start=start, stop=stop).astype(norms.dtype, copy=False)
+
+            yield similarity._create_long_block(self.indexes[start:stop], self.indexes,
+                                                similarity._derive_similarity(mat_gram, norms[start:stop], norms),
+                                                top_k)
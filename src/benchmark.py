@@ -0,0 +1,142 @@
+from spark_utils import create_spark_session
+
+from preprocess import Preprocess
+from similarity import Similarity
+from features import Features
+from synthetic import write_labels
+from utils import create_timestamp
+from metrics import Metrics
+
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+
+
+STAGES = ['read', 'preprocess', 'collect', 'similarity']
+
+
+def run_benchmark(spark, row_count, column_count=3, cardinality=10, similarity_type='cosine', top_k=10,
+                  index_column='recipe_id', seed=0):
+    """
+    Benchmarks all stages of the pipeline on a synthetic label table, measuring wall time, peak RSS of the python
+    driver so far and the number of spark jobs and stages triggered.
+
+    Similarities are generated block by block as sparse features and discarded, so only the top_k neighbours of a block
+    are held in memory at once.
+
+    :param spark: spark session
+    :param row_count: int
+    :param column_count: int
+    :param cardinality: int
+    :param similarity_type: string
+    :param top_k: int
+    :param index_column: string
+    :param seed: int
+    :return: list of dictionaries, one per stage
+    """
+
+    metrics = Metrics(spark=spark, trace_memory=False)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = write_labels(f'{temp_dir}/labels.csv',
+                            row_count=row_count,
+                            column_count=column_count,
+                            cardinality=cardinality,
+                            index_column=index_column,
+                            seed=seed)
+
+        with metrics.stage('read'):
+            df_labels = spark.read.csv(path, header=True)
+        with metrics.stage('preprocess'):
+            df_features = Preprocess(df_labels=df_labels, columns='all', index_column=index_column).preprocess()
+        with metrics.stage('collect'):
+            features = Features.from_spark(df_features, index_column=index_column)
+        df_features.unpersist()
+
+    similarity = Similarity(df_features=features,
+                            index_column=index_column,
+                            similarity_type=similarity_type,
+                            top_k=top_k,
+                            check_nulls=False,
+                            seed=seed)
+    with metrics.stage('similarity'):
+        for _ in similarity.generate_long_blocks():
+            pass
+
+    parameters = {
+        'rows': row_count,
+        'columns': column_count,
+        'cardinality': cardinality,
+        'features': len(features.columns),
+        'similarity_type': similarity_type,
+        'top_k': top_k
+    }
+
+    return [{**parameters, **record} for record in metrics.records]
+
+
+def get_commit():
+    """
+    Returns the current git commit, None outside of a git repository.
+
+    :return: string or None
+    """
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(records, path):
+    """
+    Appends benchmark records to a json lines file, tagged with commit and creation timestamp.
+
+    :param records: list of dictionaries
+    :param path: string
+    :return: string, path
+    """
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    commit = get_commit()
+    created = create_timestamp()
+
+    with open(path, 'a') as file:
+        for record in records:
+            file.write(json.dumps({'commit': commit, 'created': created, **record}) + '\n')
+
+    return path
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks the pipeline stages on synthetic label tables.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--columns', type=int, default=3)
+    parser.add_argument('--cardinality', type=int, default=10)
+    parser.add_argument('--similarity-type', default='cosine')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmarks/results.jsonl')
+    arguments = parser.parse_args()
+
+    spark = create_spark_session('benchmark_similarities')
+
+    for rows in arguments.rows:
+        benchmark_records = run_benchmark(spark,
+                                          row_count=rows,
+                                          column_count=arguments.columns,
+                                          cardinality=arguments.cardinality,
+                                          similarity_type=arguments.similarity_type,
+                                          top_k=arguments.top_k,
+                                          seed=arguments.seed)
+        write_results(benchmark_records, arguments.output)
+
+        for benchmark_record in benchmark_records:
+            print(json.dumps(benchmark_record))
+
+    spark.stop()
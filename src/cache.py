@@ -0,0 +1,151 @@
+from features import Features
+from labels import PREPROCESS_VERSION
+
+from scipy import sparse
+
+import numpy as np
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+class FeatureCache(object):
+    """
+    Content addressed cache of preprocessed features on disk.
+
+    Entries are keyed by a hash of the input file contents, the preprocessing parameters and PREPROCESS_VERSION and
+    hold the matrix (.npz if sparse, .npy if dense), the indexes and the vocabulary. The least recently used entries
+    are evicted once there are more than max_entries or they take more than max_bytes.
+
+    """
+
+    def __init__(self, cache_dir='cache/features', max_entries=10, max_bytes=None):
+        """
+
+        :param cache_dir: string
+        :param max_entries: int, maximum number of entries kept, unlimited if None
+        :param max_bytes: int, maximum total size of entries kept, unlimited if None
+        """
+
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def create_key(path, **parameters):
+        """
+        Creates the key of the features of an input file preprocessed with parameters.
+
+        :param path: string, input file
+        :param parameters: json serialisable preprocessing parameters, e.g. columns and index_column
+        :return: string, sha256 hex digest
+        """
+
+        key = hashlib.sha256()
+
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 ** 2), b''):
+                key.update(chunk)
+
+        key.update(json.dumps({'version': PREPROCESS_VERSION, **parameters}, sort_keys=True).encode('utf-8'))
+
+        return key.hexdigest()
+
+    def load(self, key):
+        """
+        Loads the features and vocabulary of key and marks the entry as recently used.
+
+        :param key: string
+        :return: Features, dictionary (vocabulary), or None if key is not cached
+        """
+
+        entry_dir = f'{self.cache_dir}/{key}'
+        if not os.path.isfile(f'{entry_dir}/meta.json'):
+            return None
+
+        with open(f'{entry_dir}/meta.json') as file:
+            meta = json.load(file)
+
+        if meta['is_sparse']:
+            matrix = sparse.load_npz(f'{entry_dir}/matrix.npz')
+        else:
+            matrix = np.load(f'{entry_dir}/matrix.npy')
+
+        features = Features(indexes=np.load(f'{entry_dir}/indexes.npy').astype(object),
+                            matrix=matrix,
+                            columns=meta['columns'],
+                            index_column=meta['index_column'])
+
+        os.utime(f'{entry_dir}/meta.json')
+
+        return features, meta['vocabulary']
+
+    def save(self, key, features, vocabulary=None):
+        """
+        Saves features and vocabulary under key, then evicts least recently used entries.
+
+        The entry is written to a temporary folder first, so a failed save never leaves a partial entry.
+
+        :param key: string
+        :param features: Features
+        :param vocabulary: dictionary, column to sorted labels
+        :return: string, entry folder
+        """
+
+        entry_dir = f'{self.cache_dir}/{key}'
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+
+        if features.is_sparse:
+            sparse.save_npz(f'{temp_dir}/matrix.npz', sparse.csr_matrix(features.matrix))
+        else:
+            np.save(f'{temp_dir}/matrix.npy', features.matrix)
+        np.save(f'{temp_dir}/indexes.npy', np.asarray(features.indexes, dtype=str))
+
+        with open(f'{temp_dir}/meta.json', 'w') as file:
+            json.dump({'is_sparse': features.is_sparse,
+                       'columns': list(features.columns),
+                       'index_column': features.index_column,
+                       'vocabulary': vocabulary}, file)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(temp_dir, entry_dir)
+
+        self.evict()
+
+        return entry_dir
+
+    def evict(self):
+        """
+        Removes least recently used entries until there are at most max_entries taking at most max_bytes.
+
+        :return: list of evicted keys
+        """
+
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = f'{self.cache_dir}/{key}'
+            if key.startswith('.') or not os.path.isfile(f'{entry_dir}/meta.json'):
+                continue
+
+            size = sum(os.path.getsize(f'{entry_dir}/{file_name}') for file_name in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(f'{entry_dir}/meta.json'), key, size))
+
+        entries.sort(reverse=True)
+        evicted = []
+        kept_bytes = 0
+
+        for position, (_, key, size) in enumerate(entries):
+            kept_bytes += size
+            is_too_many = self.max_entries is not None and position >= self.max_entries
+            is_too_big = self.max_bytes is not None and kept_bytes > self.max_bytes
+
+            if evicted or is_too_many or is_too_big:
+                shutil.rmtree(f'{self.cache_dir}/{key}', ignore_errors=True)
+                evicted.append(key)
+
+        return evicted
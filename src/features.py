@@ -0,0 +1,325 @@
+from scipy import sparse
+
+import pandas as pd
+import numpy as np
+
+
+INTEGER_TYPES = ['boolean', 'tinyint', 'smallint', 'int', 'bigint']
+
+
+class Features(object):
+    """
+    Feature matrix collected to the driver, with one index per row and one name per column.
+
+    """
+
+    def __init__(self, indexes, matrix, columns, index_column='recipe_id'):
+        """
+        Checks that "indexes" and "columns" match the shape of "matrix" during initialization.
+
+        :param indexes: list or numpy array of strings, one per row of matrix
+        :param matrix: scipy sparse csr matrix or numpy array
+        :param columns: list of strings, one per column of matrix
+        :param index_column: string
+        """
+
+        self.indexes = np.asarray(indexes, dtype=object)
+        self.matrix = matrix
+        self.columns = list(columns)
+        self.index_column = index_column
+
+        self._check_shape()
+
+    def _check_shape(self):
+        """
+        Checks "indexes" and "columns" match the shape of "matrix".
+
+        :return:
+        """
+
+        assert self.matrix.shape == (len(self.indexes), len(self.columns)), \
+            f'"matrix" has shape {self.matrix.shape}, expected ({len(self.indexes)}, {len(self.columns)}).'
+
+    @property
+    def is_sparse(self):
+        """
+        Returns True if matrix is a scipy sparse matrix.
+
+        :return: boolean
+        """
+
+        return sparse.issparse(self.matrix)
+
+    @property
+    def density(self):
+        """
+        Returns share of non zero entries in matrix.
+
+        :return: float
+        """
+
+        size = self.matrix.shape[0] * self.matrix.shape[1]
+        if size == 0:
+            return 0.
+
+        non_zeros = self.matrix.nnz if self.is_sparse else np.count_nonzero(self.matrix)
+        return non_zeros / size
+
+    @classmethod
+    def from_pandas(cls, pd_df_features, index_column='recipe_id', is_sparse=True):
+        """
+        Creates features from a wide pandas data frame with the index in index_column and features in remaining columns.
+
+        :param pd_df_features: pandas data frame
+        :param index_column: string
+        :param is_sparse: boolean, store matrix as scipy sparse csr matrix
+        :return: Features
+        """
+
+        pd_df_no_index = pd_df_features.drop(columns=[index_column])
+        matrix = pd_df_no_index.values
+
+        if is_sparse:
+            matrix = sparse.csr_matrix(matrix)
+
+        return cls(indexes=pd_df_features[index_column].values,
+                   matrix=matrix,
+                   columns=pd_df_no_index.columns.tolist(),
+                   index_column=index_column)
+
+    @classmethod
+    def from_spark(cls, df_features, index_column='recipe_id', is_sparse=True, batch_size=10000, partition_rows=100000):
+        """
+        Creates features from a wide spark data frame with the index in index_column and features in remaining columns.
+
+        Only the positions and values of the non zero features of every row are sent to the driver, streamed one
+        partition at a time with toLocalIterator, and batch_size rows at a time are written into a preallocated matrix.
+        Partitions are coalesced to about partition_rows rows first, as every partition is fetched with its own job.
+        Integer and boolean features are stored as int8 if they fit (int64 otherwise), others as float64. Nulls are read
+        as 0, so they have to be checked on df_features beforehand.
+
+        :param df_features: spark data frame
+        :param index_column: string
+        :param is_sparse: boolean, store matrix as scipy sparse csr matrix
+        :param batch_size: int, number of rows written to the matrix at once
+        :param partition_rows: int, number of rows per streamed partition
+        :return: Features
+        """
+
+        import pyspark.sql.functions as f
+
+        columns = [col for col in df_features.columns if col != index_column]
+        types = dict(df_features.dtypes)
+        is_integer = all(types[col] in INTEGER_TYPES for col in columns)
+
+        value_type = 'BIGINT' if is_integer else 'DOUBLE'
+        values = [f"CAST(`{col.replace('`', '``')}` AS {value_type})" for col in columns]
+        positions_expression = ', '.join(f'IF({value} != 0, {position}, NULL)' for position, value in enumerate(values))
+        values_expression = ', '.join(f'IF({value} != 0, {value}, NULL)' for value in values)
+
+        df_non_zeros = df_features.select(
+            f.col(index_column).cast('string').alias('index'),
+            f.expr(f'FILTER(ARRAY({positions_expression}), position -> position IS NOT NULL)').alias('positions'),
+            f.expr(f'FILTER(ARRAY({values_expression}), value -> value IS NOT NULL)').alias('values'))
+
+        row_count = df_features.count()
+        partition_count = max(int(np.ceil(row_count / partition_rows)), 1)
+        if partition_count < df_non_zeros.rdd.getNumPartitions():
+            df_non_zeros = df_non_zeros.coalesce(partition_count)
+
+        shape = (row_count, len(columns))
+        builder = _MatrixBuilder(shape, dtype=np.int8 if is_integer else np.float64, is_sparse=is_sparse)
+
+        batch = []
+        for row in df_non_zeros.toLocalIterator():
+            batch.append(row)
+            if len(batch) == batch_size:
+                builder.add(batch)
+                batch = []
+        builder.add(batch)
+
+        assert builder.row_count == row_count, \
+            f'"df_features" returned {builder.row_count} rows, expected {row_count}. Persist it before collecting.'
+
+        return cls(indexes=builder.indexes,
+                   matrix=builder.build(),
+                   columns=columns,
+                   index_column=index_column)
+
+    @classmethod
+    def from_labels(cls, pd_df_labels, columns, index_column='recipe_id'):
+        """
+        Creates one hot features as a sparse csr matrix directly from label columns.
+
+        Every label of every column becomes a feature named column+'_'+label, labels are sorted per column.
+
+        :param pd_df_labels: pandas data frame
+        :param columns: list of strings, label columns to convert
+        :param index_column: string
+        :return: Features
+        """
+
+        row_count = pd_df_labels.shape[0]
+        feature_columns = []
+        codes = []
+        offset = 0
+
+        for col in columns:
+            labels = sorted(pd_df_labels[col].unique())
+            codes.append(pd.Categorical(pd_df_labels[col], categories=labels).codes.astype(np.int32) + offset)
+            feature_columns += [col+'_'+label for label in labels]
+            offset += len(labels)
+
+        if codes:
+            indices = np.column_stack(codes).ravel()
+        else:
+            indices = np.empty(0, dtype=np.int32)
+        indptr = np.arange(row_count + 1) * len(columns)
+        data = np.ones(len(indices), dtype=np.int8)
+
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(row_count, offset))
+
+        return cls(indexes=pd_df_labels[index_column].values,
+                   matrix=matrix,
+                   columns=feature_columns,
+                   index_column=index_column)
+
+    def null_columns(self):
+        """
+        Returns names of columns containing nulls.
+
+        :return: list of strings
+        """
+
+        if self.matrix.dtype.kind != 'f':
+            return []
+
+        if self.is_sparse:
+            matrix_coo = self.matrix.tocoo()
+            null_positions = np.unique(matrix_coo.col[np.isnan(matrix_coo.data)])
+        else:
+            null_positions = np.where(np.isnan(self.matrix).any(axis=0))[0]
+
+        return [self.columns[position] for position in null_positions]
+
+    def to_pandas(self):
+        """
+        Converts features to a wide pandas data frame with index_column first.
+
+        :return: pandas data frame
+        """
+
+        matrix = self.matrix.toarray() if self.is_sparse else self.matrix
+
+        pd_df_features = pd.DataFrame(matrix, columns=self.columns)
+        pd_df_features.insert(loc=0, column=self.index_column, value=self.indexes)
+
+        return pd_df_features
+
+    def to_pandas_blocks(self, block_size=1000):
+        """
+        Converts features to wide pandas data frames of block_size rows, so only one block of a sparse matrix is dense
+        at a time.
+
+        :param block_size: int
+        :return: generator of pandas data frames, as to_pandas
+        """
+
+        for start in range(0, max(self.matrix.shape[0], 1), block_size):
+            features_block = Features(indexes=self.indexes[start:start + block_size],
+                                      matrix=self.matrix[start:start + block_size],
+                                      columns=self.columns,
+                                      index_column=self.index_column)
+
+            yield features_block.to_pandas()
+
+
+class _MatrixBuilder(object):
+    """
+    Fills a preallocated dense matrix (or collects sparse coordinates) from batches of rows holding an index and the
+    positions and values of their non zero features, widening int8 to int64 when values do not fit.
+
+    """
+
+    def __init__(self, shape, dtype=np.int8, is_sparse=True):
+        """
+
+        :param shape: tuple, number of rows and columns
+        :param dtype: numpy dtype, np.int8 or np.float64
+        :param is_sparse: boolean
+        """
+
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.is_sparse = is_sparse
+        self.row_count = 0
+        self.indexes = np.empty(shape[0], dtype=object)
+        self._rows = []
+        self._positions = []
+        self._values = []
+        self._matrix = None if is_sparse else np.zeros(shape, dtype=self.dtype)
+
+    def add(self, batch):
+        """
+        Adds a batch of rows.
+
+        :param batch: list of rows with index, positions and values
+        :return:
+        """
+
+        if not batch:
+            return
+
+        assert self.row_count + len(batch) <= self.shape[0], 'More rows than expected.'
+
+        lengths = np.array([len(row[1]) for row in batch])
+        rows = np.repeat(np.arange(self.row_count, self.row_count + len(batch), dtype=np.int32), lengths)
+        positions = np.fromiter((position for row in batch for position in row[1]), dtype=np.int32,
+                                count=lengths.sum())
+        values = np.fromiter((value for row in batch for value in row[2]),
+                             dtype=np.float64 if self.dtype.kind == 'f' else np.int64, count=lengths.sum())
+
+        self.indexes[self.row_count:self.row_count + len(batch)] = [row[0] for row in batch]
+        self.row_count += len(batch)
+
+        if self.dtype == np.int8 and len(values) and (values.min() < -128 or values.max() > 127):
+            self._widen()
+
+        values = values.astype(self.dtype)
+
+        if self.is_sparse:
+            self._rows.append(rows)
+            self._positions.append(positions)
+            self._values.append(values)
+        else:
+            self._matrix[rows, positions] = values
+
+    def _widen(self):
+        """
+        Converts values added so far from int8 to int64.
+
+        :return:
+        """
+
+        self.dtype = np.dtype(np.int64)
+
+        if self.is_sparse:
+            self._values = [values.astype(self.dtype) for values in self._values]
+        else:
+            self._matrix = self._matrix.astype(self.dtype)
+
+    def build(self):
+        """
+        Returns the matrix.
+
+        :return: numpy array or scipy sparse csr matrix
+        """
+
+        if not self.is_sparse:
+            return self._matrix
+
+        rows = np.concatenate(self._rows) if self._rows else np.empty(0, dtype=np.int32)
+        positions = np.concatenate(self._positions) if self._positions else np.empty(0, dtype=np.int32)
+        values = np.concatenate(self._values) if self._values else np.empty(0, dtype=self.dtype)
+
+        return sparse.csr_matrix((values, (rows, positions)), shape=self.shape)
@@ -0,0 +1,259 @@
+from scipy import sparse
+
+from features import Features
+from similarity import Similarity
+from similarity import GRAM_SIMILARITY_TYPES
+from utils import read_table
+
+import pandas as pd
+import numpy as np
+
+
+class IncrementalSimilarity(object):
+    """
+    Class to refresh the long similarity scores of a previous run for added, removed and changed indexes only.
+
+    """
+
+    def __init__(self, features, previous_dir, index_column='recipe_id', similarity_type='cosine', top_k=None,
+                 block_size=1000, seed=None, output_format='csv'):
+        """
+        Loads features and long similarities of the previous run during initialization.
+
+        :param features: Features, current features
+        :param previous_dir: string, output folder of the previous run, e.g. "output/20210101_1200"
+        :param index_column: string
+        :param similarity_type: string, one of GRAM_SIMILARITY_TYPES, has to match the previous run
+        :param top_k: int, has to match the previous run
+        :param block_size: int, number of rows per similarity block
+        :param seed: int, seed of the random tie breaking between equal similarities
+        :param output_format: string, output format of the previous run, see utils.OUTPUT_FORMATS
+        """
+
+        self.features = features
+        self.previous_dir = previous_dir
+        self.index_column = index_column
+        self.top_k = top_k
+        self.output_format = output_format
+        self.changes = None
+
+        self.similarity = Similarity(df_features=features,
+                                     index_column=index_column,
+                                     similarity_type=similarity_type,
+                                     top_k=top_k,
+                                     block_size=block_size,
+                                     seed=seed)
+
+        self._check_similarity_type()
+
+        self.features_previous = self._load_previous_features()
+        self.pd_df_similarity_previous = self._load_previous_similarities()
+
+    @property
+    def precision(self):
+        """
+        Returns precision of the refreshed similarities.
+
+        :return: string
+        """
+
+        return self.similarity.precision
+
+    @property
+    def quantisation(self):
+        """
+        Returns quantisation of the refreshed similarities, None unless precision is "uint8".
+
+        :return: dictionary or None
+        """
+
+        return self.similarity.quantisation
+
+    def _check_similarity_type(self):
+        """
+        Checks similarity_type is symmetric and exact.
+
+        :return:
+        """
+
+        if self.similarity.similarity_type not in GRAM_SIMILARITY_TYPES:
+            raise ValueError('Unknown "similarity_type".')
+
+    def _load_previous_features(self):
+        """
+        Loads features of the previous run.
+
+        :return: Features
+        """
+
+        pd_df_features = read_table(f'{self.previous_dir}/features/features',
+                                    output_format=self.output_format,
+                                    dtype={self.index_column: str})
+
+        return Features.from_pandas(pd_df_features, index_column=self.index_column, is_sparse=True)
+
+    def _load_previous_similarities(self):
+        """
+        Loads long similarities of the previous run.
+
+        :return: pandas data frame
+        """
+
+        pd_df_similarity_long = read_table(f'{self.previous_dir}/similarities/similarities_long',
+                                           output_format=self.output_format,
+                                           dtype={self.index_column+'_1': str, self.index_column+'_2': str})
+
+        return pd_df_similarity_long
+
+    def detect_changes(self):
+        """
+        Detects added, removed and changed indexes between previous and current features.
+
+        Features are compared on the union of previous and current columns, so new labels count as changes.
+
+        :return: dictionary with lists of indexes under "added", "removed" and "changed"
+        """
+
+        columns = self.features.columns + [col for col in self.features_previous.columns
+                                           if col not in set(self.features.columns)]
+        mat_current = self._align_columns(self.features, columns)
+        mat_previous = self._align_columns(self.features_previous, columns)
+
+        positions_previous = {index: position for position, index in enumerate(self.features_previous.indexes)}
+        positions_current = {index: position for position, index in enumerate(self.features.indexes)}
+
+        common = [index for index in self.features.indexes if index in positions_previous]
+        mat_difference = mat_current[[positions_current[index] for index in common]] \
+            - mat_previous[[positions_previous[index] for index in common]]
+        mat_difference.eliminate_zeros()
+        is_changed = np.diff(mat_difference.indptr) > 0
+
+        self.changes = {
+            'added': [index for index in self.features.indexes if index not in positions_previous],
+            'removed': [index for index in self.features_previous.indexes if index not in positions_current],
+            'changed': [index for index, changed in zip(common, is_changed) if changed]
+        }
+
+        return self.changes
+
+    @staticmethod
+    def _align_columns(features, columns):
+        """
+        Maps the matrix of features onto columns, columns missing in features are zero.
+
+        :param features: Features
+        :param columns: list of strings, containing all columns of features
+        :return: scipy sparse csr matrix
+        """
+
+        column_positions = {col: position for position, col in enumerate(columns)}
+        mapping = np.array([column_positions[col] for col in features.columns], dtype=np.int64)
+        matrix = sparse.csr_matrix(features.matrix, dtype=np.float64)
+
+        return sparse.csr_matrix((matrix.data, mapping[matrix.indices], matrix.indptr),
+                                 shape=(matrix.shape[0], len(columns)))
+
+    def generate(self):
+        """
+        Generates long similarities for current features, recalculating only rows and columns affected by changes
+        and keeping all other scores of the previous run.
+
+        :return: None (wide is not refreshed), pandas data frame (long)
+        """
+
+        changes = self.detect_changes()
+        indexes = self.features.indexes
+        positions = {index: position for position, index in enumerate(indexes)}
+        affected = [positions[index] for index in changes['added'] + changes['changed']]
+        outdated = set(changes['removed'] + changes['changed'])
+
+        index_1 = self.index_column+'_1'
+        index_2 = self.index_column+'_2'
+        pd_df_kept = self.pd_df_similarity_previous.loc[~self.pd_df_similarity_previous[index_1].isin(outdated)]
+
+        if self.top_k is None:
+            pd_df_kept = pd_df_kept.loc[~pd_df_kept[index_2].isin(outdated)]
+            recalculated = affected
+        else:
+            lost_neighbour = pd_df_kept.loc[pd_df_kept[index_2].isin(outdated), index_1].unique()
+            pd_df_kept = pd_df_kept.loc[~pd_df_kept[index_1].isin(lost_neighbour)]
+            recalculated = affected + [positions[index] for index in lost_neighbour]
+
+        pd_df_recalculated, pd_df_affected_columns = self._recalculate(recalculated, affected)
+
+        pd_df_kept = pd_df_kept.drop(columns=['rank'])
+        pd_df_affected_columns = pd_df_affected_columns.loc[pd_df_affected_columns[index_1].isin(pd_df_kept[index_1])]
+        pd_df_similarity_long = self._rerank(pd.concat([pd_df_kept, pd_df_affected_columns], ignore_index=True))
+
+        pd_df_similarity_long = pd.concat([pd_df_similarity_long, pd_df_recalculated], ignore_index=True)\
+            .sort_values([index_1, 'rank'])\
+            .reset_index(drop=True)
+
+        return None, pd_df_similarity_long
+
+    def _recalculate(self, recalculated, affected):
+        """
+        Recalculates full rows for positions in recalculated, in blocks of block_size rows.
+
+        Also returns the transposed scores of affected rows, i.e. the affected columns of every other row.
+
+        :param recalculated: list of row positions, starting with the affected ones
+        :param affected: list of row positions
+        :return: pandas data frame (recalculated rows, ranked), pandas data frame (affected columns, not ranked)
+        """
+
+        indexes = self.features.indexes
+        matrix = self.features.matrix
+        affected_set = set(affected)
+        top_k = len(indexes) if self.top_k is None else min(self.top_k, len(indexes))
+        pd_df_rows = []
+        pd_df_columns = []
+
+        for start in range(0, len(recalculated), self.similarity.block_size):
+            rows = np.array(recalculated[start:start + self.similarity.block_size], dtype=np.int64)
+            mat_block = self.similarity._calculate_similarity(matrix[rows], matrix)
+            mat_order = self.similarity._rank_block(mat_block, top_k)
+
+            pd_df_rows.append(pd.DataFrame({
+                self.index_column+'_1': np.repeat(indexes[rows], top_k),
+                self.index_column+'_2': indexes[mat_order].ravel(),
+                'similarity': np.take_along_axis(mat_block, mat_order, axis=1).ravel(),
+                'rank': np.tile(np.arange(1, top_k + 1), len(rows))
+            }))
+
+            is_affected = np.array([row in affected_set for row in rows], dtype=bool)
+            if is_affected.any():
+                mat_affected = mat_block[is_affected]
+                pd_df_columns.append(pd.DataFrame({
+                    self.index_column+'_1': np.tile(indexes, mat_affected.shape[0]),
+                    self.index_column+'_2': np.repeat(indexes[rows[is_affected]], len(indexes)),
+                    'similarity': mat_affected.ravel()
+                }))
+
+        pd_df_empty = pd.DataFrame(columns=[self.index_column+'_1', self.index_column+'_2', 'similarity', 'rank'])
+        pd_df_recalculated = pd.concat(pd_df_rows, ignore_index=True) if pd_df_rows else pd_df_empty
+        pd_df_affected_columns = pd.concat(pd_df_columns, ignore_index=True) if pd_df_columns \
+            else pd_df_empty.drop(columns=['rank'])
+
+        return pd_df_recalculated, pd_df_affected_columns
+
+    def _rerank(self, pd_df_similarity_long):
+        """
+        Ranks long similarities partitioned by index_column+'_1' and keeps the top_k per index if set.
+
+        :param pd_df_similarity_long: pandas data frame without rank column
+        :return: pandas data frame
+        """
+
+        rows_1 = pd.factorize(pd_df_similarity_long[self.index_column+'_1'])[0]
+        similarities = pd_df_similarity_long['similarity'].values.astype(np.float64)
+
+        order, ranks = self.similarity._rank_pairs(rows_1, similarities)
+
+        pd_df_ranked = pd_df_similarity_long.iloc[order].reset_index(drop=True)
+        pd_df_ranked['rank'] = ranks
+
+        if self.top_k is not None:
+            pd_df_ranked = pd_df_ranked.loc[pd_df_ranked['rank'] <= self.top_k].reset_index(drop=True)
+
+        return pd_df_ranked
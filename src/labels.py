@@ -0,0 +1,11 @@
+PREPROCESS_VERSION = 1
+
+DEDUPE_MODES = ['random', 'first']
+
+COUNTRY_LABELS = {
+    'United States of America (USA)': 'United States',
+    'Israel and the Occupied Territories': 'Israel',
+    'Korea, Republic of (South Korea)': 'South Korea',
+    'Korea, Democratic Republic of (North Korea)': 'South Korea',
+    'Great Britain': 'United Kingdom'
+}
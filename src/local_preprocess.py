@@ -0,0 +1,278 @@
+from features import Features
+from metrics import measure
+from labels import COUNTRY_LABELS
+from labels import DEDUPE_MODES
+
+import pandas as pd
+import numpy as np
+
+
+LOCAL_MAX_ROWS = 50000
+
+
+def read_labels(path):
+    """
+    Reads a label csv file with pandas as spark.read.csv(path, header=True) does: all columns as strings and only
+    empty fields as nulls, so labels such as "#N/A" are kept.
+
+    :param path: string
+    :return: pandas data frame
+    """
+
+    return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''], encoding='utf-8-sig')
+
+
+def count_rows(path):
+    """
+    Counts the data rows of a csv file without parsing it, fields with line breaks are counted as several rows.
+
+    :param path: string
+    :return: int
+    """
+
+    line_count = 0
+    last_chunk = b''
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 ** 2), b''):
+            line_count += chunk.count(b'\n')
+            last_chunk = chunk
+
+    if last_chunk and not last_chunk.endswith(b'\n'):
+        line_count += 1
+
+    return max(line_count - 1, 0)
+
+
+class LocalPreprocess(object):
+    """
+    Prepare data for similarity calculation with pandas, without starting spark.
+
+    Performs the same checks and steps as Preprocess with the same output, apart from which duplicate of an index is
+    kept. Every label normalisation is vectorised over the unique labels of a column.
+
+    """
+
+    def __init__(self, pd_df_labels, columns, index_column='recipe_id', country_labels=None,
+                 range_columns=('prep_time',), na_label='#n/a', metrics=None, dedupe='random', seed=None,
+                 check_duplicates=False):
+        """
+        Performs the same assumption checks/manipulations as Preprocess during initialization.
+
+        :param pd_df_labels: pandas data frame of strings, e.g. from read_labels
+        :param columns: list of string, columns to use for similarity calculation
+        :param index_column: string
+        :param country_labels: dictionary, country label to rectified label, defaults to COUNTRY_LABELS
+        :param range_columns: list of strings, columns with ranges such as "55-60" to convert to upper bound
+        :param na_label: string, label converted to column_name+not_applicable
+        :param metrics: Metrics, records the "check_nulls", "check_duplicates", "normalise_labels" and "one_hot" stages
+        :param dedupe: string, "random" keeps a random row per index, "first" the first one
+        :param seed: int, seed of the random choice between duplicate indexes
+        :param check_duplicates: boolean, count duplicate indexes first and skip the dedupe if there are none
+        """
+
+        self.pd_df_labels = pd_df_labels
+        self.columns = columns
+        self.index_column = index_column
+        self.country_labels = COUNTRY_LABELS if country_labels is None else country_labels
+        self.range_columns = list(range_columns)
+        self.na_label = na_label
+        self.vocabulary = None
+        self.null_report = None
+        self.metrics = metrics
+        self.dedupe = dedupe
+        self.seed = seed
+        self.check_duplicates = check_duplicates
+        self.duplicate_count = None
+
+        self._check_is_pandas_data_frame()
+        self._check_is_list()
+        self._check_dedupe()
+        self._convert_column_argument()
+        with measure(self.metrics, 'check_nulls'):
+            self._create_null_report()
+        self._check_nulls_in_index_column()
+        if self.check_duplicates:
+            with measure(self.metrics, 'check_duplicates'):
+                self._count_duplicate_indexes()
+        if self.duplicate_count != 0:
+            self._remove_duplicate_indexes()
+        self._check_nulls_in_attribute_columns()
+
+    def _check_is_pandas_data_frame(self):
+        """
+        Checks if pd_df_labels is a pandas data frame.
+
+        :return:
+        """
+
+        assert isinstance(self.pd_df_labels, pd.DataFrame), '"pd_df_labels" is not a pandas data frame.'
+
+    def _check_is_list(self):
+        """
+        Checks "columns" is a list.
+
+        :return:
+        """
+
+        if self.columns != 'all':
+            assert isinstance(self.columns, list), '"columns" has to be a list.'
+
+    def _convert_column_argument(self):
+        """
+        Converts column argument to list of columns names in pd_df_labels (without index_column).
+
+        :return:
+        """
+
+        if self.columns == 'all':
+            self.columns = [col for col in self.pd_df_labels.columns if col != self.index_column]
+
+    def _create_null_report(self):
+        """
+        Counts nulls of every column in pd_df_labels, before duplicates are removed.
+
+        :return:
+        """
+
+        self.null_report = self.pd_df_labels.isnull().sum().astype(int).to_dict()
+
+    def _check_nulls_in_index_column(self):
+        """
+        Checks if column "index_column" contains nulls.
+
+        :return:
+        """
+
+        null_count = self.null_report[self.index_column]
+        assert null_count == 0, \
+            f'There are {null_count} null(s) in the "index_column" column in "df_labels" when no nulls are allowed.'
+
+    def _check_dedupe(self):
+        """
+        Checks "dedupe" is a known mode.
+
+        :return:
+        """
+
+        assert self.dedupe in DEDUPE_MODES, f'"dedupe" has to be one of {DEDUPE_MODES}.'
+
+    def _count_duplicate_indexes(self):
+        """
+        Counts rows with an index already held by another row.
+
+        :return:
+        """
+
+        self.duplicate_count = int(self.pd_df_labels[self.index_column].duplicated().sum())
+
+    def _remove_duplicate_indexes(self):
+        """
+        Removes duplicate recipes by selecting one if duplicated, randomly or the first one depending on dedupe,
+        keeping the order of rows.
+
+        :return:
+        """
+
+        if self.dedupe == 'first':
+            self.pd_df_labels = self.pd_df_labels.drop_duplicates(subset=[self.index_column])
+            return
+
+        self.pd_df_labels = self.pd_df_labels\
+            .sample(frac=1, random_state=np.random.RandomState(self.seed))\
+            .drop_duplicates(subset=[self.index_column])\
+            .sort_index()
+
+    def _check_nulls_in_attribute_columns(self):
+        """
+        Checks if nulls in attribute columns.
+
+        :return:
+        """
+
+        columns_to_check = [col for col in self.pd_df_labels.columns if col != self.index_column]
+
+        for col in columns_to_check:
+            assert self.null_report[col] == 0, f'There are null(s) in "{col}".'
+
+    def preprocess(self):
+        """
+        Preprocess recipes data into a wide one hot data frame, as Preprocess.preprocess collected with toPandas.
+
+        :return: pandas data frame
+        """
+
+        with measure(self.metrics, 'normalise_labels'):
+            pd_df_normalised = self._normalise_labels()
+        with measure(self.metrics, 'one_hot'):
+            features = self._convert_to_one_hot(pd_df_normalised)
+            pd_df_one_hot = pd.DataFrame(features.matrix.toarray().astype(np.int32), columns=features.columns)
+            pd_df_one_hot.insert(loc=0, column=self.index_column, value=features.indexes)
+
+        return pd_df_one_hot
+
+    def preprocess_sparse(self):
+        """
+        Preprocess recipes data into a sparse one hot matrix, as Preprocess.preprocess_sparse.
+
+        :return: Features
+        """
+
+        with measure(self.metrics, 'normalise_labels'):
+            pd_df_normalised = self._normalise_labels()
+        with measure(self.metrics, 'one_hot'):
+            features = self._convert_to_one_hot(pd_df_normalised)
+
+        return features
+
+    def _normalise_labels(self):
+        """
+        Normalises label columns in the same order of steps as Preprocess._normalise_label_expression.
+
+        :return: pandas data frame
+        """
+
+        pd_df_normalised = self.pd_df_labels[[self.index_column] + self.columns].reset_index(drop=True)
+
+        for col in self.columns:
+            codes, labels = pd.factorize(pd_df_normalised[col])
+            labels = self._normalise_label_column(pd.Series(labels, dtype=object), col)
+            pd_df_normalised[col] = labels.values[codes]
+
+        return pd_df_normalised
+
+    def _normalise_label_column(self, labels, col):
+        """
+        Rectifies country labels, replaces whitespaces with underscores, converts to lower case, converts "na_label"
+        and converts ranges of labels of column col.
+
+        :param labels: pandas series of strings
+        :param col: string
+        :return: pandas series of strings
+        """
+
+        if 'country' in col and self.country_labels:
+            labels = labels.map(self.country_labels).fillna(labels)
+
+        labels = labels.str.replace(' ', '_', regex=False)
+        labels = labels.str.lower()
+        labels = labels.str.replace(self.na_label, col+'_not_applicable', regex=False)
+
+        if col in self.range_columns:
+            labels = labels.str.split('-').str[-1]
+
+        return labels
+
+    def _convert_to_one_hot(self, pd_df_normalised):
+        """
+        Converts normalised labels to sparse one hot features and sets the vocabulary.
+
+        :param pd_df_normalised: pandas data frame
+        :return: Features
+        """
+
+        self.vocabulary = {col: sorted(pd_df_normalised[col].unique()) for col in self.columns}
+
+        return Features.from_labels(pd_df_labels=pd_df_normalised,
+                                    columns=self.columns,
+                                    index_column=self.index_column)
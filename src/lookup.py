@@ -0,0 +1,190 @@
+from utils import read_table
+from utils import decode_ids
+
+import pandas as pd
+import numpy as np
+
+import os
+import threading
+
+
+class NeighbourIndex(object):
+    """
+    Top N neighbour lookup over the long similarities of a run.
+
+    The long similarities are converted once into a top K index in "{run_dir}/index" (ids, neighbour rows and
+    similarities as .npy files), which is memory mapped when opened.
+
+    """
+
+    def __init__(self, run_dir, index_column='recipe_id', output_format='csv'):
+        """
+        Builds the index of run_dir if missing and opens it.
+
+        :param run_dir: string, output folder of a run, e.g. "output/20210101_1200"
+        :param index_column: string
+        :param output_format: string, output format of the run, see utils.OUTPUT_FORMATS
+        """
+
+        self.run_dir = run_dir
+        self.index_column = index_column
+        self.output_format = output_format
+
+        if not os.path.isfile(f'{run_dir}/index/neighbours.npy'):
+            self.build(run_dir, index_column=index_column, output_format=output_format)
+
+        self.ids = np.load(f'{run_dir}/index/ids.npy', mmap_mode='r')
+        self.neighbours = np.load(f'{run_dir}/index/neighbours.npy', mmap_mode='r')
+        self.similarities = np.load(f'{run_dir}/index/similarities.npy', mmap_mode='r')
+        self.rows = {index: row for row, index in enumerate(self.ids.tolist())}
+
+    @staticmethod
+    def build(run_dir, index_column='recipe_id', output_format='csv'):
+        """
+        Builds the top K index of a run from its long similarities, K being the most neighbours of any index.
+
+        Rows with fewer neighbours are padded with -1. uint8 similarities are decoded with the scale and offset in
+        parameters.csv, and encoded ids with the id table in similarities/ids if the run has one.
+
+        :param run_dir: string
+        :param index_column: string
+        :param output_format: string
+        :return:
+        """
+
+        ids_path = f'{run_dir}/similarities/ids'
+        if os.path.exists(f'{ids_path}.{output_format}'):
+            pd_df_similarity_long = decode_ids(read_table(f'{run_dir}/similarities/similarities_long',
+                                                          output_format=output_format),
+                                               read_table(ids_path, output_format=output_format,
+                                                          dtype={index_column: str}),
+                                               index_column=index_column)
+        else:
+            pd_df_similarity_long = read_table(f'{run_dir}/similarities/similarities_long',
+                                               output_format=output_format,
+                                               dtype={index_column+'_1': str, index_column+'_2': str})
+        pd_df_similarity_long = pd_df_similarity_long.sort_values([index_column+'_1', 'rank'])
+
+        similarities = pd_df_similarity_long['similarity'].values.astype(np.float32)
+        if os.path.isfile(f'{run_dir}/parameters/parameters.csv'):
+            pd_df_parameters = pd.read_csv(f'{run_dir}/parameters/parameters.csv')
+            if 'precision' in pd_df_parameters.columns and pd_df_parameters['precision'].values[0] == 'uint8':
+                similarities = similarities * np.float32(pd_df_parameters['similarity_scale'].values[0]) \
+                    + np.float32(pd_df_parameters['similarity_offset'].values[0])
+
+        codes, ids = pd.factorize(pd.concat([pd_df_similarity_long[index_column+'_1'],
+                                             pd_df_similarity_long[index_column+'_2']]))
+        codes_1 = codes[:pd_df_similarity_long.shape[0]]
+        codes_2 = codes[pd_df_similarity_long.shape[0]:]
+
+        row_starts = np.flatnonzero(np.r_[True, codes_1[1:] != codes_1[:-1]])
+        positions = np.arange(len(codes_1)) - np.repeat(row_starts, np.diff(np.r_[row_starts, len(codes_1)]))
+        top_k = positions.max() + 1 if len(positions) else 0
+
+        mat_neighbours = np.full((len(ids), top_k), -1, dtype=np.int32)
+        mat_similarities = np.full((len(ids), top_k), np.nan, dtype=np.float32)
+        mat_neighbours[codes_1, positions] = codes_2
+        mat_similarities[codes_1, positions] = similarities
+
+        os.makedirs(f'{run_dir}/index', exist_ok=True)
+        np.save(f'{run_dir}/index/ids.npy', np.asarray(ids, dtype=str))
+        np.save(f'{run_dir}/index/similarities.npy', mat_similarities)
+        np.save(f'{run_dir}/index/neighbours.npy', mat_neighbours)
+
+    def query(self, index, n=10, include_self=False):
+        """
+        Returns the top n neighbours of an index, best first.
+
+        :param index: string
+        :param n: int
+        :param include_self: boolean
+        :return: list of (neighbour index, similarity) tuples, None if index is unknown
+        """
+
+        row = self.rows.get(index)
+        if row is None:
+            return None
+
+        neighbours = self.neighbours[row, :n + 1]
+        similarities = self.similarities[row, :n + 1]
+        is_kept = neighbours >= 0
+        if not include_self:
+            is_kept &= neighbours != row
+
+        return [(str(self.ids[neighbour]), float(similarity))
+                for neighbour, similarity in zip(neighbours[is_kept][:n], similarities[is_kept][:n])]
+
+    def query_batch(self, indexes, n=10, include_self=False):
+        """
+        Returns the top n neighbours of several indexes.
+
+        :param indexes: list of strings
+        :param n: int
+        :param include_self: boolean
+        :return: dictionary, index to list of (neighbour index, similarity) tuples or None
+        """
+
+        return {index: self.query(index, n=n, include_self=include_self) for index in indexes}
+
+
+class NeighbourService(object):
+    """
+    Holds the neighbour index of one run and swaps it for the index of another run without interrupting queries.
+
+    """
+
+    def __init__(self, run_dir, index_column='recipe_id', output_format='csv'):
+        """
+
+        :param run_dir: string
+        :param index_column: string
+        :param output_format: string
+        """
+
+        self.index_column = index_column
+        self.output_format = output_format
+        self.index = NeighbourIndex(run_dir, index_column=index_column, output_format=output_format)
+        self._lock = threading.Lock()
+
+    def reload(self, run_dir):
+        """
+        Opens the index of run_dir and swaps it in once ready, queries keep using the previous index until then.
+
+        :param run_dir: string
+        :return:
+        """
+
+        with self._lock:
+            self.index = NeighbourIndex(run_dir, index_column=self.index_column, output_format=self.output_format)
+
+    def query(self, index, n=10, include_self=False):
+        """
+        See NeighbourIndex.query.
+
+        """
+
+        return self.index.query(index, n=n, include_self=include_self)
+
+    def query_batch(self, indexes, n=10, include_self=False):
+        """
+        See NeighbourIndex.query_batch.
+
+        """
+
+        return self.index.query_batch(indexes, n=n, include_self=include_self)
+
+
+def find_latest_run(output_dir='output'):
+    """
+    Returns the folder of the latest complete run in output_dir, i.e. with parameters/parameters.csv, which main.py
+    writes after the similarities.
+
+    :param output_dir: string
+    :return: string
+    """
+
+    runs = sorted(run for run in os.listdir(output_dir)
+                  if os.path.isfile(f'{output_dir}/{run}/parameters/parameters.csv'))
+    assert runs, f'There are no complete runs in "{output_dir}".'
+
+    return f'{output_dir}/{runs[-1]}'
@@ -0,0 +1,201 @@
+from scipy import sparse
+
+import pandas as pd
+import numpy as np
+
+import time
+
+
+class MinHashLSH(object):
+    """
+    MinHash locality sensitive hashing to find candidate pairs of rows with high jaccard similarity.
+
+    Signatures of num_bands*rows_per_band hashes are split in num_bands bands, rows sharing all hashes of at least one
+    band become candidate pairs. Pairs with jaccard similarity s are found with probability
+    1-(1-s^rows_per_band)^num_bands.
+
+    """
+
+    PRIME = 2147483647
+
+    def __init__(self, num_bands=20, rows_per_band=5, seed=None):
+        """
+
+        :param num_bands: int, more bands find more pairs with low similarity (higher recall, more candidates)
+        :param rows_per_band: int, more rows per band find fewer pairs with low similarity (fewer candidates)
+        :param seed: int, seed of the hash functions
+        """
+
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.seed = seed
+
+        random_state = np.random.RandomState(seed)
+        self._hash_a = random_state.randint(1, self.PRIME, size=num_bands * rows_per_band).astype(np.int64)
+        self._hash_b = random_state.randint(0, self.PRIME, size=num_bands * rows_per_band).astype(np.int64)
+
+    @property
+    def threshold(self):
+        """
+        Returns the jaccard similarity at which pairs are found with probability of about one half.
+
+        :return: float
+        """
+
+        return (1 / self.num_bands) ** (1 / self.rows_per_band)
+
+    def signatures(self, matrix):
+        """
+        Calculates minhash signatures of the non zero columns of every row.
+
+        Rows without non zero columns get a signature of PRIME.
+
+        :param matrix: scipy sparse csr matrix or numpy array
+        :return: numpy array of shape (rows, num_bands*rows_per_band)
+        """
+
+        matrix = sparse.csr_matrix(matrix)
+        matrix.eliminate_zeros()
+
+        mat_signatures = np.full((matrix.shape[0], len(self._hash_a)), self.PRIME, dtype=np.int64)
+        is_not_empty = np.diff(matrix.indptr) > 0
+        row_starts = matrix.indptr[:-1][is_not_empty]
+        indices = matrix.indices.astype(np.int64)
+
+        if not is_not_empty.any():
+            return mat_signatures
+
+        for position, (hash_a, hash_b) in enumerate(zip(self._hash_a, self._hash_b)):
+            hashes = (hash_a * indices + hash_b) % self.PRIME
+            mat_signatures[is_not_empty, position] = np.minimum.reduceat(hashes, row_starts)
+
+        return mat_signatures
+
+    def candidate_pairs(self, matrix):
+        """
+        Finds pairs of rows sharing all hashes of at least one band, each pair once with row_1 < row_2.
+
+        Pairs are deduplicated after every band, so memory holds the unique pairs found so far plus the pairs of a
+        single band, even when identical rows share a bucket in every band.
+
+        :param matrix: scipy sparse csr matrix or numpy array
+        :return: numpy array of row_1 positions, numpy array of row_2 positions
+        """
+
+        mat_signatures = self.signatures(matrix)
+        is_not_empty = mat_signatures[:, 0] != self.PRIME
+        row_positions = np.where(is_not_empty)[0]
+        mat_signatures = mat_signatures[is_not_empty]
+        pair_keys = np.empty(0, dtype=np.int64)
+
+        for band in range(self.num_bands):
+            mat_band = mat_signatures[:, band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            _, buckets = np.unique(mat_band, axis=0, return_inverse=True)
+            buckets = buckets.ravel()
+
+            order = np.argsort(buckets, kind='stable')
+            bucket_starts = np.flatnonzero(np.r_[True, np.diff(buckets[order]) != 0])
+            bucket_sizes = np.diff(np.r_[bucket_starts, len(order)])
+
+            band_keys = []
+            for start, size in zip(bucket_starts[bucket_sizes > 1], bucket_sizes[bucket_sizes > 1]):
+                members = np.sort(row_positions[order[start:start + size]]).astype(np.int64)
+                positions_1, positions_2 = np.triu_indices(size, 1)
+                band_keys.append(members[positions_1] * matrix.shape[0] + members[positions_2])
+
+            if band_keys:
+                pair_keys = np.union1d(pair_keys, np.concatenate(band_keys))
+
+        return pair_keys // matrix.shape[0], pair_keys % matrix.shape[0]
+
+    def evaluate(self, matrix, sample_size=1000, similarity_threshold=0.5):
+        """
+        Compares candidate pairs against exact jaccard similarities of a sample of rows.
+
+        Recall is the share of pairs with exact similarity of at least similarity_threshold that are candidates. Exact
+        seconds are extrapolated from the sample to all rows.
+
+        :param matrix: scipy sparse csr matrix or numpy array
+        :param sample_size: int, number of rows to compare against all rows
+        :param similarity_threshold: float
+        :return: pandas data frame with one row
+        """
+
+        matrix = sparse.csr_matrix(matrix)
+        row_count = matrix.shape[0]
+        sample = np.sort(np.random.RandomState(self.seed).choice(row_count, min(sample_size, row_count), replace=False))
+
+        start = time.time()
+        rows_1, rows_2 = self.candidate_pairs(matrix)
+        lsh_seconds = time.time() - start
+
+        start = time.time()
+        mat_jaccard = jaccard_similarity(matrix[sample], matrix)
+        exact_seconds = (time.time() - start) * row_count / max(len(sample), 1)
+
+        mat_jaccard[np.arange(len(sample)), sample] = 0
+        sample_rows, columns = np.where(mat_jaccard >= similarity_threshold)
+        true_keys = sample[sample_rows] * row_count + columns
+
+        candidate_keys = np.concatenate([rows_1 * row_count + rows_2, rows_2 * row_count + rows_1])
+        found = np.isin(true_keys, candidate_keys).sum()
+        recall = found / len(true_keys) if len(true_keys) else 1.
+
+        pd_df_report = pd.DataFrame([{
+            'num_bands': self.num_bands,
+            'rows_per_band': self.rows_per_band,
+            'lsh_threshold': self.threshold,
+            'similarity_threshold': similarity_threshold,
+            'sample_size': len(sample),
+            'recall': recall,
+            'candidate_pairs': len(rows_1),
+            'all_pairs': row_count * (row_count - 1) // 2,
+            'lsh_seconds': lsh_seconds,
+            'exact_seconds': exact_seconds
+        }])
+
+        return pd_df_report
+
+
+def jaccard_similarity(matrix, matrix_other):
+    """
+    Calculates jaccard similarities between the non zero columns of rows of matrix and rows of matrix_other.
+
+    Similarity of two empty rows is 0.
+
+    :param matrix: scipy sparse csr matrix or numpy array
+    :param matrix_other: scipy sparse csr matrix or numpy array
+    :return: numpy array
+    """
+
+    matrix = (sparse.csr_matrix(matrix) != 0).astype(np.float64)
+    matrix_other = (sparse.csr_matrix(matrix_other) != 0).astype(np.float64)
+
+    intersections = (matrix @ matrix_other.T).toarray()
+    unions = np.asarray(matrix.sum(axis=1)) + np.asarray(matrix_other.sum(axis=1)).T - intersections
+
+    return np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+
+def jaccard_similarity_pairs(matrix, rows_1, rows_2, block_size=100000):
+    """
+    Calculates jaccard similarities of the non zero columns of pairs of rows of matrix.
+
+    :param matrix: scipy sparse csr matrix or numpy array
+    :param rows_1: numpy array of row positions
+    :param rows_2: numpy array of row positions
+    :param block_size: int, number of pairs per block
+    :return: numpy array
+    """
+
+    matrix = (sparse.csr_matrix(matrix) != 0).astype(np.float64)
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    similarities = np.zeros(len(rows_1))
+
+    for start in range(0, len(rows_1), block_size):
+        stop = min(start + block_size, len(rows_1))
+        intersections = np.asarray(matrix[rows_1[start:stop]].multiply(matrix[rows_2[start:stop]]).sum(axis=1)).ravel()
+        unions = sizes[rows_1[start:stop]] + sizes[rows_2[start:stop]] - intersections
+        similarities[start:stop] = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+    return similarities
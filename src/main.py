@@ -1,55 +1,286 @@
-from spark_utils import create_spark_session
-
-from preprocess import Preprocess
 from similarity import Similarity
+from incremental import IncrementalSimilarity
+from features import Features
+from metrics import Metrics
+from planner import plan_memory
+from cache import FeatureCache
+from attribute_gram import AttributeGrams
+from local_preprocess import LocalPreprocess
+from local_preprocess import read_labels
+from local_preprocess import count_rows
+from local_preprocess import LOCAL_MAX_ROWS
 from utils import create_timestamp
 from utils import create_parameters_table
+from utils import convert_long_types
+from utils import create_id_table
+from utils import write_table
+from utils import write_blocks
+from utils import BlockWriter
+
+import pandas as pd
 
+import logging
 import os
 import sys
 
 
-spark = create_spark_session('generate_similarities')
-
 file_name = sys.argv[1]
 
-df_labels = spark.read.csv(f'data/{file_name}', header=True)
-
 COLUMNS = 'all'
 INDEX_COLUMN = sys.argv[2]
 SIMILARITY_TYPE = 'cosine'
+TOP_K = None
+IS_SPARSE = False
+DEDUPE = 'random'
+DEDUPE_SEED = None
+CHECK_DUPLICATES = True
+BACKEND = 'pandas'
+IS_LOCAL = None
+PREVIOUS_RUN = None
+OUTPUT_FORMAT = 'csv'
+PARTITION_LONG = False
+STREAM_LONG = False
+PRECISION = None
+ENCODE_IDS = False
+LOG_METRICS = False
+TRACE_MEMORY = False
+MAX_MEMORY = None
+BLOCK_SIZE = 1000
+CACHE_DIR = None
+CACHE_MAX_ENTRIES = 10
+STORE_ATTRIBUTE_GRAMS = False
+ATTRIBUTE_GRAMS_MAX_SIZE = None
+N_JOBS = 1
+BLAS_THREADS = 1
+
+if IS_LOCAL is None:
+    IS_LOCAL = BACKEND == 'pandas' and count_rows(f'data/{file_name}') <= LOCAL_MAX_ROWS
+assert not (IS_LOCAL and BACKEND == 'spark'), 'The spark backend can not run with "IS_LOCAL".'
+assert not (ENCODE_IDS and (BACKEND != 'pandas' or PREVIOUS_RUN is not None)), \
+    '"ENCODE_IDS" needs the pandas backend without "PREVIOUS_RUN".'
+assert not (BACKEND == 'spark' and IS_SPARSE), 'The spark backend can not run with "IS_SPARSE".'
+assert not (BACKEND == 'spark' and OUTPUT_FORMAT == 'arrow'), 'The spark backend can not write "OUTPUT_FORMAT" arrow.'
+
+spark = None
+if not IS_LOCAL:
+    from spark_utils import create_spark_session
+    from preprocess import Preprocess
+
+    spark = create_spark_session('generate_similarities')
 
 etl_created = create_timestamp()
 
-preprocessor = Preprocess(df_labels=df_labels,
-                          columns=COLUMNS,
-                          index_column=INDEX_COLUMN)
-df_recipe_features = preprocessor.preprocess()
-pd_df_recipe_features = df_recipe_features.toPandas()
+if LOG_METRICS:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+metrics = Metrics(spark=spark, trace_memory=TRACE_MEMORY, logger=logging.getLogger('metrics') if LOG_METRICS else None)
+
+feature_cache = None
+cached_features = None
+if CACHE_DIR is not None and BACKEND == 'pandas':
+    feature_cache = FeatureCache(cache_dir=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES)
+    with metrics.stage('load_cache'):
+        cache_key = feature_cache.create_key(f'data/{file_name}',
+                                             columns=COLUMNS,
+                                             index_column=INDEX_COLUMN,
+                                             is_sparse=IS_SPARSE,
+                                             dedupe=DEDUPE,
+                                             dedupe_seed=DEDUPE_SEED)
+        cached_features = feature_cache.load(cache_key)
+
+recipe_features = None
+if cached_features is not None:
+    recipe_features, vocabulary = cached_features
+elif IS_LOCAL:
+    with metrics.stage('read'):
+        pd_df_labels = read_labels(f'data/{file_name}')
+
+    preprocessor = LocalPreprocess(pd_df_labels=pd_df_labels,
+                                   columns=COLUMNS,
+                                   index_column=INDEX_COLUMN,
+                                   metrics=metrics,
+                                   dedupe=DEDUPE,
+                                   seed=DEDUPE_SEED,
+                                   check_duplicates=CHECK_DUPLICATES)
+    if IS_SPARSE:
+        recipe_features = preprocessor.preprocess_sparse()
+    else:
+        recipe_features = Features.from_pandas(preprocessor.preprocess(), index_column=INDEX_COLUMN, is_sparse=False)
+    vocabulary = preprocessor.vocabulary
+else:
+    with metrics.stage('read'):
+        df_labels = spark.read.csv(f'data/{file_name}', header=True)
+
+    preprocessor = Preprocess(df_labels=df_labels,
+                              columns=COLUMNS,
+                              index_column=INDEX_COLUMN,
+                              metrics=metrics,
+                              dedupe=DEDUPE,
+                              seed=DEDUPE_SEED,
+                              check_duplicates=CHECK_DUPLICATES)
+    if IS_SPARSE:
+        recipe_features = preprocessor.preprocess_sparse()
+    else:
+        df_recipe_features = preprocessor.preprocess()
+    vocabulary = preprocessor.vocabulary
+
+if MAX_MEMORY is not None and BACKEND == 'pandas':
+    with metrics.stage('plan'):
+        if recipe_features is not None:
+            row_count, feature_count = recipe_features.matrix.shape
+        else:
+            row_count, feature_count = df_recipe_features.count(), len(df_recipe_features.columns) - 1
+        memory_plan = plan_memory(max_memory=MAX_MEMORY,
+                                  row_count=row_count,
+                                  feature_count=feature_count,
+                                  top_k=TOP_K,
+                                  precision=PRECISION,
+                                  block_size=BLOCK_SIZE,
+                                  is_sparse=IS_SPARSE,
+                                  nnz_per_row=len(vocabulary),
+                                  similarity_type_count=len(SIMILARITY_TYPE) if isinstance(SIMILARITY_TYPE, list)
+                                  else 1)
+    PRECISION = memory_plan['precision']
+    BLOCK_SIZE = memory_plan['block_size']
+    STREAM_LONG = STREAM_LONG or memory_plan['strategy'] == 'streaming'
+
+if PRECISION is None:
+    PRECISION = 'float64'
+
+if recipe_features is None:
+    with metrics.stage('collect'):
+        recipe_features = Features.from_spark(df_recipe_features, index_column=INDEX_COLUMN, is_sparse=False)
+    if BACKEND != 'spark':
+        df_recipe_features.unpersist()
+
+if feature_cache is not None and cached_features is None:
+    with metrics.stage('save_cache'):
+        feature_cache.save(cache_key, recipe_features, vocabulary)
+
 features_dir = f'output/{etl_created}/features'
 os.makedirs(features_dir)
-pd_df_recipe_features.to_csv(f'{features_dir}/features.csv', index=False)
+with metrics.stage('write_features'):
+    if recipe_features.is_sparse:
+        write_blocks(recipe_features.to_pandas_blocks(block_size=BLOCK_SIZE), f'{features_dir}/features',
+                     output_format=OUTPUT_FORMAT)
+    else:
+        write_table(recipe_features.to_pandas(), f'{features_dir}/features', output_format=OUTPUT_FORMAT)
 
+if STORE_ATTRIBUTE_GRAMS:
+    with metrics.stage('attribute_grams'):
+        AttributeGrams.build(recipe_features, vocabulary, f'output/{etl_created}/grams', block_size=BLOCK_SIZE,
+                             max_bytes=ATTRIBUTE_GRAMS_MAX_SIZE)
 
-similarity = Similarity(df_features=df_recipe_features,
-                        index_column=INDEX_COLUMN,
-                        similarity_type=SIMILARITY_TYPE)
-similarities = similarity.generate()
-pd_df_similarities_wide = similarities[0]
-pd_df_similarities_long = similarities[1]
 
 similarities_dir = f'output/{etl_created}/similarities'
 os.makedirs(similarities_dir)
-pd_df_similarities_wide.to_csv(f'{similarities_dir}/similarities_wide.csv', index=True)
-pd_df_similarities_long.to_csv(f'{similarities_dir}/similarities_long.csv', index=False)
+if isinstance(SIMILARITY_TYPE, list):
+    similarity_dirs = {similarity_type: f'{similarities_dir}/{similarity_type}' for similarity_type in SIMILARITY_TYPE}
+    for similarity_dir in similarity_dirs.values():
+        os.makedirs(similarity_dir)
+else:
+    similarity_dirs = {SIMILARITY_TYPE: similarities_dir}
+long_partition_cols = [INDEX_COLUMN+'_1'] if PARTITION_LONG else None
+
+if ENCODE_IDS:
+    with metrics.stage('write_ids'):
+        write_table(create_id_table(recipe_features.indexes, INDEX_COLUMN), f'{similarities_dir}/ids',
+                    output_format=OUTPUT_FORMAT)
+
+if PREVIOUS_RUN is not None:
+    similarity = IncrementalSimilarity(features=recipe_features,
+                                       previous_dir=f'output/{PREVIOUS_RUN}',
+                                       index_column=INDEX_COLUMN,
+                                       similarity_type=SIMILARITY_TYPE,
+                                       top_k=TOP_K,
+                                       block_size=BLOCK_SIZE,
+                                       output_format=OUTPUT_FORMAT)
+    with metrics.stage('similarity'):
+        _, pd_df_similarities_long = similarity.generate()
+    with metrics.stage('write_similarities'):
+        write_table(convert_long_types(pd_df_similarities_long), f'{similarities_dir}/similarities_long',
+                    output_format=OUTPUT_FORMAT, partition_cols=long_partition_cols)
+elif BACKEND == 'spark':
+    import pyspark.sql.functions as f
+    from spark_similarity import SparkSimilarity
+
+    similarity = SparkSimilarity(df_features=df_recipe_features,
+                                 index_column=INDEX_COLUMN,
+                                 similarity_type=SIMILARITY_TYPE,
+                                 top_k=TOP_K,
+                                 check_nulls=False)
+    df_similarities_long = similarity.generate()\
+        .withColumn('similarity', f.col('similarity').cast('float'))
+    with metrics.stage('write_similarities'):
+        df_similarities_long.write.save(f'{similarities_dir}/similarities_long',
+                                        format=OUTPUT_FORMAT,
+                                        header=True,
+                                        partitionBy=long_partition_cols)
+elif BACKEND == 'pandas' and STREAM_LONG:
+    similarity = Similarity(df_features=recipe_features,
+                            index_column=INDEX_COLUMN,
+                            similarity_type=SIMILARITY_TYPE,
+                            top_k=TOP_K,
+                            block_size=BLOCK_SIZE,
+                            check_nulls=False,
+                            precision=PRECISION,
+                            n_jobs=N_JOBS,
+                            blas_threads=BLAS_THREADS,
+                            encode_ids=ENCODE_IDS)
+    similarity_writers = {similarity_type: BlockWriter(f'{similarity_dir}/similarities_long',
+                                                      output_format=OUTPUT_FORMAT,
+                                                      partition_cols=long_partition_cols)
+                          for similarity_type, similarity_dir in similarity_dirs.items()}
+    with metrics.stage('write_similarities'):
+        for pd_df_similarities_blocks in similarity.generate_long_blocks():
+            if not isinstance(SIMILARITY_TYPE, list):
+                pd_df_similarities_blocks = {SIMILARITY_TYPE: pd_df_similarities_blocks}
+            for similarity_type, pd_df_block in pd_df_similarities_blocks.items():
+                similarity_writers[similarity_type].write(convert_long_types(pd_df_block))
+        for similarity_writer in similarity_writers.values():
+            similarity_writer.close()
+elif BACKEND == 'pandas':
+    similarity = Similarity(df_features=recipe_features,
+                            index_column=INDEX_COLUMN,
+                            similarity_type=SIMILARITY_TYPE,
+                            top_k=TOP_K,
+                            block_size=BLOCK_SIZE,
+                            check_nulls=False,
+                            precision=PRECISION,
+                            metrics=metrics,
+                            n_jobs=N_JOBS,
+                            blas_threads=BLAS_THREADS,
+                            encode_ids=ENCODE_IDS)
+    similarities = similarity.generate()
+    if not isinstance(SIMILARITY_TYPE, list):
+        similarities = {SIMILARITY_TYPE: similarities}
+
+    with metrics.stage('write_similarities'):
+        for similarity_type, (pd_df_similarities_wide, pd_df_similarities_long) in similarities.items():
+            if pd_df_similarities_wide is not None:
+                write_table(pd_df_similarities_wide, f'{similarity_dirs[similarity_type]}/similarities_wide',
+                            output_format=OUTPUT_FORMAT, index=True)
+            write_table(convert_long_types(pd_df_similarities_long),
+                        f'{similarity_dirs[similarity_type]}/similarities_long',
+                        output_format=OUTPUT_FORMAT, partition_cols=long_partition_cols)
+else:
+    raise ValueError('Unknown "BACKEND".')
 
 parameters_dir = f'output/{etl_created}/parameters'
 os.makedirs(parameters_dir)
-pd_df_parameters = create_parameters_table(similarity_type=SIMILARITY_TYPE,
-                                           index_column=INDEX_COLUMN,
-                                           columns=COLUMNS)
+if isinstance(SIMILARITY_TYPE, list) and similarity.quantisation is not None:
+    quantisations = similarity.quantisation
+else:
+    quantisations = {similarity_type: similarity.quantisation for similarity_type in similarity_dirs}
+pd_df_parameters = pd.concat([create_parameters_table(similarity_type=similarity_type,
+                                                      index_column=INDEX_COLUMN,
+                                                      columns=COLUMNS,
+                                                      precision=similarity.precision,
+                                                      quantisation=quantisations[similarity_type])
+                              for similarity_type in similarity_dirs], ignore_index=True)
 pd_df_parameters.to_csv(f'{parameters_dir}/parameters.csv', index=False)
 
+metrics.write(f'output/{etl_created}/metrics')
 
-spark.stop()
 
+if spark is not None:
+    spark.stop()
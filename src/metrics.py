@@ -0,0 +1,212 @@
+import pandas as pd
+
+from contextlib import contextmanager
+from contextlib import nullcontext
+import datetime
+import json
+import os
+import resource
+import time
+import tracemalloc
+import urllib.request
+
+
+class Metrics(object):
+    """
+    Records wall time, peak memory, spark jobs and shuffle bytes of pipeline stages.
+
+    Stages can not be nested, every stage is measured on its own.
+
+    """
+
+    def __init__(self, spark=None, trace_memory=True, logger=None):
+        """
+
+        :param spark: spark session, spark jobs and stages are not counted if None
+        :param trace_memory: boolean, measure peak python memory allocated during every stage with tracemalloc,
+            which slows down allocation heavy stages
+        :param logger: logging.Logger, logs every record as json when set
+        """
+
+        self.spark = spark
+        self.trace_memory = trace_memory
+        self.logger = logger
+        self.records = []
+        self._stage = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures the code run inside the context as stage name.
+
+        :param name: string
+        :return:
+        """
+
+        assert self._stage is None, f'Stage "{name}" can not be nested in stage "{self._stage}".'
+        self._stage = name
+
+        if self.spark is not None:
+            job_group = f'{name}_{len(self.records)}_{time.time()}'
+            self.spark.sparkContext.setJobGroup(job_group, name)
+
+        is_tracing = tracemalloc.is_tracing()
+        if self.trace_memory and not is_tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.clear_traces()
+
+        start = time.time()
+
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+
+            peak_memory_mb = None
+            if self.trace_memory:
+                peak_memory_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                if not is_tracing:
+                    tracemalloc.stop()
+
+            spark_jobs = spark_stages = shuffle_read_mb = shuffle_write_mb = None
+            if self.spark is not None:
+                self._wait_for_listeners()
+                status_tracker = self.spark.sparkContext.statusTracker()
+                job_ids = status_tracker.getJobIdsForGroup(job_group)
+                job_infos = [status_tracker.getJobInfo(job_id) for job_id in job_ids]
+                stage_ids = [stage_id for job_info in job_infos if job_info is not None
+                             for stage_id in job_info.stageIds]
+                spark_jobs = len(job_ids)
+                spark_stages = len(stage_ids)
+                shuffle_read_mb, shuffle_write_mb = self._count_shuffle_mb(stage_ids, start)
+                self.spark.sparkContext.setJobGroup('', '')
+
+            self._stage = None
+            self._add_record({
+                'stage': name,
+                'seconds': seconds,
+                'peak_memory_mb': peak_memory_mb,
+                'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                'spark_jobs': spark_jobs,
+                'spark_stages': spark_stages,
+                'shuffle_read_mb': shuffle_read_mb,
+                'shuffle_write_mb': shuffle_write_mb
+            })
+
+    def _wait_for_listeners(self, timeout_ms=10000):
+        """
+        Waits until the spark listener bus has processed all events, so the status tracker and the spark ui know every
+        job, stage and shuffle of the stage just finished. Does not wait if the listener bus can not be reached or
+        does not drain within timeout_ms.
+
+        :param timeout_ms: int
+        :return:
+        """
+
+        from py4j.protocol import Py4JError
+
+        try:
+            self.spark.sparkContext._jsc.sc().listenerBus().waitUntilEmpty(timeout_ms)
+        except Py4JError:
+            pass
+
+    def _count_shuffle_mb(self, stage_ids, start):
+        """
+        Sums shuffle bytes read and written by spark stages, from the monitoring api of the spark ui.
+
+        Returns None for both if the spark ui is disabled or does not answer. Only stage attempts submitted after start
+        (the ui keeps milliseconds) are counted: jobs also list the stages of earlier jobs whose shuffle output they
+        reuse (skipped stages), and those keep the bytes of their earlier run.
+
+        :param stage_ids: list of int
+        :param start: float, seconds since the epoch when the measured stage started
+        :return: tuple, shuffle read and shuffle write in MB
+        """
+
+        ui_url = self.spark.sparkContext.uiWebUrl
+        if ui_url is None:
+            return None, None
+
+        stages_url = f'{ui_url}/api/v1/applications/{self.spark.sparkContext.applicationId}/stages'
+        shuffle_read_bytes = shuffle_write_bytes = 0
+        for stage_id in stage_ids:
+            try:
+                with urllib.request.urlopen(f'{stages_url}/{stage_id}', timeout=10) as response:
+                    attempts = json.load(response)
+            except (OSError, ValueError):
+                return None, None
+            attempts = [attempt for attempt in attempts
+                        if _parse_ui_time(attempt.get('submissionTime')) >= start - 1e-3]
+            shuffle_read_bytes += sum(attempt.get('shuffleReadBytes', 0) for attempt in attempts)
+            shuffle_write_bytes += sum(attempt.get('shuffleWriteBytes', 0) for attempt in attempts)
+
+        return shuffle_read_bytes / 1024 ** 2, shuffle_write_bytes / 1024 ** 2
+
+    def _add_record(self, record):
+        """
+        Adds a stage record and logs it.
+
+        :param record: dictionary
+        :return:
+        """
+
+        self.records.append(record)
+
+        if self.logger is not None:
+            self.logger.info(json.dumps(record))
+
+    def to_pandas(self):
+        """
+        Returns all stage records.
+
+        :return: pandas data frame
+        """
+
+        return pd.DataFrame(self.records, columns=['stage', 'seconds', 'peak_memory_mb', 'peak_rss_mb', 'spark_jobs',
+                                                   'spark_stages', 'shuffle_read_mb', 'shuffle_write_mb'])
+
+    def write(self, metrics_dir):
+        """
+        Writes all stage records to metrics_dir/metrics.csv.
+
+        :param metrics_dir: string
+        :return: string, path
+        """
+
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = f'{metrics_dir}/metrics.csv'
+        self.to_pandas().to_csv(path, index=False)
+
+        return path
+
+
+def measure(metrics, name):
+    """
+    Returns the stage context of metrics, or a context doing nothing if metrics is None.
+
+    :param metrics: Metrics or None
+    :param name: string
+    :return: context manager
+    """
+
+    if metrics is None:
+        return nullcontext()
+
+    return metrics.stage(name)
+
+
+def _parse_ui_time(value):
+    """
+    Converts a time of the spark ui monitoring api, e.g. "2021-01-01T12:00:00.000GMT", to seconds since the epoch.
+
+    :param value: string or None
+    :return: float, -inf if value is None
+    """
+
+    if value is None:
+        return float('-inf')
+
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fGMT')\
+        .replace(tzinfo=datetime.timezone.utc)\
+        .timestamp()
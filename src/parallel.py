@@ -0,0 +1,193 @@
+from scipy import sparse
+from threadpoolctl import threadpool_limits
+
+import numpy as np
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+
+SHARED_MEMORY_DIR = '/dev/shm'
+
+_worker = {}
+_inherited = {}
+
+
+class ParallelEngine(object):
+    """
+    Calculates and ranks long similarity blocks of a Similarity in worker processes.
+
+    Features are written once to memory mapped .npy files, in shared memory (SHARED_MEMORY_DIR) if it has room, else
+    in the temporary folder, and every worker maps them instead of receiving a copy. A precalculated similarity matrix
+    is not written, workers are forked and inherit it copy on write. Each worker calculates, ranks and sends back
+    block_size rows at a time, with the threads of its BLAS library capped, so n_jobs workers use n_jobs x
+    blas_threads cores. As workers are forked, the driver script is not imported again.
+
+    """
+
+    def __init__(self, similarity, n_jobs=-1, blas_threads=1):
+        """
+
+        :param similarity: Similarity, its block_size, top_k, precision and quantisation are used
+        :param n_jobs: int, number of worker processes, number of cores if -1
+        :param blas_threads: int, BLAS threads per worker
+        """
+
+        assert n_jobs == -1 or n_jobs >= 1, '"n_jobs" has to be -1 or positive.'
+        assert blas_threads >= 1, '"blas_threads" has to be positive.'
+
+        self.similarity = similarity
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.blas_threads = blas_threads
+
+    def generate_long_blocks(self, features, mat_similarity=None, similarities=None):
+        """
+        Generates ranked long similarities block_size rows at a time in worker processes, in order of the rows.
+
+        Ties are broken with a random state per block drawn from the random state of similarity, so results only
+        differ from a single process in the order of tied similarities.
+
+        :param features: Features
+        :param mat_similarity: numpy array, precalculated similarities of all indexes
+        :param similarities: dictionary, similarity type to Similarity, see Similarity._split_similarity_types. Every
+            block is then a dictionary of similarity type to pandas data frame, derived from a single gram block.
+        :return: generator of pandas data frames
+        """
+
+        indexes = self.similarity._long_indexes(features)
+        row_count = len(indexes)
+        top_k = row_count if self.similarity.top_k is None else min(self.similarity.top_k, row_count)
+        starts = list(range(0, row_count, self.similarity.block_size))
+        seeds = self.similarity._random_state.randint(np.iinfo(np.int32).max, size=len(starts))
+        tasks = [(start, min(start + self.similarity.block_size, row_count), seed)
+                 for start, seed in zip(starts, seeds)]
+
+        feature_arrays = self._create_feature_arrays(features) if mat_similarity is None else {}
+        arrays_parent_dir = self._select_arrays_dir(sum(array.nbytes for array in feature_arrays.values()))
+
+        with tempfile.TemporaryDirectory(dir=arrays_parent_dir, prefix='similarity_') as arrays_dir:
+            for name, array in feature_arrays.items():
+                np.save(f'{arrays_dir}/{name}.npy', array)
+            del feature_arrays
+
+            _inherited['mat_similarity'] = mat_similarity
+            try:
+                context = multiprocessing.get_context('fork')
+                with context.Pool(processes=min(self.n_jobs, max(len(tasks), 1)),
+                                  initializer=_initialise_worker,
+                                  initargs=(self.similarity, similarities, indexes, top_k, arrays_dir,
+                                            features.is_sparse, features.matrix.shape, mat_similarity is not None,
+                                            self.blas_threads)) as pool:
+                    for pd_df_block in pool.imap(_rank_block, tasks):
+                        yield pd_df_block
+            finally:
+                _inherited.clear()
+
+    @staticmethod
+    def _select_arrays_dir(nbytes):
+        """
+        Returns SHARED_MEMORY_DIR if it exists and has room for nbytes (plus 1 MB), else the temporary folder.
+
+        :param nbytes: int
+        :return: string
+        """
+
+        if os.path.isdir(SHARED_MEMORY_DIR) and shutil.disk_usage(SHARED_MEMORY_DIR).free > nbytes + 1024 ** 2:
+            return SHARED_MEMORY_DIR
+
+        return tempfile.gettempdir()
+
+    @staticmethod
+    def _create_feature_arrays(features):
+        """
+        Returns the arrays written for the workers: the feature matrix, or its data, indices and indptr if sparse.
+
+        :param features: Features
+        :return: dictionary, file name to numpy array
+        """
+
+        if features.is_sparse:
+            matrix = sparse.csr_matrix(features.matrix)
+            return {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr}
+
+        return {'matrix': np.asarray(features.matrix)}
+
+
+def _initialise_worker(similarity, similarities, indexes, top_k, arrays_dir, is_sparse, shape, is_similarity,
+                       blas_threads):
+    """
+    Caps BLAS threads and maps the feature arrays of arrays_dir in a worker process, or takes the similarity matrix
+    inherited from the parent process.
+
+    :param similarity: Similarity
+    :param similarities: dictionary, similarity type to Similarity, or None
+    :param indexes: numpy array, indexes written to long similarities
+    :param top_k: int
+    :param arrays_dir: string
+    :param is_sparse: boolean
+    :param shape: tuple, shape of the feature matrix
+    :param is_similarity: boolean, use the inherited similarity matrix instead of features
+    :param blas_threads: int
+    :return:
+    """
+
+    _worker['thread_limits'] = threadpool_limits(limits=blas_threads, user_api='blas')
+    _worker['similarity'] = similarity
+    _worker['similarities'] = similarities
+    _worker['indexes'] = indexes
+    _worker['top_k'] = top_k
+    _worker['mat_similarity'] = None
+    _worker['mat_features'] = None
+
+    if is_similarity:
+        _worker['mat_similarity'] = _inherited['mat_similarity']
+    elif is_sparse:
+        _worker['mat_features'] = sparse.csr_matrix((np.load(f'{arrays_dir}/data.npy', mmap_mode='r'),
+                                                     np.load(f'{arrays_dir}/indices.npy', mmap_mode='r'),
+                                                     np.load(f'{arrays_dir}/indptr.npy', mmap_mode='r')),
+                                                    shape=shape)
+    else:
+        _worker['mat_features'] = np.load(f'{arrays_dir}/matrix.npy', mmap_mode='r')
+
+    if similarities is not None:
+        _worker['norms'] = similarity._calculate_squared_norms(_worker['mat_features'])
+
+
+def _rank_block(task):
+    """
+    Calculates and ranks the similarities of rows start to stop in a worker process.
+
+    :param task: tuple, start (int), stop (int), seed (int) of the random tie breaking
+    :return: pandas data frame, or dictionary of similarity type to pandas data frame
+    """
+
+    start, stop, seed = task
+    similarity = _worker['similarity']
+    similarities = _worker['similarities']
+    indexes = _worker['indexes']
+    top_k = _worker['top_k']
+    random_state = np.random.RandomState(seed)
+
+    if similarities is not None:
+        mat_gram, _ = similarity._calculate_gram(_worker['mat_features'][start:stop], _worker['mat_features'])
+        norms = _worker['norms']
+        pd_df_blocks = {}
+
+        for similarity_type, similarity_by_type in similarities.items():
+            similarity_by_type._random_state = random_state
+            pd_df_blocks[similarity_type] = similarity_by_type._create_long_block(
+                indexes[start:stop], indexes, similarity_by_type._derive_similarity(mat_gram, norms[start:stop], norms),
+                top_k)
+
+        return pd_df_blocks
+
+    similarity._random_state = random_state
+
+    if _worker['mat_similarity'] is not None:
+        mat_block = np.asarray(_worker['mat_similarity'][start:stop])
+    else:
+        mat_block = similarity._calculate_similarity(_worker['mat_features'][start:stop], _worker['mat_features'])
+
+    return similarity._create_long_block(indexes[start:stop], indexes, mat_block, top_k)
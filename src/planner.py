@@ -0,0 +1,145 @@
+from similarity import PRECISIONS
+
+import numpy as np
+
+import re
+
+
+ID_BYTES = 64
+MEMORY_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def parse_memory(memory):
+    """
+    Parses a memory size in bytes or in spark notation, e.g. "512m" or "8g".
+
+    :param memory: int or string
+    :return: int, bytes
+    """
+
+    if isinstance(memory, (int, np.integer)):
+        return int(memory)
+
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)b?\s*', str(memory).lower())
+    assert match is not None, f'"{memory}" is not a memory size such as "512m" or "8g".'
+
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2)])
+
+
+def format_memory(memory):
+    """
+    Formats bytes as GiB.
+
+    :param memory: int, bytes
+    :return: string
+    """
+
+    return f'{memory / 1024 ** 3:.2f} GiB'
+
+
+def estimate_memory(row_count, feature_count, top_k=None, precision='float64', block_size=1000, is_streaming=False,
+                    is_sparse=False, nnz_per_row=None, similarity_type_count=1):
+    """
+    Estimates peak driver memory of Similarity.generate (or of streaming generate_long_blocks) in bytes.
+
+    :param row_count: int, number of indexes
+    :param feature_count: int, one hot width
+    :param top_k: int
+    :param precision: string, one of PRECISIONS
+    :param block_size: int
+    :param is_streaming: boolean, long similarities are written block by block and no wide output is built
+    :param is_sparse: boolean, features are collected into a sparse matrix
+    :param nnz_per_row: int, non zero features per row of a sparse matrix, defaults to feature_count
+    :param similarity_type_count: int, number of similarity types derived from one gram matrix
+    :return: dictionary, component to bytes, with the sum under "total"
+    """
+
+    calculation_bytes = 8 if precision == 'float64' else 4
+    storage_bytes = np.dtype(precision).itemsize
+    top_k = row_count if top_k is None else min(top_k, row_count)
+    block_size = min(block_size, row_count)
+    long_row_bytes = 2 * 8 + storage_bytes + 8
+
+    if is_sparse:
+        nnz = row_count * (feature_count if nnz_per_row is None else nnz_per_row)
+        features_bytes = nnz * (calculation_bytes + 4) + (row_count + 1) * 4
+    else:
+        features_bytes = row_count * feature_count * calculation_bytes
+
+    estimate = {
+        'features_frame': row_count * (feature_count + ID_BYTES),
+        'features': 2 * features_bytes,
+        'similarity': 0,
+        'wide': 0,
+        'block': similarity_type_count * block_size * row_count * (3 * calculation_bytes + 17),
+        'long': 0
+    }
+
+    if is_streaming:
+        estimate['long'] = similarity_type_count * 2 * block_size * top_k * long_row_bytes
+    elif top_k < row_count:
+        estimate['long'] = similarity_type_count * 2 * row_count * top_k * long_row_bytes
+    else:
+        gram_count = similarity_type_count + 1 if similarity_type_count > 1 else 1
+        estimate['similarity'] = gram_count * row_count * row_count * calculation_bytes
+        estimate['wide'] = similarity_type_count * row_count * row_count * storage_bytes
+        estimate['long'] = similarity_type_count * 2 * row_count * row_count * long_row_bytes
+
+    estimate['total'] = sum(estimate.values())
+
+    return estimate
+
+
+def plan_memory(max_memory, row_count, feature_count, top_k=None, precision=None, block_size=1000, is_sparse=False,
+                nnz_per_row=None, similarity_type_count=1):
+    """
+    Chooses precision, block size and in memory or streaming execution so similarities fit in max_memory.
+
+    For every precision (only the given one, or PRECISIONS in order if None) in memory execution is tried first, then
+    streaming with the largest block size up to block_size that fits. Raises MemoryError with the smallest estimate
+    if nothing fits.
+
+    :param max_memory: int or string, e.g. "8g"
+    :param row_count: int
+    :param feature_count: int
+    :param top_k: int
+    :param precision: string, one of PRECISIONS, or None to choose
+    :param block_size: int, largest block size to use
+    :param is_sparse: boolean
+    :param nnz_per_row: int
+    :param similarity_type_count: int
+    :return: dictionary with "strategy" ("in_memory" or "streaming"), "precision", "block_size", "max_memory" and
+        "estimate"
+    """
+
+    max_memory = parse_memory(max_memory)
+    precisions = PRECISIONS if precision is None else [precision]
+    assert all(candidate in PRECISIONS for candidate in precisions), f'"precision" has to be one of {PRECISIONS}.'
+
+    block_size = max(min(block_size, row_count), 1)
+    sizes = {'row_count': row_count, 'feature_count': feature_count, 'top_k': top_k, 'is_sparse': is_sparse,
+             'nnz_per_row': nnz_per_row, 'similarity_type_count': similarity_type_count}
+
+    for candidate in precisions:
+        estimate = estimate_memory(precision=candidate, block_size=block_size, is_streaming=False, **sizes)
+        if estimate['total'] <= max_memory:
+            return {'strategy': 'in_memory', 'precision': candidate, 'block_size': block_size,
+                    'max_memory': max_memory, 'estimate': estimate}
+
+        fixed = estimate_memory(precision=candidate, block_size=0, is_streaming=True, **sizes)['total']
+        per_row = estimate_memory(precision=candidate, block_size=1, is_streaming=True, **sizes)['total'] - fixed
+        streaming_block_size = min(block_size, (max_memory - fixed) // max(per_row, 1))
+
+        if streaming_block_size >= 1:
+            estimate = estimate_memory(precision=candidate, block_size=streaming_block_size, is_streaming=True,
+                                       **sizes)
+            return {'strategy': 'streaming', 'precision': candidate, 'block_size': int(streaming_block_size),
+                    'max_memory': max_memory, 'estimate': estimate}
+
+    estimate = estimate_memory(precision=precisions[-1], block_size=1, is_streaming=True, **sizes)
+    components = ', '.join(f'{component} {format_memory(memory)}' for component, memory in estimate.items()
+                           if component != 'total')
+
+    raise MemoryError(f'{row_count} indexes with {feature_count} features need at least '
+                      f'{format_memory(estimate["total"])} ({components}) but "max_memory" is '
+                      f'{format_memory(max_memory)}.')
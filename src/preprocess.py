@@ -1,8 +1,16 @@
 from pyspark.sql import DataFrame
 import pyspark.sql.functions as f
-from pyspark.sql.types import *
 from pyspark.sql import Window
 
+from features import Features
+from spark_utils import count_nulls
+from spark_utils import count_duplicates
+from metrics import measure
+from labels import COUNTRY_LABELS
+from labels import DEDUPE_MODES
+
+import re
+
 
 class Preprocess(object):
     """
@@ -10,30 +18,60 @@ class Preprocess(object):
 
     """
 
-    def __init__(self, df_labels, columns, index_column='recipe_id'):
+    def __init__(self, df_labels, columns, index_column='recipe_id', country_labels=None, range_columns=('prep_time',),
+                 na_label='#n/a', metrics=None, dedupe='random', seed=None, check_duplicates=False):
         """
         Performs the following assumption checks/manipulations during initialization:
             - checks if "df_labels" is a spark data frame
             - checks "columns" is a list or "all"
             - convert "columns" to list of strings containing all columns from "df_labels"
+            - counts nulls in all columns in a single aggregation
             - checks nulls in index_column
-            - removes duplicates from index_column
+            - counts duplicates in index_column if check_duplicates
+            - removes duplicates from index_column, unless check_duplicates found none, and persists the result
             - checks if attribute columns contain nulls
 
         :param df_labels: spark data frame
         :param columns: list of string, columns to use for similarity calculation
         :param index_column: string, columns to use for similarity calculation
+        :param country_labels: dictionary, country label to rectified label, defaults to COUNTRY_LABELS
+        :param range_columns: list of strings, columns with ranges such as "55-60" to convert to upper bound
+        :param na_label: string, label converted to column_name+not_applicable
+        :param metrics: Metrics, records the "check_nulls", "check_duplicates", "dedupe", "normalise_labels",
+            "collect_labels" and "one_hot" stages
+        :param dedupe: string, "random" keeps a random row per index with a window sorted within every index, "first"
+            keeps the first row per index with a groupBy, which is cheaper but depends on the order of the rows
+        :param seed: int, seed of the random choice between duplicate indexes
+        :param check_duplicates: boolean, count duplicate indexes first and skip the dedupe shuffle if there are none
         """
 
         self.df_labels = df_labels
         self.columns = columns
         self.index_column = index_column
+        self.country_labels = COUNTRY_LABELS if country_labels is None else country_labels
+        self.range_columns = list(range_columns)
+        self.na_label = na_label
+        self.vocabulary = None
+        self.null_report = None
+        self.metrics = metrics
+        self.dedupe = dedupe
+        self.seed = seed
+        self.check_duplicates = check_duplicates
+        self.duplicate_count = None
 
         self._check_is_spark_data_frame()
         self._check_is_list()
+        self._check_dedupe()
         self._convert_column_argument()
+        with measure(self.metrics, 'check_nulls'):
+            self._create_null_report()
         self._check_nulls_in_index_column()
-        self._remove_duplicate_indexes()
+        if self.check_duplicates:
+            with measure(self.metrics, 'check_duplicates'):
+                self._count_duplicate_indexes()
+        if self.duplicate_count != 0:
+            with measure(self.metrics, 'dedupe'):
+                self._remove_duplicate_indexes()
         self._check_nulls_in_attribute_columns()
 
     def _convert_column_argument(self):
@@ -46,21 +84,53 @@ class Preprocess(object):
         if self.columns == 'all':
             self.columns = [col for col in self.df_labels.columns if col != self.index_column]
 
+    def _count_duplicate_indexes(self):
+        """
+        Counts rows with an index already held by another row.
+
+        :return:
+        """
+
+        self.duplicate_count = count_duplicates(self.df_labels, self.index_column)
+
     def _remove_duplicate_indexes(self):
         """
-        Removes duplicate recipes by randomly selecting one if duplicated.
+        Removes duplicate recipes by selecting one if duplicated, randomly or the first one depending on dedupe.
+
+        The deduplicated labels are persisted and counted, so the dedupe shuffle runs here once and every later step
+        reads the same rows. They are unpersisted once the preprocessed output no longer needs them.
 
         :return:
         """
 
-        window = Window \
-            .partitionBy([self.index_column]) \
-            .orderBy(f.rand())
+        if self.dedupe == 'first':
+            columns = [col for col in self.df_labels.columns if col != self.index_column]
+            df_deduplicated = self.df_labels\
+                .groupBy(self.index_column)\
+                .agg(f.first(f.struct(*columns)).alias('labels'))\
+                .select(*[f.col(col) if col == self.index_column else f.col('labels')[col].alias(col)
+                          for col in self.df_labels.columns])
+        else:
+            window = Window \
+                .partitionBy([self.index_column]) \
+                .orderBy(f.rand(self.seed))
+
+            df_deduplicated = self.df_labels\
+                .withColumn('rn', f.row_number().over(window))\
+                .filter(f.col('rn') == 1)\
+                .drop('rn')
+
+        self.df_labels = df_deduplicated.persist()
+        self.df_labels.count()
 
-        self.df_labels = self.df_labels\
-            .withColumn('rn', f.row_number().over(window))\
-            .filter(f.col('rn') == 1)\
-            .drop('rn')
+    def _check_dedupe(self):
+        """
+        Checks "dedupe" is a known mode.
+
+        :return:
+        """
+
+        assert self.dedupe in DEDUPE_MODES, f'"dedupe" has to be one of {DEDUPE_MODES}.'
 
     def _check_is_list(self):
         """
@@ -81,6 +151,15 @@ class Preprocess(object):
 
         assert isinstance(self.df_labels, DataFrame), '"df_labels" is not a spark data frame.'
 
+    def _create_null_report(self):
+        """
+        Counts nulls of every column in df_labels with one scan, before duplicates are removed.
+
+        :return:
+        """
+
+        self.null_report = count_nulls(self.df_labels, self.df_labels.columns)
+
     def _check_nulls_in_index_column(self):
         """
         Checks if column "recipe_id" contains nulls.
@@ -88,7 +167,7 @@ class Preprocess(object):
         :return:
         """
 
-        null_count = self.df_labels.filter(f.col(self.index_column).isNull()).count()
+        null_count = self.null_report[self.index_column]
         assert null_count == 0, \
             f'There are {null_count} null(s) in the "index_column" column in "df_labels" when no nulls are allowed.'
 
@@ -100,30 +179,68 @@ class Preprocess(object):
         """
 
         columns_to_check = [col for col in self.df_labels.columns if col != self.index_column]
-        row_count = self.df_labels.count()
 
         for col in columns_to_check:
-            col_count = self.df_labels.filter(f.col(col).isNotNull()).select(col).count()
-
-            assert col_count == row_count, f'There are null(s) in "{col}".'
+            assert self.null_report[col] == 0, f'There are null(s) in "{col}".'
 
     def preprocess(self):
         """
         Preprocess recipes data.
 
+        Normalised labels are persisted, so the vocabulary and the one hot columns are built from the same randomly
+        deduplicated recipes. The one hot data frame is persisted and materialised before the normalised labels are
+        unpersisted, so the lineage runs once. Unpersist the returned data frame when it is no longer needed.
+
+        :return: spark data frame, persisted
+        """
+
+        with measure(self.metrics, 'normalise_labels'):
+            df_converted_prep_time = self._normalise_labels().persist()
+        with measure(self.metrics, 'one_hot'):
+            df_one_hot = self._convert_to_one_hot(df_converted_prep_time).persist()
+            df_one_hot.count()
+        df_converted_prep_time.unpersist()
+        self.df_labels.unpersist()
+
+        return df_one_hot
+
+    def preprocess_sparse(self):
+        """
+        Preprocess recipes data into a sparse one hot matrix on the driver.
+
+        Only the normalised label columns are collected, the wide one hot data frame is never built in spark.
+
+        :return: Features
+        """
+
+        with measure(self.metrics, 'normalise_labels'):
+            df_converted_prep_time = self._normalise_labels()
+        with measure(self.metrics, 'collect_labels'):
+            pd_df_labels = df_converted_prep_time.toPandas()
+        self.df_labels.unpersist()
+        self.vocabulary = {col: sorted(pd_df_labels[col].unique()) for col in self.columns}
+        with measure(self.metrics, 'one_hot'):
+            features = Features.from_labels(pd_df_labels=pd_df_labels,
+                                            columns=self.columns,
+                                            index_column=self.index_column)
+
+        return features
+
+    def _normalise_labels(self):
+        """
+        Normalises label columns ahead of the one hot conversion, with all steps fused into a single select.
+
         :return: spark data frame
         """
 
         self._remove_columns()
 
-        df_rectified_country_labels = self._rectify_country_labels()
-        df_no_whitespaces = self._replace_whitespaces_with_underscores(df_rectified_country_labels)
-        df_lower_case = self._convert_columns_to_lower_case(df_no_whitespaces)
-        df_converted_nas = self._convert_nas(df_lower_case)
-        df_converted_prep_time = self._convert_prep_time(df_converted_nas)
-        df_one_hot = self._convert_to_one_hot(df_converted_prep_time)
+        df_normalised = self.df_labels.select([self._normalise_label_expression(col).alias(col)
+                                               if col != self.index_column
+                                               else f.col(col)
+                                               for col in self.df_labels.columns])
 
-        return df_one_hot
+        return df_normalised
 
     def _remove_columns(self):
         """
@@ -145,32 +262,10 @@ class Preprocess(object):
         """
 
         country_columns = [col for col in self.columns if 'country' in col]
-        df_rectified_country_labels = self.df_labels
-
-        if country_columns:
-            for country in country_columns:
-                df_rectified_country_labels = df_rectified_country_labels\
-                    .withColumn(country, f.regexp_replace(country,
-                                                          'United States of America \(USA\)',
-                                                          'United States'))
-                df_rectified_country_labels = df_rectified_country_labels\
-                    .withColumn(country, f.regexp_replace(country,
-                                                          'Israel and the Occupied Territories',
-                                                          'Israel'))
-                df_rectified_country_labels = df_rectified_country_labels\
-                    .withColumn(country, f.regexp_replace(country,
-                                                          'Korea, Republic of \(South Korea\)',
-                                                          'South Korea'))
-
-                df_rectified_country_labels = df_rectified_country_labels\
-                    .withColumn(country, f.regexp_replace(country,
-                                                          'Korea, Democratic Republic of \(North Korea\)',
-                                                          'South Korea'))
-
-                df_rectified_country_labels = df_rectified_country_labels\
-                    .withColumn(country, f.regexp_replace(country,
-                                                          'Great Britain',
-                                                          'United Kingdom'))
+
+        df_rectified_country_labels = self._select_with_expression(self.df_labels,
+                                                                   country_columns,
+                                                                   self._rectify_country_expression)
 
         return df_rectified_country_labels
 
@@ -184,12 +279,9 @@ class Preprocess(object):
 
         columns_to_process = [col for col in df_rectified_country_labels.columns if col != self.index_column]
 
-        df_withspaces = df_rectified_country_labels
-
-        for col in columns_to_process:
-            df_withspaces = df_withspaces.withColumn(col, f.regexp_replace(col, ' ', '_'))
-
-        df_no_whitespaces = df_withspaces
+        df_no_whitespaces = self._select_with_expression(df_rectified_country_labels,
+                                                         columns_to_process,
+                                                         self._replace_whitespaces_expression)
 
         return df_no_whitespaces
 
@@ -203,16 +295,15 @@ class Preprocess(object):
 
         columns_to_process = [col for col in df_no_whitspaces.columns if col != self.index_column]
 
-        df_lower_case = df_no_whitspaces
-
-        for col in columns_to_process:
-            df_lower_case = df_lower_case.withColumn(col, f.lower(f.col(col)))
+        df_lower_case = self._select_with_expression(df_no_whitspaces,
+                                                     columns_to_process,
+                                                     self._lower_case_expression)
 
         return df_lower_case
 
     def _convert_nas(self, df_lower_case):
         """
-        Converts "#n/a" to column_name+not_applicable.
+        Converts "na_label" (default "#n/a") to column_name+not_applicable.
 
         :param df_lower_case: spark data frame
         :return: spark data frame
@@ -220,51 +311,164 @@ class Preprocess(object):
 
         columns_to_process = [col for col in df_lower_case.columns if col != self.index_column]
 
-        df_converted_nas = df_lower_case
-
-        for col in columns_to_process:
-            df_converted_nas = df_converted_nas.withColumn(col, f.regexp_replace(col, '#n/a', col+'_not_applicable'))
+        df_converted_nas = self._select_with_expression(df_lower_case,
+                                                        columns_to_process,
+                                                        self._convert_nas_expression)
 
         return df_converted_nas
 
     def _convert_prep_time(self, df_converted_nas):
         """
-        Converts prep times in ranges to upper bound of range.
+        Converts prep times (and other "range_columns") in ranges to upper bound of range.
 
         :param df_converted_nas: spark data frame
         :return: spark data frame
         """
 
-        if 'prep_time' in self.columns:
-            convert_prep_time = f.udf(lambda x: x.split('-')[-1], StringType())
+        columns_to_process = [col for col in self.range_columns if col in self.columns]
 
-            df_converted_nas = df_converted_nas.withColumn('prep_time_copy', f.col('prep_time'))
+        df_converted_prep_time = self._select_with_expression(df_converted_nas,
+                                                              columns_to_process,
+                                                              self._convert_range_expression)
 
-            df_converted_prep_time = df_converted_nas.withColumn('prep_time', convert_prep_time(df_converted_nas.prep_time_copy))
-            df_converted_prep_time = df_converted_prep_time.drop('prep_time_copy')
+        return df_converted_prep_time
 
-            return df_converted_prep_time
-        else:
-            return df_converted_nas
+    def _normalise_label_expression(self, col):
+        """
+        Builds a single expression applying all label normalisation steps to a column, in the same order as
+        _rectify_country_labels, _replace_whitespaces_with_underscores, _convert_columns_to_lower_case, _convert_nas
+        and _convert_prep_time.
+
+        :param col: string
+        :return: spark column
+        """
+
+        expression = f.col(col)
+
+        if col in self.columns and 'country' in col:
+            expression = self._rectify_country_expression(expression, col)
+
+        expression = self._replace_whitespaces_expression(expression, col)
+        expression = self._lower_case_expression(expression, col)
+        expression = self._convert_nas_expression(expression, col)
+
+        if col in self.columns and col in self.range_columns:
+            expression = self._convert_range_expression(expression, col)
+
+        return expression
+
+    def _rectify_country_expression(self, expression, col):
+        """
+        Replaces country labels found in "country_labels" with their rectified label.
+
+        :param expression: spark column
+        :param col: string
+        :return: spark column
+        """
+
+        if not self.country_labels:
+            return expression
+
+        mapping = f.create_map([f.lit(label) for pair in self.country_labels.items() for label in pair])
+
+        return f.coalesce(mapping[expression], expression)
+
+    def _replace_whitespaces_expression(self, expression, col):
+        """
+        Replaces whitespaces with underscores.
+
+        :param expression: spark column
+        :param col: string
+        :return: spark column
+        """
+
+        return f.regexp_replace(expression, ' ', '_')
+
+    def _lower_case_expression(self, expression, col):
+        """
+        Converts to lower case.
+
+        :param expression: spark column
+        :param col: string
+        :return: spark column
+        """
+
+        return f.lower(expression)
+
+    def _convert_nas_expression(self, expression, col):
+        """
+        Converts "na_label" to col+'_not_applicable'.
+
+        :param expression: spark column
+        :param col: string
+        :return: spark column
+        """
+
+        return f.regexp_replace(expression, re.escape(self.na_label), col+'_not_applicable')
+
+    def _convert_range_expression(self, expression, col):
+        """
+        Converts ranges such as "55-60" to their upper bound.
+
+        :param expression: spark column
+        :param col: string
+        :return: spark column
+        """
+
+        return f.element_at(f.split(expression, '-'), -1)
+
+    def _select_with_expression(self, df, columns_to_process, build_expression):
+        """
+        Applies an expression builder to columns_to_process in a single select, keeping the order of columns.
+
+        :param df: spark data frame
+        :param columns_to_process: list of strings
+        :param build_expression: function taking a spark column and a column name, returning a spark column
+        :return: spark data frame
+        """
+
+        df_processed = df.select([build_expression(f.col(col), col).alias(col) if col in columns_to_process
+                                  else f.col(col)
+                                  for col in df.columns])
+
+        return df_processed
 
     def _convert_to_one_hot(self, df_lower_case):
         """
         Converts recipes description data to one hot using columns attribute.
 
+        Labels of all columns are collected in a single job and the one hot columns are added in a single select.
+
         :param df_lower_case: spark data frame
         :return: spark data frame
         """
 
-        df_one_hot = df_lower_case
+        self.vocabulary = self._collect_vocabulary(df_lower_case)
 
-        for col in self.columns:
-            unique_labels = [v[0] for v in df_lower_case.select(col).distinct().collect()]
+        columns_to_keep = [col for col in df_lower_case.columns if col not in self.columns]
+        columns_one_hot = [f.when(f.col(col) == label, 1).otherwise(0).alias(col+'_'+label)
+                           for col in self.columns
+                           for label in self.vocabulary[col]]
 
-            for label in unique_labels:
-                df_one_hot = df_one_hot\
-                    .withColumn(col+'_'+label, f.when(f.col(col) == label, 1).otherwise(0))
-
-            df_one_hot = df_one_hot.drop(col)
+        df_one_hot = df_lower_case.select(columns_to_keep + columns_one_hot)
 
         return df_one_hot
 
+    def _collect_vocabulary(self, df_lower_case):
+        """
+        Collects sorted unique labels of every column in self.columns with one aggregation.
+
+        :param df_lower_case: spark data frame
+        :return: dictionary, column name to list of labels
+        """
+
+        if not self.columns:
+            return {}
+
+        row = df_lower_case\
+            .agg(*[f.collect_set(col).alias(col) for col in self.columns])\
+            .collect()[0]
+
+        vocabulary = {col: sorted(row[col]) for col in self.columns}
+
+        return vocabulary
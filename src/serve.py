@@ -0,0 +1,105 @@
+from lookup import NeighbourService
+from lookup import find_latest_run
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+from urllib.parse import parse_qs
+
+import argparse
+import json
+import os
+
+
+def create_server(service, host='127.0.0.1', port=8000, output_dir='output'):
+    """
+    Creates a http server answering neighbour lookups of service.
+
+    GET /neighbours?id=X&n=10 returns the neighbours of one id, repeating id returns a batch.
+    POST /reload?run=20210101_1200 swaps to another run of output_dir, the latest run if run is missing. Runs that are
+    not folders of output_dir are refused, and a failing reload answers with an error and keeps the current run.
+
+    :param service: NeighbourService
+    :param host: string
+    :param port: int, 0 picks a free port
+    :param output_dir: string
+    :return: ThreadingHTTPServer
+    """
+
+    class NeighbourHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path != '/neighbours' or 'id' not in query:
+                return self._send(404, {'error': 'Use /neighbours?id=X&n=10.'})
+
+            n = query.get('n', ['10'])[0]
+            if not n.isdigit() or int(n) < 1:
+                return self._send(400, {'error': f'"n" has to be a positive integer, got "{n}".'})
+
+            neighbours = service.query_batch(query['id'], n=int(n))
+
+            return self._send(200, {index: None if index_neighbours is None else
+                                    [{'id': neighbour, 'similarity': similarity}
+                                     for neighbour, similarity in index_neighbours]
+                                    for index, index_neighbours in neighbours.items()})
+
+        def do_POST(self):
+
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path != '/reload':
+                return self._send(404, {'error': 'Use /reload?run=20210101_1200.'})
+
+            if 'run' in query and query['run'][0] not in os.listdir(output_dir):
+                return self._send(404, {'error': f'Unknown run "{query["run"][0]}".'})
+
+            try:
+                run_dir = f'{output_dir}/{query["run"][0]}' if 'run' in query else find_latest_run(output_dir)
+                service.reload(run_dir)
+            except Exception as error:
+                return self._send(500, {'error': f'Reload failed: {error!r}'})
+
+            return self._send(200, {'run': run_dir})
+
+        def _send(self, status, content):
+
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+
+            pass
+
+    return ThreadingHTTPServer((host, port), NeighbourHandler)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Serves top N neighbour lookups of a similarity run.')
+    parser.add_argument('index_column')
+    parser.add_argument('--run', help='run folder in output_dir, the latest run if missing')
+    parser.add_argument('--output-dir', default='output')
+    parser.add_argument('--output-format', default='csv')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--query', nargs='+', help='prints the neighbours of these ids instead of serving')
+    parser.add_argument('-n', type=int, default=10)
+    arguments = parser.parse_args()
+
+    run_dir = f'{arguments.output_dir}/{arguments.run}' if arguments.run else find_latest_run(arguments.output_dir)
+    neighbour_service = NeighbourService(run_dir,
+                                         index_column=arguments.index_column,
+                                         output_format=arguments.output_format)
+
+    if arguments.query:
+        print(json.dumps(neighbour_service.query_batch(arguments.query, n=arguments.n), indent=2))
+    else:
+        create_server(neighbour_service, port=arguments.port, output_dir=arguments.output_dir).serve_forever()
@@ -1,12 +1,20 @@
-from pyspark.sql import DataFrame
-import pyspark.sql.functions as f
+from features import Features
+from lsh import MinHashLSH
+from lsh import jaccard_similarity_pairs
+from metrics import measure
+from parallel import ParallelEngine
 
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.metrics.pairwise import euclidean_distances
+from scipy import sparse
 
 import pandas as pd
 import numpy as np
 
+import copy
+
+
+PRECISIONS = ['float64', 'float32', 'float16', 'uint8']
+GRAM_SIMILARITY_TYPES = ['cosine', 'euclidean', 'jaccard', 'overlap']
+
 
 class Similarity(object):
     """
@@ -14,29 +22,102 @@ class Similarity(object):
 
     """
 
-    def __init__(self, df_features, index_column='recipe_id', similarity_type='cosine'):
+    def __init__(self, df_features, index_column='recipe_id', similarity_type='cosine', top_k=None, block_size=1000,
+                 is_sparse=False, check_nulls=True, seed=None, num_bands=20, rows_per_band=5, precision='float64',
+                 metrics=None, n_jobs=1, blas_threads=1, encode_ids=False):
         """
 
-        :param df_features: spark data frame, contains labels in first column and int features in remaining
+        :param df_features: spark data frame, contains labels in first column and int features in remaining,
+            or Features
+        :param index_column: string
+        :param similarity_type: string, "cosine", "euclidean", "jaccard" (binary features), "overlap" (binary
+            features) or "jaccard_lsh" (approximate, binary features), or a list of GRAM_SIMILARITY_TYPES calculated
+            from a single gram matrix
+        :param top_k: int, if set only the top_k neighbours per index are kept and the full matrix is never built
+        :param block_size: int, number of rows per similarity or ranking block
+        :param is_sparse: boolean, collect a spark data frame into a sparse csr matrix before calculating similarities
+        :param check_nulls: boolean, set to False when df_features comes from Preprocess, which already checked its
+            labels for nulls
+        :param seed: int, seed of the random tie breaking between equal similarities
+        :param num_bands: int, number of minhash bands for "jaccard_lsh"
+        :param rows_per_band: int, number of minhash rows per band for "jaccard_lsh"
+        :param precision: string, one of PRECISIONS. Similarities are calculated in float32 unless "float64" and
+            stored as float16 or as uint8 scores with "quantisation" scale and offset if chosen (a dictionary of
+            quantisations per similarity type if similarity_type is a list)
+        :param metrics: Metrics, records the "check_nulls", "collect_features", "similarity", "wide" and "long"
+            stages of generate
+        :param n_jobs: int, number of worker processes calculating and ranking long similarity blocks, see
+            ParallelEngine, number of cores if -1
+        :param blas_threads: int, BLAS threads per worker process if n_jobs is not 1
+        :param encode_ids: boolean, store indexes in long similarities as int32 row codes of the collected features,
+            see utils.create_id_table and utils.decode_ids. The wide similarities keep prefixed indexes.
 
         """
 
         self.df_features = df_features
         self.index_column = index_column
         self.similarity_type = similarity_type
-
+        self.top_k = top_k
+        self.block_size = block_size
+        self.is_sparse = is_sparse
+        self.check_nulls = check_nulls
+        self.seed = seed
+        self.num_bands = num_bands
+        self.rows_per_band = rows_per_band
+        self.precision = precision
+        self.null_report = None
+        self.quantisation = None
+        self._random_state = np.random.RandomState(seed)
+        self.metrics = metrics
+        self.n_jobs = n_jobs
+        self.blas_threads = blas_threads
+        self.encode_ids = encode_ids
+
+        self._check_precision()
+        self._check_similarity_types()
         self._check_is_spark_data_frame()
-        self._check_nulls_in_feature_columns()
+        with measure(self.metrics, 'check_nulls'):
+            self._check_nulls_in_feature_columns()
         self._check_is_numerical_data()
 
+    def _check_precision(self):
+        """
+        Checks "precision" is one of PRECISIONS.
+
+        :return:
+        """
+
+        assert self.precision in PRECISIONS, f'"precision" has to be one of {PRECISIONS}.'
+
+    def _check_similarity_types(self):
+        """
+        Checks a list of similarity types only contains GRAM_SIMILARITY_TYPES, each once.
+
+        :return:
+        """
+
+        if not isinstance(self.similarity_type, list):
+            return
+
+        assert self.similarity_type, '"similarity_type" can not be an empty list.'
+        assert all(similarity_type in GRAM_SIMILARITY_TYPES for similarity_type in self.similarity_type), \
+            f'A list of "similarity_type" can only contain {GRAM_SIMILARITY_TYPES}.'
+        assert len(set(self.similarity_type)) == len(self.similarity_type), \
+            '"similarity_type" contains duplicates.'
+
     def _check_is_spark_data_frame(self):
         """
-        Checks if df_features is a spark data frame.
+        Checks if df_features is a spark data frame or Features, pyspark is only imported for the former.
 
         :return:
         """
 
-        assert isinstance(self.df_features, DataFrame), '"df_features" is not a spark data frame.'
+        if isinstance(self.df_features, Features):
+            return
+
+        from pyspark.sql import DataFrame
+
+        assert isinstance(self.df_features, DataFrame), '"df_features" is not a spark data frame or Features.'
 
     def _check_is_numerical_data(self):
         """
@@ -45,99 +126,569 @@ class Similarity(object):
         :return:
         """
 
+        if isinstance(self.df_features, Features):
+            assert self.df_features.matrix.dtype.kind in 'iuf'
+            return
+
         columns_to_check = [col[1] for col in self.df_features.dtypes if col[0] != self.index_column]
 
         assert all((col == 'int' or col == 'double') for col in columns_to_check)
 
     def _check_nulls_in_feature_columns(self):
         """
-        Checks there are no nulls in the feature columns.
+        Checks there are no nulls in the feature columns, counting nulls of all columns in a single aggregation.
 
         :return:
         """
 
+        if not self.check_nulls:
+            return
+
+        if isinstance(self.df_features, Features):
+            null_columns = self.df_features.null_columns()
+            assert not null_columns, f'There are null(s) in "{null_columns[0]}".'
+            return
+
+        from spark_utils import count_nulls
+
         columns_to_check = [col for col in self.df_features.columns if col != self.index_column]
-        row_count = self.df_features.count()
+        self.null_report = count_nulls(self.df_features, columns_to_check)
 
         for col in columns_to_check:
-            col_count = self.df_features.filter(f.col(col).isNotNull()).select(col).count()
-
-            assert col_count == row_count, f'There are null(s) in "{col}".'
+            assert self.null_report[col] == 0, f'There are null(s) in "{col}".'
 
     def generate(self):
         """
         Generates similarity scores.
 
+        In top_k mode and for "jaccard_lsh" the wide matrix is not built and None is returned in its place. If
+        similarity_type is a list, the gram matrix is calculated once and a dictionary of similarity type to wide and
+        long similarities is returned.
+
         :return: pandas data frame (wide), pandas data frame (long)
         """
 
-        pd_df_similarity = self.df_features.toPandas()
-        similarity_indexes = pd_df_similarity[self.index_column].tolist()
-        similarity_indexes_with_prefix = [self.index_column+'_'+val for val in similarity_indexes]
-        pd_df_similarity_no_index = pd_df_similarity.drop(columns=[self.index_column])
+        if isinstance(self.similarity_type, list):
+            return self._generate_multiple()
 
-        if self.similarity_type == 'cosine':
-            mat_similarity = cosine_similarity(pd_df_similarity_no_index)
-        elif self.similarity_type == 'euclidean':
-            mat_similarity = euclidean_distances(pd_df_similarity_no_index)
-        else:
-            raise ValueError('Unknown "similarity_type".')
+        with measure(self.metrics, 'collect_features'):
+            features = self._collect_features()
+
+        if self.similarity_type == 'jaccard_lsh' or self.top_k is not None:
+            with measure(self.metrics, 'long'):
+                pd_df_similarity_long = pd.concat(list(self._generate_long_blocks(features)), ignore_index=True)
+            return None, pd_df_similarity_long
+
+        with measure(self.metrics, 'similarity'):
+            mat_similarity = self._calculate_similarity(features.matrix)
+
+        with measure(self.metrics, 'wide'):
+            pd_df_similarity_with_prefix = self._convert_to_wide_format(features, mat_similarity)
+
+        with measure(self.metrics, 'long'):
+            pd_df_similarity_long = pd.concat(list(self._generate_long_blocks(features, mat_similarity)),
+                                              ignore_index=True)
+
+        return pd_df_similarity_with_prefix, pd_df_similarity_long
+
+    def _generate_multiple(self):
+        """
+        Generates wide and long similarities of every similarity type in the list similarity_type from a single gram
+        matrix (or a single gram block per block_size rows in top_k mode).
+
+        :return: dictionary, similarity type to pandas data frame (wide, None in top_k mode), pandas data frame (long)
+        """
+
+        with measure(self.metrics, 'collect_features'):
+            features = self._collect_features()
+            similarities = self._split_similarity_types(features)
+
+        if self.top_k is not None:
+            with measure(self.metrics, 'long'):
+                pd_df_blocks = {similarity_type: [] for similarity_type in similarities}
+                for pd_df_blocks_by_type in self._generate_long_blocks_multiple(features, similarities):
+                    for similarity_type, pd_df_block in pd_df_blocks_by_type.items():
+                        pd_df_blocks[similarity_type].append(pd_df_block)
+
+            return {similarity_type: (None, pd.concat(pd_df_blocks[similarity_type], ignore_index=True))
+                    for similarity_type in similarities}
+
+        with measure(self.metrics, 'similarity'):
+            mat_gram, norms = self._calculate_gram(features.matrix)
+            mat_similarities = {similarity_type: similarity._derive_similarity(mat_gram, norms, norms, is_same=True)
+                                for similarity_type, similarity in similarities.items()}
+            del mat_gram
+
+        with measure(self.metrics, 'wide'):
+            pd_df_wide = {similarity_type: similarity._convert_to_wide_format(features,
+                                                                              mat_similarities[similarity_type])
+                          for similarity_type, similarity in similarities.items()}
+
+        with measure(self.metrics, 'long'):
+            pd_df_long = {similarity_type: pd.concat(list(similarity._generate_long_blocks(
+                features, mat_similarities[similarity_type])), ignore_index=True)
+                for similarity_type, similarity in similarities.items()}
+
+        return {similarity_type: (pd_df_wide[similarity_type], pd_df_long[similarity_type])
+                for similarity_type in similarities}
+
+    def _split_similarity_types(self, features):
+        """
+        Creates a copy of this similarity for every similarity type in the list similarity_type, sharing the random
+        state for tie breaking, and sets quantisation per similarity type.
+
+        :param features: Features
+        :return: dictionary, similarity type to Similarity
+        """
+
+        similarities = {}
+
+        for similarity_type in self.similarity_type:
+            similarity = copy.copy(self)
+            similarity.similarity_type = similarity_type
+            similarity.metrics = None
 
-        pd_df_similarity = pd.DataFrame(mat_similarity,
-                                        index=similarity_indexes,
-                                        columns=similarity_indexes)
-        pd_df_similarity_with_prefix = pd.DataFrame(mat_similarity,
+            if self.precision == 'uint8':
+                similarity._set_quantisation(features.matrix)
+
+            similarities[similarity_type] = similarity
+
+        if self.precision == 'uint8':
+            self.quantisation = {similarity_type: similarity.quantisation
+                                 for similarity_type, similarity in similarities.items()}
+
+        return similarities
+
+    def _convert_to_wide_format(self, features, mat_similarity):
+        """
+        Converts a similarity matrix to a wide data frame with prefixed indexes, in storage precision.
+
+        :param features: Features
+        :param mat_similarity: numpy array
+        :return: pandas data frame
+        """
+
+        similarity_indexes_with_prefix = [self.index_column+'_'+val for val in features.indexes]
+        pd_df_similarity_with_prefix = pd.DataFrame(self._convert_precision(mat_similarity),
                                                     index=similarity_indexes_with_prefix,
                                                     columns=similarity_indexes_with_prefix)
 
-        pd_df_similarity_long = self._convert_to_long_format(pd_df_similarity)
-        pd_with_rank_column = self._add_rank_column(pd_df_similarity_long)
+        return pd_df_similarity_with_prefix
+
+    def generate_long_blocks(self):
+        """
+        Generates similarity scores in long format, block_size indexes at a time.
+
+        Every block holds the ranked similarities of its indexes with all indexes (or their top_k), so blocks can be
+        written to disk one by one and the full long table never has to fit in memory. If similarity_type is a list,
+        every block is a dictionary of similarity type to pandas data frame, calculated from a single gram block.
+
+        :return: generator of pandas data frames
+        """
+
+        features = self._collect_features()
+
+        if isinstance(self.similarity_type, list):
+            pd_df_blocks = self._generate_long_blocks_multiple(features, self._split_similarity_types(features))
+        else:
+            pd_df_blocks = self._generate_long_blocks(features)
+
+        for pd_df_block in pd_df_blocks:
+            yield pd_df_block
+
+    def _collect_features(self):
+        """
+        Collects df_features to the driver, as float32 unless "precision" is "float64".
+
+        :return: Features
+        """
+
+        if isinstance(self.df_features, Features):
+            features = self.df_features
+        else:
+            features = Features.from_spark(self.df_features, index_column=self.index_column, is_sparse=self.is_sparse)
+
+        if self.precision != 'float64':
+            features = Features(indexes=features.indexes,
+                                matrix=features.matrix.astype(np.float32),
+                                columns=features.columns,
+                                index_column=features.index_column)
 
-        return pd_df_similarity_with_prefix, pd_with_rank_column
+        if set(self._similarity_types()) & {'jaccard', 'overlap'}:
+            self._check_is_binary(features.matrix)
 
-    def _convert_to_long_format(self, pd_df_similarity):
+        if self.precision == 'uint8' and not isinstance(self.similarity_type, list):
+            self._set_quantisation(features.matrix)
+
+        return features
+
+    def _similarity_types(self):
+        """
+        Returns similarity_type as a list.
+
+        :return: list of strings
         """
-        Converts wide similarities to long.
 
-        :param pd_df_similarity: pandas data frame
+        if isinstance(self.similarity_type, list):
+            return self.similarity_type
+
+        return [self.similarity_type]
+
+    @staticmethod
+    def _check_is_binary(mat_features):
+        """
+        Checks features only contain 0 and 1, as "jaccard" and "overlap" require.
+
+        :param mat_features: numpy array or scipy sparse matrix
         :return:
         """
 
-        pd_df_similarity_copy = pd_df_similarity.copy(deep=True)
+        values = mat_features.data if sparse.issparse(mat_features) else mat_features
 
-        pd_df_similarity_copy.insert(loc=0, column=self.index_column, value=pd_df_similarity_copy.index)
+        assert np.isin(values, [0, 1]).all(), '"jaccard" and "overlap" require binary features.'
 
-        pd_df_similarity_long = pd.melt(pd_df_similarity_copy,
-                                        id_vars=[self.index_column],
-                                        value_vars=pd_df_similarity_copy.columns.values.tolist()[1:],
-                                        var_name=self.index_column+'_2',
-                                        value_name='similarity')
+    def _set_quantisation(self, mat_features):
+        """
+        Sets scale and offset mapping the range of possible similarities onto uint8 scores 0 to 255.
 
-        pd_df_similarity_long.rename(columns={self.index_column: self.index_column+'_1'}, inplace=True)
+        Similarities are recovered as score * scale + offset.
 
-        return pd_df_similarity_long
+        :param mat_features: numpy array or scipy sparse matrix
+        :return:
+        """
 
-    def _add_rank_column(self, pd_df_similarity_long):
+        if sparse.issparse(mat_features):
+            is_non_negative = mat_features.nnz == 0 or mat_features.data.min() >= 0
+            max_norm = np.sqrt(mat_features.multiply(mat_features).sum(axis=1).max()) if mat_features.shape[0] else 0
+        else:
+            is_non_negative = mat_features.size == 0 or mat_features.min() >= 0
+            max_norm = np.sqrt((mat_features ** 2).sum(axis=1).max()) if mat_features.shape[0] else 0
+
+        if self.similarity_type == 'euclidean':
+            offset, value_range = 0., 2 * float(max_norm)
+        elif self.similarity_type == 'cosine' and not is_non_negative:
+            offset, value_range = -1., 2.
+        else:
+            offset, value_range = 0., 1.
+
+        self.quantisation = {'scale': max(value_range, np.finfo(np.float32).eps) / 255, 'offset': offset}
+
+    def _convert_precision(self, similarities):
         """
-        Adds rank column partitioned by index_column to long format similarities.
+        Converts calculated similarities to "precision" for storage.
 
-        :param pd_df_similarity_long: pandas data frame
-        :return: pandas data frame
+        :param similarities: numpy array
+        :return: numpy array
+        """
+
+        if self.precision != 'uint8':
+            return similarities.astype(self.precision)
+
+        scores = np.round((similarities - self.quantisation['offset']) / self.quantisation['scale'])
+
+        return np.clip(scores, 0, 255).astype(np.uint8)
+
+    def _calculate_similarity(self, mat_features, mat_features_other=None):
+        """
+        Calculates similarities between rows of mat_features and rows of mat_features_other.
+
+        :param mat_features: numpy array or scipy sparse matrix
+        :param mat_features_other: numpy array or scipy sparse matrix, defaults to mat_features
+        :return: numpy array
+        """
+
+        mat_gram, norms = self._calculate_gram(mat_features, mat_features_other)
+        norms_other = norms if mat_features_other is None else self._calculate_squared_norms(mat_features_other)
+
+        return self._derive_similarity(mat_gram, norms, norms_other, is_same=mat_features_other is None)
+
+    def _calculate_gram(self, mat_features, mat_features_other=None):
+        """
+        Calculates dot products between rows of mat_features and rows of mat_features_other, in float32 if features
+        are float32 and in float64 otherwise.
+
+        :param mat_features: numpy array or scipy sparse matrix
+        :param mat_features_other: numpy array or scipy sparse matrix, defaults to mat_features
+        :return: numpy array (gram matrix), numpy array (squared norms of rows of mat_features)
+        """
+
+        dtype = np.float32 if mat_features.dtype == np.float32 else np.float64
+        mat_features = mat_features.astype(dtype, copy=False)
+        mat_features_other = mat_features if mat_features_other is None \
+            else mat_features_other.astype(dtype, copy=False)
+
+        mat_gram = mat_features @ mat_features_other.T
+        mat_gram = mat_gram.toarray() if sparse.issparse(mat_gram) else np.asarray(mat_gram)
+
+        return mat_gram, self._calculate_squared_norms(mat_features)
+
+    @staticmethod
+    def _calculate_squared_norms(mat_features):
+        """
+        Calculates squared euclidean norms of rows, i.e. the number of non zero features of binary rows.
+
+        :param mat_features: numpy array or scipy sparse matrix
+        :return: numpy array
+        """
+
+        dtype = np.float32 if mat_features.dtype == np.float32 else np.float64
+
+        if sparse.issparse(mat_features):
+            mat_features = mat_features.astype(dtype, copy=False)
+            return np.asarray(mat_features.multiply(mat_features).sum(axis=1)).ravel().astype(dtype)
+
+        mat_features = np.asarray(mat_features, dtype=dtype)
+
+        return np.einsum('ij,ij->i', mat_features, mat_features)
+
+    def _derive_similarity(self, mat_gram, norms, norms_other, is_same=False):
+        """
+        Derives similarities of similarity_type from a gram matrix and squared norms of its rows and columns.
+
+        Similarities of empty rows are 0 for "cosine", "jaccard" and "overlap".
+
+        :param mat_gram: numpy array
+        :param norms: numpy array, squared norms of the rows of mat_gram
+        :param norms_other: numpy array, squared norms of the columns of mat_gram
+        :param is_same: boolean, rows and columns are the same features, so the euclidean diagonal is 0
+        :return: numpy array
         """
 
         if self.similarity_type == 'cosine':
-            ascending = False
+            mat_denominator = np.sqrt(norms)[:, None] * np.sqrt(norms_other)[None, :]
         elif self.similarity_type == 'euclidean':
-            ascending = True
+            mat_similarity = np.maximum(norms[:, None] + norms_other[None, :] - 2 * mat_gram, 0)
+            if is_same:
+                np.fill_diagonal(mat_similarity, 0)
+            return np.sqrt(mat_similarity)
+        elif self.similarity_type == 'jaccard':
+            mat_denominator = norms[:, None] + norms_other[None, :] - mat_gram
+        elif self.similarity_type == 'overlap':
+            mat_denominator = np.minimum(norms[:, None], norms_other[None, :])
+        else:
+            raise ValueError('Unknown "similarity_type".')
 
-        pd_df_similarity_long['rand'] = np.random.randint(100, size=pd_df_similarity_long.shape[0])
+        return np.divide(mat_gram, mat_denominator, out=np.zeros_like(mat_gram), where=mat_denominator > 0)
 
-        pd_df_similarity_long['rank'] = pd_df_similarity_long\
-                                            .sort_values(['similarity', 'rand'], ascending=[ascending, True])\
-                                            .groupby([self.index_column+'_1'])\
-                                            .cumcount() + 1
+    def _is_ascending(self):
+        """
+        Returns sort direction of similarity scores, best scores first.
 
-        pd_df_similarity_long = pd_df_similarity_long.drop(columns=['rand'])
+        :return: boolean
+        """
+
+        if self.similarity_type in ['cosine', 'jaccard', 'overlap', 'jaccard_lsh']:
+            return False
+        elif self.similarity_type == 'euclidean':
+            return True
+        else:
+            raise ValueError('Unknown "similarity_type".')
+
+    def _generate_long_blocks(self, features, mat_similarity=None):
+        """
+        Generates ranked long similarities block_size rows at a time, keeping the top_k per index if set.
+
+        Similarities are calculated per block unless mat_similarity is given, so peak memory is bounded by
+        block_size x number of indexes.
+
+        :param features: Features
+        :param mat_similarity: numpy array, precalculated similarities of all indexes
+        :return: generator of pandas data frames
+        """
+
+        similarity_indexes = self._long_indexes(features)
+
+        if self.similarity_type == 'jaccard_lsh':
+            yield self._generate_lsh(similarity_indexes, features.matrix)
+            return
+
+        if self.n_jobs != 1:
+            engine = ParallelEngine(self, n_jobs=self.n_jobs, blas_threads=self.blas_threads)
+            yield from engine.generate_long_blocks(features, mat_similarity)
+            return
+
+        row_count = len(similarity_indexes)
+        top_k = row_count if self.top_k is None else min(self.top_k, row_count)
+
+        for start in range(0, row_count, self.block_size):
+            stop = min(start + self.block_size, row_count)
+
+            if mat_similarity is None:
+                mat_block = self._calculate_similarity(features.matrix[start:stop], features.matrix)
+            else:
+                mat_block = mat_similarity[start:stop]
+
+            yield self._create_long_block(similarity_indexes[start:stop], similarity_indexes, mat_block, top_k)
+
+    def _generate_long_blocks_multiple(self, features, similarities):
+        """
+        Generates ranked long similarities of several similarity types block_size rows at a time, deriving all of
+        them from a single gram block.
+
+        :param features: Features
+        :param similarities: dictionary, similarity type to Similarity, see _split_similarity_types
+        :return: generator of dictionaries, similarity type to pandas data frame
+        """
+
+        if self.n_jobs != 1:
+            engine = ParallelEngine(self, n_jobs=self.n_jobs, blas_threads=self.blas_threads)
+            yield from engine.generate_long_blocks(features, similarities=similarities)
+            return
+
+        similarity_indexes = self._long_indexes(features)
+        row_count = len(similarity_indexes)
+        top_k = row_count if self.top_k is None else min(self.top_k, row_count)
+        norms = self._calculate_squared_norms(features.matrix)
+
+        for start in range(0, row_count, self.block_size):
+            stop = min(start + self.block_size, row_count)
+            mat_gram, _ = self._calculate_gram(features.matrix[start:stop], features.matrix)
+
+            yield {similarity_type: similarity._create_long_block(
+                similarity_indexes[start:stop], similarity_indexes,
+                similarity._derive_similarity(mat_gram, norms[start:stop], norms), top_k)
+                for similarity_type, similarity in similarities.items()}
+
+    def _long_indexes(self, features):
+        """
+        Returns the indexes written to long similarities, int32 row codes if encode_ids.
+
+        :param features: Features
+        :return: numpy array
+        """
+
+        if self.encode_ids:
+            return np.arange(len(features.indexes), dtype=np.int32)
+
+        return features.indexes
+
+    def _create_long_block(self, block_indexes, similarity_indexes, mat_block, top_k):
+        """
+        Ranks a similarity block and converts its top_k per row to long format.
+
+        :param block_indexes: numpy array, indexes of the rows of mat_block
+        :param similarity_indexes: numpy array, indexes of the columns of mat_block
+        :param mat_block: numpy array
+        :param top_k: int
+        :return: pandas data frame
+        """
+
+        mat_order = self._rank_block(mat_block, top_k)
+
+        pd_df_block = pd.DataFrame({
+            self.index_column+'_1': np.repeat(block_indexes, top_k),
+            self.index_column+'_2': similarity_indexes[mat_order].ravel(),
+            'similarity': self._convert_precision(np.take_along_axis(mat_block, mat_order, axis=1).ravel()),
+            'rank': np.tile(np.arange(1, top_k + 1), len(block_indexes))
+        })
+
+        return pd_df_block
+
+    def _generate_lsh(self, similarity_indexes, mat_features):
+        """
+        Generates jaccard similarities in long format for candidate pairs found by minhash lsh and for every index
+        with itself. Pairs that are not candidates are left out.
+
+        :param similarity_indexes: numpy array of strings (or int32 row codes)
+        :param mat_features: numpy array or scipy sparse csr matrix
+        :return: pandas data frame
+        """
+
+        lsh = MinHashLSH(num_bands=self.num_bands, rows_per_band=self.rows_per_band, seed=self.seed)
+
+        candidates_1, candidates_2 = lsh.candidate_pairs(mat_features)
+        candidate_similarities = jaccard_similarity_pairs(mat_features, candidates_1, candidates_2)
+
+        self_rows = np.arange(len(similarity_indexes))
+        self_similarities = jaccard_similarity_pairs(mat_features, self_rows, self_rows)
+
+        rows_1 = np.concatenate([candidates_1, candidates_2, self_rows])
+        rows_2 = np.concatenate([candidates_2, candidates_1, self_rows])
+        similarities = np.concatenate([candidate_similarities, candidate_similarities, self_similarities])
+
+        order, ranks = self._rank_pairs(rows_1, similarities)
+
+        pd_df_similarity_long = pd.DataFrame({
+            self.index_column+'_1': similarity_indexes[rows_1[order]],
+            self.index_column+'_2': similarity_indexes[rows_2[order]],
+            'similarity': self._convert_precision(similarities[order]),
+            'rank': ranks
+        })
+
+        if self.top_k is not None:
+            pd_df_similarity_long = pd_df_similarity_long\
+                .loc[pd_df_similarity_long['rank'] <= self.top_k]\
+                .reset_index(drop=True)
 
         return pd_df_similarity_long
 
+    def _rank_pairs(self, rows_1, similarities):
+        """
+        Ranks pairs partitioned by rows_1, ties are broken randomly.
+
+        :param rows_1: numpy array of ints
+        :param similarities: numpy array
+        :return: numpy array of positions sorted by rows_1 and rank, numpy array of ranks in that order
+        """
+
+        key = similarities if self._is_ascending() else -similarities
+        rand = self._random_state.randint(100, size=len(similarities))
+
+        order = np.lexsort((rand, key, rows_1))
+        sorted_rows_1 = rows_1[order]
+
+        group_starts = np.flatnonzero(np.r_[True, sorted_rows_1[1:] != sorted_rows_1[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(order)])
+        ranks = np.arange(len(order)) - np.repeat(group_starts, group_sizes) + 1
+
+        return order, ranks
+
+    def evaluate_lsh(self, sample_size=1000, similarity_threshold=0.5):
+        """
+        Reports recall and speed of "jaccard_lsh" against exact jaccard similarities on a sample of indexes.
+
+        :param sample_size: int
+        :param similarity_threshold: float, pairs with exact similarity of at least this are expected to be found
+        :return: pandas data frame with one row
+        """
+
+        features = self._collect_features()
+        lsh = MinHashLSH(num_bands=self.num_bands, rows_per_band=self.rows_per_band, seed=self.seed)
+
+        pd_df_report = lsh.evaluate(features.matrix,
+                                    sample_size=sample_size,
+                                    similarity_threshold=similarity_threshold)
+
+        return pd_df_report
+
+    def _rank_block(self, mat_block, top_k):
+        """
+        Returns column positions of the top_k scores per row of a similarity block, best first.
+
+        Ties are broken randomly. Only the candidates tied with or better than the top_k-th score are sorted.
+
+        :param mat_block: numpy array
+        :param top_k: int
+        :return: numpy array of shape (rows, top_k)
+        """
+
+        mat_key = mat_block if self._is_ascending() else -mat_block
+        mat_rand = self._random_state.randint(100, size=mat_block.shape)
+        mat_candidates = None
+
+        if top_k < mat_block.shape[1]:
+            mat_kth = np.partition(mat_key, top_k - 1, axis=1)[:, [top_k - 1]]
+            mat_is_candidate = mat_key <= mat_kth
+            width = mat_is_candidate.sum(axis=1).max()
+
+            if width < mat_block.shape[1]:
+                mat_candidates = np.argpartition(~mat_is_candidate, width - 1, axis=1)[:, :width]
+                mat_key = np.take_along_axis(mat_key, mat_candidates, axis=1)
+                mat_rand = np.take_along_axis(mat_rand, mat_candidates, axis=1)
+
+        mat_order = np.lexsort((mat_rand, mat_key), axis=1)[:, :top_k]
+
+        if mat_candidates is not None:
+            mat_order = np.take_along_axis(mat_candidates, mat_order, axis=1)
+
+        return mat_order
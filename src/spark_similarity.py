@@ -0,0 +1,125 @@
+from pyspark.sql import DataFrame
+import pyspark.sql.functions as f
+from pyspark.sql import Window
+
+from similarity import Similarity
+
+
+class SparkSimilarity(Similarity):
+    """
+    Class to generate similarity scores on spark executors.
+
+    """
+
+    def __init__(self, df_features, index_column='recipe_id', similarity_type='cosine', top_k=None, check_nulls=True,
+                 seed=None, num_partitions=None):
+        """
+        Performs the same checks as Similarity, df_features has to be a spark data frame.
+
+        :param df_features: spark data frame, contains labels in first column and int features in remaining
+        :param index_column: string
+        :param similarity_type: string, "cosine" or "euclidean"
+        :param top_k: int, if set only the top_k neighbours per index are kept
+        :param check_nulls: boolean, set to False when df_features comes from Preprocess
+        :param seed: int, seed of the random tie breaking between equal similarities
+        :param num_partitions: int, number of partitions of each side of the self join, defaults to spark's choice
+        """
+
+        super(SparkSimilarity, self).__init__(df_features=df_features,
+                                              index_column=index_column,
+                                              similarity_type=similarity_type,
+                                              top_k=top_k,
+                                              check_nulls=check_nulls,
+                                              seed=seed)
+        self.num_partitions = num_partitions
+
+        assert isinstance(self.df_features, DataFrame), '"df_features" is not a spark data frame.'
+
+    def generate(self):
+        """
+        Generates similarity scores in long format with a self join of feature vectors on the executors.
+
+        Nothing is collected to the driver, the result is meant to be written by the executors.
+
+        :return: spark data frame with index_column+'_1', index_column+'_2', similarity and rank columns
+        """
+
+        similarity_expression = self._similarity_expression()
+
+        df_vectors = self._create_vectors()
+        if self.num_partitions is not None:
+            df_vectors = df_vectors.repartition(self.num_partitions)
+
+        df_vectors_1 = df_vectors.select(f.col(self.index_column).alias(self.index_column+'_1'),
+                                         f.col('features').alias('features_1'))
+        df_vectors_2 = df_vectors.select(f.col(self.index_column).alias(self.index_column+'_2'),
+                                         f.col('features').alias('features_2'))
+
+        df_similarity_long = df_vectors_1\
+            .crossJoin(df_vectors_2)\
+            .select(self.index_column+'_1', self.index_column+'_2', similarity_expression.alias('similarity'))
+
+        df_similarity_long = self._add_rank_column_spark(df_similarity_long)
+
+        if self.top_k is not None:
+            df_similarity_long = df_similarity_long.filter(f.col('rank') <= self.top_k)
+
+        return df_similarity_long
+
+    def _create_vectors(self):
+        """
+        Collects feature columns into one array column "features", normalised to unit length for cosine similarity.
+
+        Rows with zero length are left as zero vectors and get a cosine similarity of 0, as in sklearn.
+
+        :return: spark data frame with index_column and features columns
+        """
+
+        feature_columns = [col for col in self.df_features.columns if col != self.index_column]
+
+        df_vectors = self.df_features.select(
+            f.col(self.index_column),
+            f.array(*[f.col(col).cast('double') for col in feature_columns]).alias('features'))
+
+        if self.similarity_type == 'cosine':
+            df_vectors = df_vectors\
+                .withColumn('norm', f.expr('sqrt(aggregate(features, 0D, (acc, x) -> acc + x * x))'))\
+                .withColumn('features', f.expr('transform(features, x -> x / IF(norm = 0, 1D, norm))'))\
+                .drop('norm')
+
+        return df_vectors
+
+    def _similarity_expression(self):
+        """
+        Builds the native expression scoring a pair of "features_1" and "features_2" arrays.
+
+        :return: spark column
+        """
+
+        if self.similarity_type == 'cosine':
+            expression = 'aggregate(zip_with(features_1, features_2, (x, y) -> x * y), 0D, (acc, x) -> acc + x)'
+        elif self.similarity_type == 'euclidean':
+            expression = 'sqrt(aggregate(zip_with(features_1, features_2, (x, y) -> (x - y) * (x - y)), 0D, ' \
+                         '(acc, x) -> acc + x))'
+        else:
+            raise ValueError('Unknown "similarity_type".')
+
+        return f.expr(expression)
+
+    def _add_rank_column_spark(self, df_similarity_long):
+        """
+        Adds rank column partitioned by index_column+'_1', ties are broken randomly.
+
+        :param df_similarity_long: spark data frame
+        :return: spark data frame
+        """
+
+        similarity_order = f.col('similarity').asc() if self._is_ascending() else f.col('similarity').desc()
+
+        window = Window\
+            .partitionBy(self.index_column+'_1')\
+            .orderBy(similarity_order, f.rand(self.seed))
+
+        df_with_rank_column = df_similarity_long.withColumn('rank', f.row_number().over(window))
+
+        return df_with_rank_column
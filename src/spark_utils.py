@@ -1,4 +1,5 @@
 from pyspark.sql import SparkSession
+import pyspark.sql.functions as f
 
 
 def create_spark_session(name):
@@ -16,3 +17,42 @@ def create_spark_session(name):
         .getOrCreate()
     return spark
 
+
+def count_nulls(df, columns):
+    """
+    Counts nulls of every column in a single aggregation.
+
+    :param df: spark data frame
+    :param columns: list of strings
+    :return: dictionary, column name to null count
+    """
+
+    if not columns:
+        return {}
+
+    row = df\
+        .agg(*[f.coalesce(f.sum(f.col(col).isNull().cast('int')), f.lit(0)).alias(str(position))
+               for position, col in enumerate(columns)])\
+        .collect()[0]
+
+    null_report = {col: row[position] for position, col in enumerate(columns)}
+
+    return null_report
+
+
+def count_duplicates(df, column):
+    """
+    Counts rows repeating a value of column that is already held by another row, in a single aggregation.
+
+    Only the distinct values of column are shuffled, not whole rows.
+
+    :param df: spark data frame
+    :param column: string
+    :return: int, number of rows minus number of distinct values
+    """
+
+    row = df\
+        .agg(f.count(f.lit(1)).alias('row_count'), f.countDistinct(f.col(column)).alias('distinct_count'))\
+        .collect()[0]
+
+    return row['row_count'] - row['distinct_count']
@@ -0,0 +1,69 @@
+from labels import COUNTRY_LABELS
+
+import pandas as pd
+import numpy as np
+
+
+def generate_labels(row_count, column_count=3, cardinality=10, index_column='recipe_id', na_share=0., seed=None):
+    """
+    Generates a synthetic label table in the shape of recipe_info.csv.
+
+    The first attribute column is "country" with labels drawn from COUNTRY_LABELS (padded with "Country {n}" beyond
+    those), the others are "attribute_{n}" with labels "Label {n}", so preprocessing has whitespaces, upper case and
+    country labels to normalise.
+
+    :param row_count: int
+    :param column_count: int, number of attribute columns
+    :param cardinality: int, number of distinct labels per attribute column
+    :param index_column: string
+    :param na_share: float, share of labels replaced with "#N/A"
+    :param seed: int
+    :return: pandas data frame of strings
+    """
+
+    assert column_count > 0, '"column_count" has to be positive.'
+    assert cardinality > 0, '"cardinality" has to be positive.'
+
+    random_state = np.random.RandomState(seed)
+    countries = sorted(set(COUNTRY_LABELS) | set(COUNTRY_LABELS.values()))
+    countries = np.array(countries + [f'Country {label}' for label in range(len(countries), cardinality)], dtype=object)
+
+    pd_df_labels = pd.DataFrame({index_column: np.arange(1, row_count + 1).astype(str)})
+
+    for position in range(column_count):
+        if position == 0:
+            col = 'country'
+            labels = countries[:cardinality]
+        else:
+            col = f'attribute_{position}'
+            labels = np.array([f'Label {label}' for label in range(cardinality)], dtype=object)
+
+        values = labels[random_state.randint(0, len(labels), size=row_count)]
+        values[random_state.rand(row_count) < na_share] = '#N/A'
+        pd_df_labels[col] = values
+
+    return pd_df_labels
+
+
+def write_labels(path, row_count, column_count=3, cardinality=10, index_column='recipe_id', na_share=0., seed=None):
+    """
+    Writes a synthetic label table to a csv file, see generate_labels.
+
+    :param path: string
+    :param row_count: int
+    :param column_count: int
+    :param cardinality: int
+    :param index_column: string
+    :param na_share: float
+    :param seed: int
+    :return: string, path
+    """
+
+    generate_labels(row_count=row_count,
+                    column_count=column_count,
+                    cardinality=cardinality,
+                    index_column=index_column,
+                    na_share=na_share,
+                    seed=seed).to_csv(path, index=False)
+
+    return path
@@ -0,0 +1,100 @@
+import unittest
+
+from features import Features
+from similarity import Similarity
+from synthetic import generate_labels
+from attribute_gram import AttributeGrams
+
+import pandas as pd
+import numpy as np
+
+import os
+import tempfile
+
+
+class TestAttributeGrams(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        self.pd_df_labels = generate_labels(row_count=40, column_count=3, cardinality=4, seed=0)
+        self.columns = ['country', 'attribute_1', 'attribute_2']
+        self.features = Features.from_labels(self.pd_df_labels, columns=self.columns)
+        self.vocabulary = {col: sorted(self.pd_df_labels[col].unique()) for col in self.columns}
+
+        self.grams = AttributeGrams.build(self.features, self.vocabulary, f'{self.temp_dir.name}/grams', block_size=7)
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_build(self):
+
+        self.assertEqual(self.grams.columns, self.columns)
+        self.assertEqual(self.grams.grams.shape, (3, 40, 40))
+        self.assertEqual(self.grams.grams.dtype, np.uint8)
+        self.assertIsInstance(self.grams.grams, np.memmap)
+
+        mat_features = self.features.matrix.toarray()
+        np.testing.assert_array_equal(self.grams.combine(), mat_features @ mat_features.T)
+
+        with self.assertRaises(AssertionError):
+            AttributeGrams.build(self.features, {'country': self.vocabulary['country']},
+                                 f'{self.temp_dir.name}/missing')
+
+        with self.assertRaises(AssertionError) as context:
+            AttributeGrams.build(self.features, self.vocabulary, f'{self.temp_dir.name}/too_large',
+                                 max_bytes=3 * 40 * 40 - 1)
+        self.assertIn('max_bytes', str(context.exception))
+        self.assertFalse(os.path.exists(f'{self.temp_dir.name}/too_large/grams.npy'))
+
+        with self.assertRaises(AssertionError):
+            AttributeGrams._check_size(2 ** 62, self.temp_dir.name)
+
+    def test_generate_columns(self):
+
+        features = Features.from_labels(self.pd_df_labels, columns=['country', 'attribute_2'])
+
+        for similarity_type in ['cosine', 'euclidean', 'jaccard', 'overlap']:
+            pd_df_wide_expected, pd_df_long_expected = Similarity(df_features=features,
+                                                                  similarity_type=similarity_type,
+                                                                  seed=0).generate()
+            pd_df_wide, pd_df_long = self.grams.generate(columns=['country', 'attribute_2'],
+                                                         similarity_type=similarity_type,
+                                                         seed=0)
+
+            pd.testing.assert_frame_equal(pd_df_wide, pd_df_wide_expected)
+            pd.testing.assert_frame_equal(pd_df_long, pd_df_long_expected)
+
+    def test_generate_weights(self):
+
+        matrix = self.features.matrix.toarray().astype(np.float64)
+        matrix[:, [col.startswith('country_') for col in self.features.columns]] *= 2
+        features = Features(indexes=self.features.indexes, matrix=matrix, columns=self.features.columns)
+
+        pd_df_wide_expected, _ = Similarity(df_features=features, similarity_type='euclidean', seed=0).generate()
+        pd_df_wide, _ = self.grams.generate(weights={'country': 4}, similarity_type='euclidean', seed=0)
+
+        np.testing.assert_allclose(pd_df_wide.values, pd_df_wide_expected.values, atol=1e-12)
+
+        with self.assertRaises(AssertionError):
+            self.grams.generate(weights={'unknown': 1})
+        with self.assertRaises(AssertionError):
+            self.grams.generate(weights={'country': -1})
+
+    def test_generate_top_k(self):
+
+        features = Features.from_labels(self.pd_df_labels, columns=['attribute_1', 'attribute_2'])
+
+        _, pd_df_long_expected = Similarity(df_features=features, top_k=5, block_size=7, precision='uint8',
+                                            seed=0).generate()
+        pd_df_wide, pd_df_long = self.grams.generate(columns=['attribute_1', 'attribute_2'], top_k=5, block_size=7,
+                                                     precision='uint8', seed=0)
+
+        self.assertIsNone(pd_df_wide)
+        pd.testing.assert_frame_equal(pd_df_long, pd_df_long_expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+from tests import PySparkTestCase
+
+from benchmark import run_benchmark
+from benchmark import write_results
+from benchmark import STAGES
+
+import json
+import tempfile
+
+
+class TestBenchmark(PySparkTestCase):
+
+    def test_run_benchmark(self):
+
+        records = run_benchmark(self.spark, row_count=50, column_count=2, cardinality=4, top_k=5)
+
+        self.assertEqual([record['stage'] for record in records], STAGES)
+        for record in records:
+            self.assertEqual(record['rows'], 50)
+            self.assertGreaterEqual(record['seconds'], 0)
+            self.assertGreater(record['peak_rss_mb'], 0)
+        self.assertGreater(records[STAGES.index('preprocess')]['spark_jobs'], 0)
+        self.assertEqual(records[STAGES.index('similarity')]['spark_jobs'], 0)
+        self.assertEqual(len(self.spark.sparkContext._jsc.getPersistentRDDs()), 0)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = write_results(records, f'{temp_dir}/results.jsonl')
+            write_results(records, path)
+
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+
+        self.assertEqual(len(lines), 2 * len(STAGES))
+        self.assertEqual(set(lines[0]) - set(records[0]), {'commit', 'created'})
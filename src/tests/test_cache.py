@@ -0,0 +1,85 @@
+import unittest
+
+from features import Features
+from cache import FeatureCache
+
+import pandas as pd
+import numpy as np
+
+import os
+import shutil
+import tempfile
+
+
+class TestFeatureCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = f'{self.temp_dir.name}/cache'
+        self.input_path = f'{self.temp_dir.name}/recipe_info.csv'
+        shutil.copy('tests/fixtures/preprocess/long.csv', self.input_path)
+
+        pd_df_labels = pd.read_csv(self.input_path, dtype=str, encoding='utf-8-sig')
+        self.columns = ['country', 'protein', 'prep_time']
+        self.features = Features.from_labels(pd_df_labels, columns=self.columns)
+        self.vocabulary = {col: sorted(pd_df_labels[col].unique()) for col in self.columns}
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_create_key(self):
+
+        key = FeatureCache.create_key(self.input_path, columns='all', index_column='recipe_id')
+
+        self.assertEqual(key, FeatureCache.create_key(self.input_path, index_column='recipe_id', columns='all'))
+        self.assertNotEqual(key, FeatureCache.create_key(self.input_path, columns=['country'],
+                                                         index_column='recipe_id'))
+
+        with open(self.input_path, 'a') as file:
+            file.write('99,japan,fish,40\n')
+        self.assertNotEqual(key, FeatureCache.create_key(self.input_path, columns='all', index_column='recipe_id'))
+
+    def test_save_load(self):
+
+        feature_cache = FeatureCache(cache_dir=self.cache_dir)
+        self.assertIsNone(feature_cache.load('missing'))
+
+        dense_features = Features(indexes=self.features.indexes,
+                                  matrix=self.features.matrix.toarray().astype(np.int32),
+                                  columns=self.features.columns)
+
+        for key, features in [('sparse', self.features), ('dense', dense_features)]:
+            feature_cache.save(key, features, self.vocabulary)
+            features_loaded, vocabulary = feature_cache.load(key)
+
+            self.assertEqual(features_loaded.is_sparse, features.is_sparse)
+            self.assertEqual(vocabulary, self.vocabulary)
+            pd.testing.assert_frame_equal(features_loaded.to_pandas(), features.to_pandas())
+
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['dense', 'sparse'])
+
+    def test_evict(self):
+
+        feature_cache = FeatureCache(cache_dir=self.cache_dir, max_entries=2)
+
+        for position, key in enumerate(['first', 'second']):
+            feature_cache.save(key, self.features)
+            os.utime(f'{self.cache_dir}/{key}/meta.json', (position, position))
+
+        feature_cache.load('first')
+        feature_cache.save('third', self.features)
+
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['first', 'third'])
+
+        entry_bytes = sum(os.path.getsize(f'{self.cache_dir}/third/{file_name}')
+                          for file_name in os.listdir(f'{self.cache_dir}/third'))
+        os.utime(f'{self.cache_dir}/first/meta.json', (10, 10))
+        os.utime(f'{self.cache_dir}/third/meta.json', (20, 20))
+        feature_cache.max_bytes = entry_bytes
+        self.assertEqual(feature_cache.evict(), ['first'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+
+from tests import PySparkTestCase
+
+from features import Features
+
+from scipy import sparse
+
+import pandas as pd
+import numpy as np
+
+
+class TestFeatures(unittest.TestCase):
+
+    def test__check_shape(self):
+
+        Features(indexes=['1', '2'], matrix=np.zeros((2, 3)), columns=['a', 'b', 'c'])
+
+        with self.assertRaises(AssertionError):
+            Features(indexes=['1', '2'], matrix=np.zeros((2, 3)), columns=['a', 'b'])
+
+    def test_from_labels(self):
+
+        pd_df_labels = pd.read_csv('tests/fixtures/preprocess/long.csv', dtype=str, encoding='utf-8-sig')
+
+        features = Features.from_labels(pd_df_labels=pd_df_labels, columns=['country', 'protein'])
+
+        self.assertTrue(features.is_sparse)
+        self.assertEqual(features.matrix.shape, (pd_df_labels.shape[0], 4+4))
+        self.assertEqual(features.columns[:4], ['country_france', 'country_great_britain', 'country_italy',
+                                                'country_lebanon'])
+        self.assertEqual(features.matrix.sum(axis=1).max(), 2)
+        self.assertEqual(features.matrix.sum(), pd_df_labels.shape[0]*2)
+
+        pd_df_features = features.to_pandas()
+        check_recipe_2 = pd_df_features.loc[pd_df_features['recipe_id'] == '2']
+        self.assertEqual(check_recipe_2['country_france'].values[0], 1)
+        self.assertEqual(check_recipe_2['country_italy'].values[0], 0)
+
+        features_no_columns = Features.from_labels(pd_df_labels=pd_df_labels, columns=[])
+        self.assertEqual(features_no_columns.matrix.shape, (pd_df_labels.shape[0], 0))
+
+    def test_from_pandas(self):
+
+        pd_df_features = pd.read_csv('tests/fixtures/similarity/features.csv', dtype={'recipe_id': str},
+                                     encoding='utf-8-sig')
+
+        features_sparse = Features.from_pandas(pd_df_features)
+        features_dense = Features.from_pandas(pd_df_features, is_sparse=False)
+
+        self.assertTrue(sparse.issparse(features_sparse.matrix))
+        self.assertFalse(sparse.issparse(features_dense.matrix))
+        self.assertEqual(features_sparse.columns, ['col_1', 'col_2', 'col_3'])
+        self.assertTrue(features_sparse.to_pandas().equals(features_dense.to_pandas()))
+
+        pd_df_blocks = list(features_sparse.to_pandas_blocks(block_size=2))
+        self.assertEqual(len(pd_df_blocks), int(np.ceil(pd_df_features.shape[0] / 2)))
+        self.assertTrue(max(pd_df_block.shape[0] for pd_df_block in pd_df_blocks) <= 2)
+        pd.testing.assert_frame_equal(pd.concat(pd_df_blocks, ignore_index=True), features_dense.to_pandas())
+        self.assertAlmostEqual(features_sparse.density, features_dense.density)
+
+    def test_null_columns(self):
+
+        pd_df_nulls = pd.read_csv('tests/fixtures/similarity/nulls_features.csv', dtype={'recipe_id': str},
+                                  encoding='utf-8-sig')
+        pd_df_no_nulls = pd.read_csv('tests/fixtures/similarity/no_nulls_features.csv', dtype={'recipe_id': str},
+                                     encoding='utf-8-sig')
+
+        self.assertEqual(Features.from_pandas(pd_df_nulls).null_columns(), ['col_2'])
+        self.assertEqual(Features.from_pandas(pd_df_nulls, is_sparse=False).null_columns(), ['col_2'])
+        self.assertEqual(Features.from_pandas(pd_df_no_nulls).null_columns(), [])
+
+
+class TestFeaturesFromSpark(PySparkTestCase):
+
+    def test_from_spark(self):
+
+        pd_df_features = pd.read_csv('tests/fixtures/similarity/features.csv', dtype={'recipe_id': str},
+                                     encoding='utf-8-sig')
+        pd_df_features['col_3'] = pd_df_features['col_3'] * 0.5
+        df_features = self.spark.createDataFrame(pd_df_features)
+
+        for is_sparse in [True, False]:
+            features_expected = Features.from_pandas(pd_df_features, is_sparse=is_sparse)
+            features = Features.from_spark(df_features, is_sparse=is_sparse, batch_size=2, partition_rows=3)
+
+            self.assertEqual(sparse.issparse(features.matrix), is_sparse)
+            self.assertEqual(features.columns, features_expected.columns)
+            self.assertEqual(features.matrix.dtype, np.float64)
+            pd.testing.assert_frame_equal(features.to_pandas().sort_values('recipe_id').reset_index(drop=True),
+                                          features_expected.to_pandas().sort_values('recipe_id').reset_index(drop=True))
+
+    def test_from_spark_integer(self):
+
+        pd_df_features = pd.DataFrame({'recipe_id': [1, 2, 3, 4],
+                                       'country_france': [1, 0, 0, 1],
+                                       'country_italy': [0, 1, 0, 0],
+                                       'is_vegan': [True, False, False, True]})
+        df_features = self.spark.createDataFrame(pd_df_features).repartition(3)
+
+        features = Features.from_spark(df_features, is_sparse=False, batch_size=1, partition_rows=2)
+        order = np.argsort(features.indexes)
+
+        self.assertEqual(features.matrix.dtype, np.int8)
+        self.assertEqual(features.indexes[order].tolist(), ['1', '2', '3', '4'])
+        np.testing.assert_array_equal(features.matrix[order], pd_df_features.iloc[:, 1:].values.astype(np.int8))
+
+        features_sparse = Features.from_spark(df_features)
+        self.assertEqual(features_sparse.matrix.nnz, 5)
+
+        df_large_values = self.spark.createDataFrame(pd.DataFrame({'recipe_id': ['1', '2', '3'],
+                                                                   'count': [1, 0, 300]})).coalesce(1)
+        for is_sparse in [True, False]:
+            features_large_values = Features.from_spark(df_large_values, is_sparse=is_sparse, batch_size=2)
+            matrix = features_large_values.matrix.toarray() if is_sparse else features_large_values.matrix
+            self.assertEqual(matrix.dtype, np.int64)
+            np.testing.assert_array_equal(matrix.ravel(), [1, 0, 300])
@@ -0,0 +1,93 @@
+import unittest
+
+from features import Features
+from similarity import Similarity
+from incremental import IncrementalSimilarity
+
+import pandas as pd
+import numpy as np
+
+import os
+import tempfile
+
+
+class TestIncrementalSimilarity(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.previous_dir = self.temp_dir.name
+
+        pd_df_labels_previous = pd.read_csv('tests/fixtures/preprocess/long.csv', dtype=str, encoding='utf-8-sig')
+        self.columns = ['country', 'protein', 'prep_time']
+
+        pd_df_labels_current = pd_df_labels_previous.copy()
+        pd_df_labels_current = pd_df_labels_current.loc[pd_df_labels_current['recipe_id'] != '1']
+        pd_df_labels_current.loc[pd_df_labels_current['recipe_id'] == '3', 'protein'] = 'meat'
+        pd_df_labels_current = pd.concat([pd_df_labels_current,
+                                          pd.DataFrame([['7', 'japan', 'fish', '40']],
+                                                       columns=pd_df_labels_current.columns)])
+
+        self.features_previous = Features.from_labels(pd_df_labels_previous, columns=self.columns)
+        self.features_current = Features.from_labels(pd_df_labels_current.reset_index(drop=True), columns=self.columns)
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def _write_previous_run(self, top_k):
+
+        os.makedirs(f'{self.previous_dir}/features', exist_ok=True)
+        os.makedirs(f'{self.previous_dir}/similarities', exist_ok=True)
+
+        self.features_previous.to_pandas().to_csv(f'{self.previous_dir}/features/features.csv', index=False)
+
+        _, pd_df_similarity_long = Similarity(df_features=self.features_previous, top_k=top_k).generate()
+        pd_df_similarity_long.to_csv(f'{self.previous_dir}/similarities/similarities_long.csv', index=False)
+
+    def test_detect_changes(self):
+
+        self._write_previous_run(top_k=None)
+
+        incremental = IncrementalSimilarity(features=self.features_current, previous_dir=self.previous_dir)
+        changes = incremental.detect_changes()
+
+        self.assertEqual(changes['added'], ['7'])
+        self.assertEqual(changes['removed'], ['1'])
+        self.assertEqual(changes['changed'], ['3'])
+
+    def test_generate(self):
+
+        for top_k in [None, 2]:
+            self._write_previous_run(top_k=top_k)
+
+            incremental = IncrementalSimilarity(features=self.features_current,
+                                                previous_dir=self.previous_dir,
+                                                top_k=top_k)
+            pd_df_similarity_wide, pd_df_similarity_long = incremental.generate()
+
+            _, pd_df_expected = Similarity(df_features=self.features_current, top_k=top_k).generate()
+
+            self.assertIsNone(pd_df_similarity_wide)
+            self.assertEqual(pd_df_similarity_long.shape[0], pd_df_expected.shape[0])
+
+            for recipe_id, pd_df_group in pd_df_similarity_long.groupby('recipe_id_1'):
+                pd_df_expected_group = pd_df_expected.loc[pd_df_expected['recipe_id_1'] == recipe_id]
+
+                self.assertEqual(pd_df_group['rank'].tolist(), list(range(1, pd_df_group.shape[0] + 1)))
+                self.assertEqual(np.round(pd_df_group['similarity'].values, 6).tolist(),
+                                 np.round(pd_df_expected_group.sort_values('rank')['similarity'].values, 6).tolist())
+
+            if top_k is None:
+                pd_df_check = pd_df_similarity_long.merge(pd_df_expected, on=['recipe_id_1', 'recipe_id_2'])
+                self.assertEqual(pd_df_check.shape[0], pd_df_expected.shape[0])
+                self.assertTrue(np.allclose(pd_df_check['similarity_x'], pd_df_check['similarity_y']))
+
+    def test__check_similarity_type(self):
+
+        self._write_previous_run(top_k=None)
+
+        with self.assertRaises(ValueError):
+            IncrementalSimilarity(features=self.features_current,
+                                  previous_dir=self.previous_dir,
+                                  similarity_type='jaccard_lsh')
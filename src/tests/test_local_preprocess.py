@@ -0,0 +1,94 @@
+from tests import PySparkTestCase
+
+from preprocess import Preprocess
+from local_preprocess import LocalPreprocess
+from local_preprocess import read_labels
+from local_preprocess import count_rows
+
+import pandas as pd
+import numpy as np
+
+import subprocess
+import sys
+import tempfile
+
+
+class TestLocalPreprocess(PySparkTestCase):
+
+    def test_preprocess(self):
+
+        for file_name, columns in [('recipe_info', 'all'), ('recipe_info', ['country', 'spice_level']),
+                                   ('nas', 'all'), ('long', 'all'), ('rectify_country_labels', 'all')]:
+            path = f'tests/fixtures/preprocess/{file_name}.csv'
+
+            preprocessor = Preprocess(df_labels=self.spark.read.csv(path, header=True), columns=columns)
+            pd_df_expected = preprocessor.preprocess().toPandas()
+            local_preprocessor = LocalPreprocess(pd_df_labels=read_labels(path), columns=columns)
+            pd_df_preprocessed = local_preprocessor.preprocess()
+
+            pd.testing.assert_frame_equal(pd_df_preprocessed.sort_values('recipe_id').reset_index(drop=True),
+                                          pd_df_expected.sort_values('recipe_id').reset_index(drop=True))
+            self.assertEqual(local_preprocessor.vocabulary, preprocessor.vocabulary)
+
+    def test_preprocess_sparse(self):
+
+        path = 'tests/fixtures/preprocess/long.csv'
+
+        features_expected = Preprocess(df_labels=self.spark.read.csv(path, header=True), columns='all')\
+            .preprocess_sparse()
+        features = LocalPreprocess(pd_df_labels=read_labels(path), columns='all').preprocess_sparse()
+
+        self.assertTrue(features.is_sparse)
+        self.assertEqual(features.columns, features_expected.columns)
+
+        order = np.argsort(features.indexes)
+        order_expected = np.argsort(features_expected.indexes)
+        np.testing.assert_array_equal(features.indexes[order], features_expected.indexes[order_expected])
+        np.testing.assert_array_equal(features.matrix.toarray()[order],
+                                      features_expected.matrix.toarray()[order_expected])
+
+    def test_checks(self):
+
+        pd_df_duplicates = read_labels('tests/fixtures/preprocess/duplicate_recipes.csv')
+        local_preprocessor = LocalPreprocess(pd_df_labels=pd_df_duplicates, columns='all', seed=0)
+        self.assertEqual(local_preprocessor.pd_df_labels.shape[0], pd_df_duplicates['recipe_id'].nunique())
+        self.assertFalse(local_preprocessor.pd_df_labels['recipe_id'].duplicated().any())
+
+        local_preprocessor_first = LocalPreprocess(pd_df_labels=pd_df_duplicates, columns='all', dedupe='first',
+                                                   check_duplicates=True)
+        self.assertEqual(local_preprocessor_first.duplicate_count, 1)
+        pd.testing.assert_frame_equal(local_preprocessor_first.pd_df_labels,
+                                      pd_df_duplicates.drop_duplicates(subset=['recipe_id']))
+
+        pd_df_unique = pd_df_duplicates.drop_duplicates(subset=['recipe_id'])
+        local_preprocessor_unique = LocalPreprocess(pd_df_labels=pd_df_unique, columns='all', check_duplicates=True)
+        self.assertEqual(local_preprocessor_unique.duplicate_count, 0)
+        self.assertIs(local_preprocessor_unique.pd_df_labels, pd_df_unique)
+
+        with self.assertRaises(AssertionError):
+            LocalPreprocess(pd_df_labels=pd_df_duplicates, columns='all', dedupe='last')
+
+        with self.assertRaises(AssertionError):
+            LocalPreprocess(pd_df_labels=read_labels('tests/fixtures/preprocess/nulls_recipe_id.csv'), columns='all')
+        with self.assertRaises(AssertionError):
+            LocalPreprocess(pd_df_labels=read_labels('tests/fixtures/preprocess/nulls_attributes.csv'), columns='all')
+        with self.assertRaises(AssertionError):
+            LocalPreprocess(pd_df_labels=pd_df_duplicates, columns='country')
+        with self.assertRaises(AssertionError):
+            LocalPreprocess(pd_df_labels=self.spark.createDataFrame(pd_df_duplicates), columns='all')
+
+    def test_count_rows(self):
+
+        self.assertEqual(count_rows('tests/fixtures/preprocess/recipe_info.csv'), 7)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('recipe_id,country\n1,Italy\n2,France\n')
+            file.flush()
+            self.assertEqual(count_rows(file.name), 2)
+
+    def test_no_pyspark(self):
+
+        code = 'import sys; import local_preprocess, similarity, cache, attribute_gram, incremental; ' \
+               'sys.exit("pyspark" in sys.modules)'
+
+        self.assertEqual(subprocess.run([sys.executable, '-c', code]).returncode, 0)
@@ -0,0 +1,118 @@
+import unittest
+
+from features import Features
+from similarity import Similarity
+from lookup import NeighbourIndex
+from lookup import NeighbourService
+from lookup import find_latest_run
+from utils import create_id_table
+from utils import create_parameters_table
+
+import pandas as pd
+import numpy as np
+
+import os
+import tempfile
+
+
+class TestNeighbourIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.run_dir = f'{self.temp_dir.name}/20210101_1200'
+
+        pd_df_labels = pd.read_csv('tests/fixtures/preprocess/long.csv', dtype=str, encoding='utf-8-sig')
+        self.features = Features.from_labels(pd_df_labels, columns=['country', 'protein', 'prep_time'])
+
+        os.makedirs(f'{self.run_dir}/similarities')
+        _, self.pd_df_similarity_long = Similarity(df_features=self.features, seed=0).generate()
+        self.pd_df_similarity_long.to_csv(f'{self.run_dir}/similarities/similarities_long.csv', index=False)
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_query(self):
+
+        index = NeighbourIndex(self.run_dir)
+
+        self.assertTrue(os.path.isfile(f'{self.run_dir}/index/neighbours.npy'))
+        self.assertIsInstance(index.neighbours, np.memmap)
+
+        for recipe_id in self.features.indexes:
+            pd_df_expected = self.pd_df_similarity_long.loc[
+                (self.pd_df_similarity_long['recipe_id_1'] == recipe_id)
+                & (self.pd_df_similarity_long['recipe_id_2'] != recipe_id)].head(2)
+
+            neighbours = index.query(recipe_id, n=2)
+
+            self.assertEqual([neighbour for neighbour, _ in neighbours], pd_df_expected['recipe_id_2'].tolist())
+            np.testing.assert_allclose([similarity for _, similarity in neighbours],
+                                       pd_df_expected['similarity'].values, rtol=1e-6)
+
+        self.assertEqual(len(index.query(self.features.indexes[0], n=100)), len(self.features.indexes) - 1)
+        self.assertEqual(index.query(self.features.indexes[0], n=1, include_self=True)[0][0], self.features.indexes[0])
+        self.assertIsNone(index.query('unknown'))
+
+    def test_encoded_ids(self):
+
+        encoded_run_dir = f'{self.temp_dir.name}/20210102_1200'
+        os.makedirs(f'{encoded_run_dir}/similarities')
+        _, pd_df_similarity_long = Similarity(df_features=self.features, seed=0, encode_ids=True).generate()
+        pd_df_similarity_long.to_csv(f'{encoded_run_dir}/similarities/similarities_long.csv', index=False)
+        create_id_table(self.features.indexes, 'recipe_id')\
+            .to_csv(f'{encoded_run_dir}/similarities/ids.csv', index=False)
+
+        index = NeighbourIndex(self.run_dir)
+        index_encoded = NeighbourIndex(encoded_run_dir)
+
+        for recipe_id in self.features.indexes:
+            self.assertEqual(index_encoded.query(recipe_id, n=3), index.query(recipe_id, n=3))
+
+    def test_query_batch(self):
+
+        index = NeighbourIndex(self.run_dir)
+        neighbours = index.query_batch(['1', '2', 'unknown'], n=3)
+
+        self.assertEqual(neighbours['1'], index.query('1', n=3))
+        self.assertEqual(neighbours['2'], index.query('2', n=3))
+        self.assertIsNone(neighbours['unknown'])
+
+
+class TestNeighbourService(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.temp_dir.name
+
+        for run, similarity in [('20210101_1200', 0.5), ('20210102_1200', 0.8)]:
+            os.makedirs(f'{self.output_dir}/{run}/similarities')
+            pd.DataFrame({'recipe_id_1': ['1', '1', '2', '2'],
+                          'recipe_id_2': ['1', '2', '2', '1'],
+                          'similarity': [1., similarity, 1., similarity],
+                          'rank': [1, 2, 1, 2]})\
+                .to_csv(f'{self.output_dir}/{run}/similarities/similarities_long.csv', index=False)
+            os.makedirs(f'{self.output_dir}/{run}/parameters')
+            create_parameters_table(similarity_type='cosine', columns='all', index_column='recipe_id')\
+                .to_csv(f'{self.output_dir}/{run}/parameters/parameters.csv', index=False)
+
+    def tearDown(self):
+
+        self.temp_dir.cleanup()
+
+    def test_reload(self):
+
+        service = NeighbourService(f'{self.output_dir}/20210101_1200')
+        self.assertEqual(service.query('1'), [('2', float(np.float32(0.5)))])
+
+        service.reload(find_latest_run(self.output_dir))
+        self.assertEqual(service.query('1'), [('2', float(np.float32(0.8)))])
+
+        os.makedirs(f'{self.output_dir}/20210103_1200/similarities')
+        self.assertEqual(find_latest_run(self.output_dir), f'{self.output_dir}/20210102_1200')
+
+
+if __name__ == '__main__':
+    unittest.main()
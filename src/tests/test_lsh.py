@@ -0,0 +1,70 @@
+import unittest
+
+from lsh import MinHashLSH
+from lsh import jaccard_similarity
+from lsh import jaccard_similarity_pairs
+
+import numpy as np
+
+
+class TestMinHashLSH(unittest.TestCase):
+
+    def setUp(self):
+
+        self.mat_features = np.array([[1, 0, 0, 1],
+                                      [1, 0, 0, 1],
+                                      [0, 1, 1, 0],
+                                      [1, 1, 0, 1],
+                                      [0, 0, 0, 0]])
+
+    def test_signatures(self):
+
+        lsh = MinHashLSH(num_bands=4, rows_per_band=2, seed=1)
+        mat_signatures = lsh.signatures(self.mat_features)
+
+        self.assertEqual(mat_signatures.shape, (5, 8))
+        self.assertTrue((mat_signatures[0] == mat_signatures[1]).all())
+        self.assertTrue((mat_signatures[4] == MinHashLSH.PRIME).all())
+
+    def test_candidate_pairs(self):
+
+        lsh = MinHashLSH(num_bands=4, rows_per_band=2, seed=1)
+        rows_1, rows_2 = lsh.candidate_pairs(self.mat_features)
+        pairs = list(zip(rows_1.tolist(), rows_2.tolist()))
+
+        self.assertIn((0, 1), pairs)
+        self.assertTrue(all(row_1 < row_2 for row_1, row_2 in pairs))
+        self.assertTrue(all(4 not in pair for pair in pairs))
+        self.assertEqual(len(pairs), len(set(pairs)))
+
+        mat_identical = np.ones((30, 3), dtype=np.int8)
+        rows_1, rows_2 = lsh.candidate_pairs(mat_identical)
+        self.assertEqual(len(rows_1), 30 * 29 // 2)
+        self.assertEqual(len(set(zip(rows_1.tolist(), rows_2.tolist()))), 30 * 29 // 2)
+
+        rows_1, rows_2 = lsh.candidate_pairs(np.eye(3, dtype=np.int8)[:1])
+        self.assertEqual((len(rows_1), rows_1.dtype), (0, np.int64))
+
+    def test_evaluate(self):
+
+        lsh = MinHashLSH(num_bands=4, rows_per_band=2, seed=1)
+        pd_df_report = lsh.evaluate(self.mat_features, sample_size=3, similarity_threshold=1)
+
+        self.assertEqual(pd_df_report.shape[0], 1)
+        self.assertEqual(pd_df_report['sample_size'].values[0], 3)
+        self.assertEqual(pd_df_report['all_pairs'].values[0], 10)
+        self.assertEqual(pd_df_report['recall'].values[0], 1)
+
+    def test_jaccard_similarity(self):
+
+        mat_jaccard = jaccard_similarity(self.mat_features, self.mat_features)
+
+        self.assertAlmostEqual(mat_jaccard[0, 1], 1)
+        self.assertAlmostEqual(mat_jaccard[0, 2], 0)
+        self.assertAlmostEqual(mat_jaccard[0, 3], 2 / 3)
+        self.assertAlmostEqual(mat_jaccard[4, 4], 0)
+
+        similarities = jaccard_similarity_pairs(self.mat_features, np.array([0, 0, 4]), np.array([3, 2, 4]),
+                                                block_size=2)
+
+        self.assertEqual(similarities.round(6).tolist(), [round(2 / 3, 6), 0, 0])
@@ -0,0 +1,81 @@
+from tests import PySparkTestCase
+
+from metrics import Metrics
+from metrics import measure
+from preprocess import Preprocess
+from similarity import Similarity
+from features import Features
+
+import pandas as pd
+import numpy as np
+
+import logging
+import tempfile
+
+
+class TestMetrics(PySparkTestCase):
+
+    def test_stage(self):
+
+        metrics = Metrics(spark=self.spark)
+
+        with metrics.stage('count'):
+            self.spark.range(10).count()
+        with metrics.stage('allocate'):
+            array = np.ones(10 ** 6)
+
+        self.assertEqual([record['stage'] for record in metrics.records], ['count', 'allocate'])
+        self.assertGreater(metrics.records[0]['spark_jobs'], 0)
+        self.assertGreaterEqual(metrics.records[0]['spark_stages'], metrics.records[0]['spark_jobs'])
+        self.assertEqual(metrics.records[1]['spark_jobs'], 0)
+        self.assertEqual(metrics.records[1]['shuffle_write_mb'], 0)
+        self.assertGreater(metrics.records[1]['peak_memory_mb'], array.nbytes / 1024 ** 2 * .9)
+
+        with self.assertRaises(AssertionError):
+            with metrics.stage('outer'):
+                with metrics.stage('inner'):
+                    pass
+
+        with measure(None, 'nothing'):
+            pass
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pd_df_metrics = pd.read_csv(metrics.write(temp_dir))
+
+        self.assertEqual(pd_df_metrics['stage'].tolist(), ['count', 'allocate', 'outer'])
+
+        rdd_shuffled = self.spark.sparkContext.parallelize(range(1000), 2).map(lambda x: (x % 4, x)).partitionBy(4)
+        with metrics.stage('shuffle'):
+            rdd_shuffled.count()
+        with metrics.stage('reuse_shuffle'):
+            rdd_shuffled.count()
+
+        self.assertGreater(metrics.records[-2]['shuffle_write_mb'], 0)
+        self.assertEqual(metrics.records[-1]['shuffle_write_mb'], 0)
+
+    def test_logger(self):
+
+        metrics = Metrics(trace_memory=False, logger=logging.getLogger('metrics'))
+
+        with self.assertLogs('metrics', level='INFO') as logs:
+            with metrics.stage('nothing'):
+                pass
+
+        self.assertIn('"stage": "nothing"', logs.output[0])
+        self.assertIsNone(metrics.records[0]['spark_jobs'])
+        self.assertIsNone(metrics.records[0]['peak_memory_mb'])
+
+    def test_pipeline_stages(self):
+
+        metrics = Metrics(spark=self.spark)
+
+        df_labels = self.spark.read.csv('tests/fixtures/preprocess/recipe_info.csv', header=True)
+        df_features = Preprocess(df_labels=df_labels, columns='all', metrics=metrics).preprocess()
+        features = Features.from_pandas(df_features.toPandas(), index_column='recipe_id')
+        Similarity(df_features=features, metrics=metrics).generate()
+
+        self.assertEqual([record['stage'] for record in metrics.records],
+                         ['check_nulls', 'dedupe', 'normalise_labels', 'one_hot', 'check_nulls', 'collect_features',
+                          'similarity', 'wide', 'long'])
+        self.assertGreater(metrics.records[0]['spark_jobs'], 0)
+        self.assertGreater(metrics.records[1]['spark_jobs'], 0)
@@ -0,0 +1,97 @@
+import unittest
+
+from features import Features
+from similarity import Similarity
+from synthetic import generate_labels
+from parallel import ParallelEngine
+
+import pandas as pd
+import numpy as np
+
+import tempfile
+
+
+class TestParallelEngine(unittest.TestCase):
+
+    def setUp(self):
+
+        pd_df_labels = generate_labels(row_count=45, column_count=3, cardinality=4, seed=0)
+        self.features = Features.from_labels(pd_df_labels, columns=['country', 'attribute_1', 'attribute_2'])
+
+    def assert_long_equal(self, pd_df_long, pd_df_long_expected, is_complete=True):
+        """
+        Checks long similarities are equal apart from the order of tied similarities. Tied neighbours at rank top_k
+        may differ unless is_complete.
+
+        """
+
+        for pd_df in [pd_df_long, pd_df_long_expected]:
+            pd_df.sort_values(['recipe_id_1', 'rank'], inplace=True)
+            pd_df.reset_index(drop=True, inplace=True)
+
+        pd.testing.assert_frame_equal(pd_df_long[['recipe_id_1', 'similarity', 'rank']],
+                                      pd_df_long_expected[['recipe_id_1', 'similarity', 'rank']])
+
+        if not is_complete:
+            return
+
+        for pd_df in [pd_df_long, pd_df_long_expected]:
+            pd_df.sort_values(['recipe_id_1', 'similarity', 'recipe_id_2'], inplace=True)
+            pd_df.reset_index(drop=True, inplace=True)
+
+        pd.testing.assert_series_equal(pd_df_long['recipe_id_2'], pd_df_long_expected['recipe_id_2'])
+
+    def test_generate(self):
+
+        for features in [self.features, Features(indexes=self.features.indexes,
+                                                 matrix=self.features.matrix.toarray(),
+                                                 columns=self.features.columns)]:
+            for top_k in [None, 4]:
+                pd_df_wide_expected, pd_df_long_expected = Similarity(df_features=features, top_k=top_k, block_size=10,
+                                                                      seed=0).generate()
+                pd_df_wide, pd_df_long = Similarity(df_features=features, top_k=top_k, block_size=10, seed=0,
+                                                    n_jobs=3).generate()
+
+                if top_k is None:
+                    pd.testing.assert_frame_equal(pd_df_wide, pd_df_wide_expected)
+                self.assert_long_equal(pd_df_long, pd_df_long_expected, is_complete=top_k is None)
+
+    def test_generate_multiple(self):
+
+        similarities_expected = Similarity(df_features=self.features, similarity_type=['cosine', 'jaccard'], top_k=5,
+                                           block_size=10, precision='uint8', seed=0).generate()
+        similarities = Similarity(df_features=self.features, similarity_type=['cosine', 'jaccard'], top_k=5,
+                                  block_size=10, precision='uint8', seed=0, n_jobs=2).generate()
+
+        for similarity_type in ['cosine', 'jaccard']:
+            self.assert_long_equal(similarities[similarity_type][1], similarities_expected[similarity_type][1],
+                                   is_complete=False)
+
+    def test_generate_long_blocks(self):
+
+        similarity = Similarity(df_features=self.features, top_k=3, block_size=10, seed=0)
+        pd_df_blocks = list(ParallelEngine(similarity, n_jobs=2).generate_long_blocks(self.features))
+
+        self.assertEqual(len(pd_df_blocks), 5)
+        self.assertEqual([pd_df_block['recipe_id_1'].iloc[0] for pd_df_block in pd_df_blocks],
+                         self.features.indexes[::10].tolist())
+        self.assertTrue(all(pd_df_block.shape[0] == 3 * pd_df_block['recipe_id_1'].nunique()
+                            for pd_df_block in pd_df_blocks))
+
+        pd_df_long = pd.concat(list(ParallelEngine(similarity, n_jobs=2).generate_long_blocks(self.features)))
+        np.testing.assert_array_equal(pd.concat(pd_df_blocks)['similarity'].values, pd_df_long['similarity'].values)
+
+        with self.assertRaises(AssertionError):
+            ParallelEngine(similarity, n_jobs=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+    def test__select_arrays_dir(self):
+
+        self.assertEqual(ParallelEngine._select_arrays_dir(2 ** 62), tempfile.gettempdir())
+        self.assertIn(ParallelEngine._select_arrays_dir(0), ['/dev/shm', tempfile.gettempdir()])
+
+        arrays = ParallelEngine._create_feature_arrays(self.features)
+        self.assertEqual(sorted(arrays), ['data', 'indices', 'indptr'])
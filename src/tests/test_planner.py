@@ -0,0 +1,84 @@
+import unittest
+
+from features import Features
+from similarity import Similarity
+from planner import parse_memory
+from planner import estimate_memory
+from planner import plan_memory
+
+import numpy as np
+
+import tracemalloc
+
+
+class TestPlanner(unittest.TestCase):
+
+    def test_parse_memory(self):
+
+        self.assertEqual(parse_memory(1024), 1024)
+        self.assertEqual(parse_memory('512m'), 512 * 1024 ** 2)
+        self.assertEqual(parse_memory('1.5G'), int(1.5 * 1024 ** 3))
+        self.assertEqual(parse_memory('8gb'), 8 * 1024 ** 3)
+
+        with self.assertRaises(AssertionError):
+            parse_memory('eight gigabytes')
+
+    def test_estimate_memory(self):
+
+        row_count, feature_count = 2000, 30
+        random_state = np.random.RandomState(0)
+        features = Features(indexes=np.arange(row_count).astype(str).astype(object),
+                            matrix=(random_state.rand(row_count, feature_count) < .2).astype(np.int64),
+                            columns=[f'feature_{position}' for position in range(feature_count)])
+
+        for top_k, precision in [(None, 'float64'), (10, 'float64'), (None, 'float32')]:
+            similarity = Similarity(df_features=features, top_k=top_k, check_nulls=False, precision=precision)
+
+            tracemalloc.start()
+            pd_df_wide, pd_df_long = similarity.generate()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            estimate = estimate_memory(row_count, feature_count, top_k=top_k, precision=precision)
+            calculation_type = np.float64 if precision == 'float64' else np.float32
+
+            self.assertEqual(estimate['features'], 2 * features.matrix.astype(calculation_type).nbytes)
+            self.assertEqual(estimate['long'], 2 * pd_df_long.memory_usage(index=False).sum())
+            if top_k is None:
+                mat_similarity = similarity._calculate_similarity(features.matrix.astype(calculation_type))
+                self.assertEqual(estimate['similarity'], mat_similarity.nbytes)
+                self.assertEqual(estimate['wide'], pd_df_wide.values.nbytes)
+            else:
+                self.assertEqual(estimate['similarity'] + estimate['wide'], 0)
+
+            self.assertLess(peak_memory, 1.5 * estimate['total'])
+
+        estimate = estimate_memory(row_count, feature_count, block_size=100, is_streaming=True)
+        self.assertEqual(estimate['wide'], 0)
+        self.assertLess(estimate['total'], estimate_memory(row_count, feature_count)['total'] / 10)
+
+    def test_plan_memory(self):
+
+        plan = plan_memory('1g', row_count=2000, feature_count=30, precision='float64')
+        self.assertEqual((plan['strategy'], plan['precision'], plan['block_size']), ('in_memory', 'float64', 1000))
+
+        plan = plan_memory('1g', row_count=100000, feature_count=30, precision='float64')
+        self.assertEqual((plan['strategy'], plan['precision']), ('streaming', 'float64'))
+        self.assertLessEqual(plan['estimate']['total'], plan['max_memory'])
+        self.assertLess(plan['block_size'], 1000)
+
+        in_memory_float64 = estimate_memory(5000, 30)['total']
+        plan = plan_memory(in_memory_float64 - 1, row_count=5000, feature_count=30, precision=None)
+        self.assertEqual((plan['strategy'], plan['precision']), ('streaming', 'float64'))
+
+        streaming_float64 = estimate_memory(5000, 30, block_size=1, is_streaming=True)['total']
+        plan = plan_memory(streaming_float64 - 1, row_count=5000, feature_count=30, precision=None)
+        self.assertEqual((plan['strategy'], plan['precision']), ('streaming', 'float32'))
+
+        with self.assertRaises(MemoryError) as context:
+            plan_memory('100m', row_count=10 ** 7, feature_count=100)
+        self.assertIn('GiB', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ from tests import PySparkTestCase
 import pyspark.sql.functions as f
 
 from preprocess import Preprocess
+from metrics import Metrics
 
 import pandas as pd
 
@@ -23,6 +24,48 @@ class TestPreprocess(PySparkTestCase):
         self.assertEqual(df_preprocessed_country.count(), df_recipe_info.count() - 1)
         self.assertEqual(len(df_preprocessed_country.columns), 1+4)
 
+    def test_preprocess_persisted(self):
+
+        df_recipe_info = self.spark.read.csv('tests/fixtures/preprocess/recipe_info.csv', header=True)
+        metrics = Metrics(spark=self.spark, trace_memory=False)
+
+        preprocessor = Preprocess(df_labels=df_recipe_info, columns='all')
+        df_preprocessed = preprocessor.preprocess()
+
+        self.assertTrue(df_preprocessed.is_cached)
+        self.assertFalse(preprocessor.df_labels.is_cached)
+        self.assertEqual(len(self.spark.sparkContext._jsc.getPersistentRDDs()), 1)
+
+        with metrics.stage('collect'):
+            rows = df_preprocessed.collect()
+
+        self.assertEqual(metrics.records[0]['spark_jobs'], 1)
+        self.assertEqual(metrics.records[0]['shuffle_read_mb'], 0)
+        self.assertEqual(metrics.records[0]['shuffle_write_mb'], 0)
+        self.assertEqual(sorted(rows), sorted(df_preprocessed.collect()))
+        self.assertEqual(df_preprocessed.columns[1:], [col+'_'+label for col in preprocessor.columns
+                                                       for label in preprocessor.vocabulary[col]])
+
+        df_preprocessed.unpersist()
+
+    def test_preprocess_sparse(self):
+
+        df_recipe_info = self.spark.read.csv('tests/fixtures/preprocess/recipe_info.csv', header=True)
+
+        preprocessor_all = Preprocess(df_labels=df_recipe_info, columns='all')
+        features_all = preprocessor_all.preprocess_sparse()
+
+        df_preprocessed_all = Preprocess(df_labels=df_recipe_info, columns='all').preprocess()
+
+        self.assertTrue(features_all.is_sparse)
+        self.assertEqual(features_all.matrix.shape[0], df_recipe_info.count()-1)
+        self.assertEqual(sorted(features_all.columns), sorted(df_preprocessed_all.columns[1:]))
+        self.assertEqual(features_all.matrix.sum(axis=1).min(), len(preprocessor_all.columns))
+
+        preprocessor_country = Preprocess(df_labels=df_recipe_info, columns=['country'])
+        features_country = preprocessor_country.preprocess_sparse()
+        self.assertEqual(len(features_country.columns), 4)
+
     def test__rectify_country_labels(self):
 
         df_countries = self.spark.read.csv('tests/fixtures/preprocess/rectify_country_labels.csv', header=True)
@@ -51,6 +94,34 @@ class TestPreprocess(PySparkTestCase):
         df_count_check = df_rectified_country_labels.where(f.col('country') == f.col('country_secondary'))
         self.assertEqual(df_count_check.count(), 10)
 
+    def test__normalise_labels(self):
+
+        df_long = self.spark.read.csv('tests/fixtures/preprocess/long.csv', header=True)
+        df_nas = self.spark.read.csv('tests/fixtures/preprocess/nas.csv', header=True)
+
+        preprocessor_nas = Preprocess(df_labels=df_nas, columns='all')
+        df_step_by_step = preprocessor_nas._convert_prep_time(
+            preprocessor_nas._convert_nas(
+                preprocessor_nas._convert_columns_to_lower_case(
+                    preprocessor_nas._replace_whitespaces_with_underscores(
+                        preprocessor_nas._rectify_country_labels()))))
+        df_normalised = preprocessor_nas._normalise_labels()
+
+        self.assertEqual(df_normalised.columns, df_nas.columns)
+        self.assertEqual(sorted(df_normalised.collect()), sorted(df_step_by_step.collect()))
+
+        preprocessor_configured = Preprocess(df_labels=df_long,
+                                             columns='all',
+                                             country_labels={'great_britain': 'united_kingdom'},
+                                             range_columns=[])
+        df_configured = preprocessor_configured._normalise_labels()
+
+        check_recipe_2 = df_configured.filter(f.col('recipe_id') == '2').select('prep_time').collect()[0][0]
+        self.assertEqual(check_recipe_2, '55-60')
+
+        check_recipe_4 = df_configured.filter(f.col('recipe_id') == '4').select('country').collect()[0][0]
+        self.assertEqual(check_recipe_4, 'united_kingdom')
+
     def test__convert_prep_time(self):
 
         df_long = self.spark.read.csv('tests/fixtures/preprocess/long.csv', header=True)
@@ -85,6 +156,30 @@ class TestPreprocess(PySparkTestCase):
         preprocessor = Preprocess(df_labels=df_duplicate_recipes, columns='all')
 
         self.assertEqual(df_duplicate_recipes.count() - 1, preprocessor.df_labels.count())
+        self.assertTrue(preprocessor.df_labels.is_cached)
+
+        for dedupe in ['random', 'first']:
+            preprocessor_checked = Preprocess(df_labels=df_duplicate_recipes, columns='all', dedupe=dedupe, seed=0,
+                                              check_duplicates=True)
+            self.assertEqual(preprocessor_checked.duplicate_count, 1)
+            self.assertEqual(preprocessor_checked.df_labels.columns, df_duplicate_recipes.columns)
+            self.assertEqual(df_duplicate_recipes.count() - 1, preprocessor_checked.df_labels.count())
+
+        df_unique_recipes = df_duplicate_recipes.dropDuplicates(['recipe_id'])
+        preprocessor_unique = Preprocess(df_labels=df_unique_recipes, columns='all', check_duplicates=True)
+        self.assertEqual(preprocessor_unique.duplicate_count, 0)
+        self.assertIs(preprocessor_unique.df_labels, df_unique_recipes)
+
+        with self.assertRaises(AssertionError):
+            Preprocess(df_labels=df_duplicate_recipes, columns='all', dedupe='last')
+
+        df_mixed_duplicates = self.spark.createDataFrame(pd.DataFrame({'country': ['Italy', 'France'] * 50,
+                                                                       'recipe_id': ['1'] * 100,
+                                                                       'protein': ['Pasta', 'Cheese'] * 50}))\
+            .repartition(4)
+        df_first = Preprocess(df_labels=df_mixed_duplicates, columns='all', dedupe='first').df_labels
+        self.assertEqual(df_first.columns, df_mixed_duplicates.columns)
+        self.assertIn(tuple(df_first.collect()[0]), [('Italy', '1', 'Pasta'), ('France', '1', 'Cheese')])
 
     def test__check_is_list(self):
 
@@ -141,6 +236,22 @@ class TestPreprocess(PySparkTestCase):
         df_one_hot_country = preprocessor_country._convert_to_one_hot(df_long)
 
         self.assertEqual(len(df_one_hot_country.columns), 1+4+2)
+        self.assertEqual(sorted(preprocessor_country.vocabulary['country']),
+                         sorted(col[len('country_'):] for col in df_one_hot_country.columns if 'country_' in col))
+
+    def test__collect_vocabulary(self):
+
+        df_long = self.spark.read.csv('tests/fixtures/preprocess/long.csv', header=True)
+
+        preprocessor = Preprocess(df_labels=df_long, columns=['country', 'protein'])
+        vocabulary = preprocessor._collect_vocabulary(df_long)
+
+        self.assertEqual(sorted(vocabulary.keys()), ['country', 'protein'])
+        self.assertEqual(vocabulary['country'], ['france', 'great_britain', 'italy', 'lebanon'])
+        self.assertEqual(len(vocabulary['protein']), 4)
+
+        preprocessor_no_columns = Preprocess(df_labels=df_long, columns=[])
+        self.assertEqual(preprocessor_no_columns._collect_vocabulary(df_long), {})
 
     def test__convert_nas(self):
 
@@ -179,7 +290,8 @@ class TestPreprocess(PySparkTestCase):
         df_nulls_attributes = self.spark.read.csv('tests/fixtures/preprocess/nulls_attributes.csv', header=True)
         df_no_nulls_attributes = self.spark.read.csv('tests/fixtures/preprocess/no_nulls_attributes.csv', header=True)
 
-        Preprocess(df_labels=df_no_nulls_attributes, columns=[''])
+        preprocessor = Preprocess(df_labels=df_no_nulls_attributes, columns=[''])
+        self.assertEqual(preprocessor.null_report, {'recipe_id': 0, 'country': 0, 'diet_type': 0})
 
         with self.assertRaises(AssertionError):
             Preprocess(df_labels=df_nulls_attributes, columns=[''])
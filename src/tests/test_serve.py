@@ -0,0 +1,84 @@
+import unittest
+
+from lookup import NeighbourService
+from serve import create_server
+from utils import create_parameters_table
+
+import pandas as pd
+
+import json
+import os
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+
+class TestServe(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.temp_dir.name
+
+        for run, recipe_id in [('20210101_1200', '2'), ('20210102_1200', '3')]:
+            os.makedirs(f'{self.output_dir}/{run}/similarities')
+            pd.DataFrame({'recipe_id_1': ['1', '1', recipe_id, recipe_id],
+                          'recipe_id_2': ['1', recipe_id, recipe_id, '1'],
+                          'similarity': [1., .5, 1., .5],
+                          'rank': [1, 2, 1, 2]})\
+                .to_csv(f'{self.output_dir}/{run}/similarities/similarities_long.csv', index=False)
+            os.makedirs(f'{self.output_dir}/{run}/parameters')
+            create_parameters_table(similarity_type='cosine', columns='all', index_column='recipe_id')\
+                .to_csv(f'{self.output_dir}/{run}/parameters/parameters.csv', index=False)
+
+        service = NeighbourService(f'{self.output_dir}/20210101_1200')
+        self.server = create_server(service, port=0, output_dir=self.output_dir)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def _request(self, path, method='GET'):
+
+        with urllib.request.urlopen(urllib.request.Request(self.url + path, method=method)) as response:
+            return json.loads(response.read())
+
+    def test_create_server(self):
+
+        self.assertEqual(self._request('/neighbours?id=1&id=unknown&n=5'),
+                         {'1': [{'id': '2', 'similarity': .5}], 'unknown': None})
+
+        self.assertEqual(self._request('/reload', method='POST'), {'run': f'{self.output_dir}/20210102_1200'})
+        self.assertEqual(self._request('/neighbours?id=1'), {'1': [{'id': '3', 'similarity': .5}]})
+
+    def test_reload_errors(self):
+
+        os.makedirs(f'{self.output_dir}/20210103_1200/similarities')
+
+        for path, status in [('/reload?run=../20210101_1200', 404), ('/reload?run=unknown', 404),
+                             ('/reload?run=20210103_1200', 500)]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self._request(path, method='POST')
+            self.assertEqual(context.exception.code, status)
+            self.assertIn('error', json.loads(context.exception.read()))
+
+        self.assertEqual(self._request('/reload', method='POST'), {'run': f'{self.output_dir}/20210102_1200'})
+
+    def test_neighbours_errors(self):
+
+        for path in ['/neighbours?id=1&n=abc', '/neighbours?id=1&n=-1', '/neighbours?id=1&n=0']:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self._request(path)
+            self.assertEqual(context.exception.code, 400)
+            self.assertIn('error', json.loads(context.exception.read()))
+
+        self.assertEqual(self._request('/neighbours?id=1&n=1'), {'1': [{'id': '2', 'similarity': .5}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,56 +4,53 @@ import pyspark.sql.functions as f
 from pyspark.sql.types import *
 
 from similarity import Similarity
+from similarity import GRAM_SIMILARITY_TYPES
+from features import Features
+from utils import create_id_table
+from utils import decode_ids
+from lsh import jaccard_similarity
 
 import pandas as pd
+import numpy as np
 
 
 class TestSimilarity(PySparkTestCase):
 
-    def test__add_rank_column(self):
-
-        pd_df_similarities_long = pd.read_csv('tests/fixtures/similarity/similarities_long.csv')
+    def test__rank_block(self):
 
         df_simple_table = self.spark.read.csv('tests/fixtures/similarity/simple_table_id.csv', header=True)
         columns_to_convert = [col for col in df_simple_table.columns if 'id' not in col]
         for col in columns_to_convert:
             df_simple_table = df_simple_table.withColumn(col, f.col(col).cast(IntegerType()))
-        similarity_cosine = Similarity(df_features=df_simple_table, index_column='id', similarity_type='cosine')
-
-        pd_df_with_rank_cosine = similarity_cosine._add_rank_column(pd_df_similarities_long)
-        check_id_1_1_cosine = pd_df_with_rank_cosine.loc[(pd_df_with_rank_cosine['id_1'] == 1)
-                                                         & (pd_df_with_rank_cosine['id_2'] == 1)]['rank'].values[0]
-        self.assertEqual(check_id_1_1_cosine, 1)
-
-        check_id_1_3_cosine = pd_df_with_rank_cosine.loc[(pd_df_with_rank_cosine['id_1'] == 1)
-                                                         & (pd_df_with_rank_cosine['id_2'] == 3)]['rank'].values[0]
-        self.assertEqual(check_id_1_3_cosine, 3)
 
-        check_id_3_3_cosine = pd_df_with_rank_cosine.loc[(pd_df_with_rank_cosine['id_1'] == 3)
-                                                         & (pd_df_with_rank_cosine['id_2'] == 3)]['rank'].values[0]
-        self.assertEqual(check_id_3_3_cosine, 1)
+        mat_similarity = np.array([[10, 2, -10],
+                                   [11, 1, 5],
+                                   [10, 10, 10]])
 
-        similarity_euclidean = Similarity(df_features=df_simple_table, index_column='id', similarity_type='euclidean')
+        similarity_cosine = Similarity(df_features=df_simple_table, index_column='id', similarity_type='cosine')
+        mat_order_cosine = similarity_cosine._rank_block(mat_similarity, 3)
 
-        pd_df_with_rank_euclidean = similarity_euclidean._add_rank_column(pd_df_similarities_long)
+        self.assertEqual(mat_order_cosine[0].tolist(), [0, 1, 2])
+        self.assertEqual(mat_order_cosine[1].tolist(), [0, 2, 1])
+        self.assertEqual(sorted(mat_order_cosine[2].tolist()), [0, 1, 2])
 
-        check_id_3_3_euclidean = pd_df_with_rank_euclidean.loc[(pd_df_with_rank_euclidean['id_1'] == 3)
-                                                               & (pd_df_with_rank_euclidean['id_2'] == 3)]['rank'].values[0]
-        self.assertEqual(check_id_3_3_euclidean, 3)
+        mat_order_cosine_top_k = similarity_cosine._rank_block(mat_similarity, 2)
 
-        pd_df_similarities_long_dupes = pd.read_csv('tests/fixtures/similarity/similarities_long_dupes.csv')
+        self.assertEqual(mat_order_cosine_top_k[:2].tolist(), [[0, 1], [0, 2]])
+        self.assertEqual(mat_order_cosine_top_k.shape, (3, 2))
 
-        cnt = 0
-        for i in range(5):
-            similarity_cosine_dupes = Similarity(df_features=df_simple_table, index_column='id', similarity_type='cosine')
-            pd_df_with_rank_cosine_dupes = similarity_cosine_dupes._add_rank_column(pd_df_similarities_long_dupes)
+        similarity_euclidean = Similarity(df_features=df_simple_table, index_column='id',
+                                          similarity_type='euclidean')
+        mat_order_euclidean = similarity_euclidean._rank_block(mat_similarity, 3)
 
-            check_id_1_5_dupes = pd_df_with_rank_cosine_dupes.loc[(pd_df_with_rank_cosine_dupes['id_1'] == 1)
-                                                                  & (pd_df_with_rank_cosine_dupes['id_2'] == 5)]['rank'].values[0]
+        self.assertEqual(mat_order_euclidean[0].tolist(), [2, 1, 0])
 
-            cnt += 1 if check_id_1_5_dupes == 1 else 0
+        mat_ties = np.ones((3, 50))
+        mat_order_seed_1 = Similarity(df_features=df_simple_table, index_column='id', seed=1)._rank_block(mat_ties, 50)
+        mat_order_seed_2 = Similarity(df_features=df_simple_table, index_column='id', seed=1)._rank_block(mat_ties, 50)
 
-        self.assertTrue(cnt < 5)
+        self.assertTrue((mat_order_seed_1 == mat_order_seed_2).all())
+        self.assertFalse((mat_order_seed_1[0] == np.arange(50)).all())
 
     def test__check_is_spark_data_frame(self):
 
@@ -87,6 +84,9 @@ class TestSimilarity(PySparkTestCase):
         with self.assertRaises(AssertionError):
             Similarity(df_features=df_nulls_features)
 
+        similarity_nulls = Similarity(df_features=df_nulls_features, check_nulls=False)
+        self.assertIsNone(similarity_nulls.null_report)
+
     def test__check_is_numerical_data(self):
 
         df_numerical = self.spark.read.csv('tests/fixtures/similarity/numerical_data.csv', header=True)
@@ -123,43 +123,253 @@ class TestSimilarity(PySparkTestCase):
 
         similarity_euc = Similarity(df_features=df_features_int, similarity_type='euclidean')
 
-        pd_df_similarity_euc, _ = similarity_euc.generate()
+        pd_df_similarity_euc, pd_df_similarity_euc_long = similarity_euc.generate()
 
         self.assertEqual(pd_df_similarity_euc.shape[0], df_features.count())
         self.assertEqual(pd_df_similarity_euc.shape[1], df_features.count())
 
+        self.assertEqual(pd_df_similarity_euc_long.columns.tolist(),
+                         ['recipe_id_1', 'recipe_id_2', 'similarity', 'rank'])
+        for _, pd_df_group in pd_df_similarity_euc_long.groupby('recipe_id_1'):
+            self.assertEqual(sorted(pd_df_group['rank'].tolist()), list(range(1, df_features.count() + 1)))
+            self.assertTrue(pd_df_group.sort_values('rank')['similarity'].is_monotonic_increasing)
+
         similarity_fail = Similarity(df_features=df_features_int, similarity_type='test')
         with self.assertRaises(ValueError):
             similarity_fail.generate()
 
-    def test__convert_to_long_format(self):
+    def test_generate_top_k(self):
 
-        pd_df_similarities_wide = pd.read_csv('tests/fixtures/similarity/similarities_wide.csv', index_col=0)
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
 
-        df_simple_table = self.spark.read.csv('tests/fixtures/similarity/simple_table.csv', header=True)
-        columns_to_convert = [col for col in df_simple_table.columns if 'id' not in col]
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        df_features_int = df_features
         for col in columns_to_convert:
-            df_simple_table = df_simple_table.withColumn(col, f.col(col).cast(IntegerType()))
-        similarity = Similarity(df_features=df_simple_table)
+            df_features_int = df_features_int.withColumn(col, f.col(col).cast(IntegerType()))
+
+        _, pd_df_similarity_full = Similarity(df_features=df_features_int, similarity_type='cosine').generate()
+
+        similarity_top_k = Similarity(df_features=df_features_int, similarity_type='cosine', top_k=2, block_size=3)
+        pd_df_similarity_wide, pd_df_similarity_top_k = similarity_top_k.generate()
+
+        self.assertIsNone(pd_df_similarity_wide)
+        self.assertEqual(pd_df_similarity_top_k.shape[0], df_features.count()*2)
+        self.assertEqual(sorted(pd_df_similarity_top_k['rank'].unique().tolist()), [1, 2])
+
+        for recipe_id, pd_df_group in pd_df_similarity_top_k.groupby('recipe_id_1'):
+            expected = pd_df_similarity_full\
+                .loc[pd_df_similarity_full['recipe_id_1'] == recipe_id]['similarity']\
+                .sort_values(ascending=False)\
+                .values[:2]
+            self.assertEqual(pd_df_group.sort_values('rank')['similarity'].round(6).tolist(),
+                             expected.round(6).tolist())
+
+        check_id_1_1 = pd_df_similarity_top_k.loc[(pd_df_similarity_top_k['recipe_id_1'] == '1')
+                                                  & (pd_df_similarity_top_k['rank'] == 1)]['recipe_id_2'].values[0]
+        self.assertIn(check_id_1_1, ['1', '3'])
+
+        similarity_top_k_euc = Similarity(df_features=df_features_int, similarity_type='euclidean', top_k=1)
+        _, pd_df_similarity_top_k_euc = similarity_top_k_euc.generate()
+
+        self.assertEqual(pd_df_similarity_top_k_euc['similarity'].max(), 0)
+
+    def test_generate_long_blocks(self):
+
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
+
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        df_features_int = df_features
+        for col in columns_to_convert:
+            df_features_int = df_features_int.withColumn(col, f.col(col).cast(IntegerType()))
+
+        similarity = Similarity(df_features=df_features_int, block_size=4, seed=1)
+        pd_df_blocks = list(similarity.generate_long_blocks())
+
+        self.assertEqual([pd_df_block.shape[0] for pd_df_block in pd_df_blocks],
+                         [4*df_features.count(), 2*df_features.count()])
+
+        _, pd_df_similarity_long = Similarity(df_features=df_features_int, block_size=4, seed=1).generate()
+        pd_df_similarity_blocks = pd.concat(pd_df_blocks, ignore_index=True)
+
+        self.assertTrue(pd_df_similarity_blocks.equals(pd_df_similarity_long))
+
+    def test_generate_encode_ids(self):
+
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
+
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        df_features_int = df_features
+        for col in columns_to_convert:
+            df_features_int = df_features_int.withColumn(col, f.col(col).cast(IntegerType()))
+
+        features = Features.from_spark(df_features_int)
+        pd_df_ids = create_id_table(features.indexes, 'recipe_id')
+
+        for top_k in [None, 2]:
+            _, pd_df_long_expected = Similarity(df_features=features, top_k=top_k, block_size=4, seed=1).generate()
+            pd_df_wide, pd_df_long = Similarity(df_features=features, top_k=top_k, block_size=4, seed=1,
+                                                encode_ids=True).generate()
+
+            self.assertEqual(pd_df_long['recipe_id_1'].dtype, np.int32)
+            self.assertEqual(pd_df_long['recipe_id_2'].dtype, np.int32)
+            self.assertTrue(decode_ids(pd_df_long, pd_df_ids, 'recipe_id').equals(pd_df_long_expected))
+
+        self.assertIsNone(pd_df_wide)
+
+    def test_generate_precision(self):
+
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
+
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        df_features_int = df_features
+        for col in columns_to_convert:
+            df_features_int = df_features_int.withColumn(col, f.col(col).cast(IntegerType()))
+
+        for similarity_type in ['cosine', 'euclidean']:
+            pd_df_wide_float64, _ = Similarity(df_features=df_features_int,
+                                               similarity_type=similarity_type).generate()
+
+            for precision in ['float32', 'float16']:
+                pd_df_wide, pd_df_long = Similarity(df_features=df_features_int,
+                                                    similarity_type=similarity_type,
+                                                    precision=precision).generate()
+
+                self.assertTrue((pd_df_wide.dtypes == precision).all())
+                self.assertEqual(pd_df_long['similarity'].dtype, precision)
+                self.assertTrue((pd_df_wide.astype(np.float64) - pd_df_wide_float64).abs().max().max() < 1e-2)
+
+            similarity_uint8 = Similarity(df_features=df_features_int,
+                                          similarity_type=similarity_type,
+                                          precision='uint8')
+            pd_df_wide_uint8, pd_df_long_uint8 = similarity_uint8.generate()
+
+            self.assertTrue((pd_df_wide_uint8.dtypes == np.uint8).all())
+            self.assertEqual(pd_df_long_uint8['similarity'].dtype, np.uint8)
+
+            pd_df_wide_decoded = pd_df_wide_uint8 * similarity_uint8.quantisation['scale'] \
+                + similarity_uint8.quantisation['offset']
+            max_error = (pd_df_wide_decoded - pd_df_wide_float64).abs().max().max()
+            self.assertTrue(max_error <= similarity_uint8.quantisation['scale'] / 2 + 1e-6)
+
+        with self.assertRaises(AssertionError):
+            Similarity(df_features=df_features_int, precision='int4')
+
+    def test_generate_sparse(self):
+
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
+
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        df_features_int = df_features
+        for col in columns_to_convert:
+            df_features_int = df_features_int.withColumn(col, f.col(col).cast(IntegerType()))
+
+        for similarity_type in ['cosine', 'euclidean']:
+            pd_df_similarity_dense, _ = Similarity(df_features=df_features_int,
+                                                   similarity_type=similarity_type).generate()
+            pd_df_similarity_sparse, _ = Similarity(df_features=df_features_int,
+                                                    similarity_type=similarity_type,
+                                                    is_sparse=True).generate()
+
+            self.assertTrue((pd_df_similarity_dense - pd_df_similarity_sparse).abs().max().max() < 1e-9)
+
+        features = Features.from_spark(df_features_int)
+        pd_df_similarity_features, pd_df_similarity_long = Similarity(df_features=features).generate()
+
+        self.assertEqual(pd_df_similarity_features.shape, (df_features.count(), df_features.count()))
+        self.assertEqual(pd_df_similarity_long.shape[0], df_features.count()**2)
+
+    def test_generate_jaccard_lsh(self):
+
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
+
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        df_features_int = df_features
+        for col in columns_to_convert:
+            df_features_int = df_features_int.withColumn(col, f.col(col).cast(IntegerType()))
+
+        similarity_lsh = Similarity(df_features=df_features_int, similarity_type='jaccard_lsh', seed=1,
+                                    num_bands=10, rows_per_band=1)
+        pd_df_similarity_wide, pd_df_similarity_lsh = similarity_lsh.generate()
+
+        self.assertIsNone(pd_df_similarity_wide)
+
+        check_id_1_3 = pd_df_similarity_lsh.loc[(pd_df_similarity_lsh['recipe_id_1'] == '1')
+                                                & (pd_df_similarity_lsh['recipe_id_2'] == '3')]
+        self.assertEqual(check_id_1_3['similarity'].values[0], 1)
+        self.assertIn(check_id_1_3['rank'].values[0], [1, 2])
+
+        check_id_2_6 = pd_df_similarity_lsh.loc[(pd_df_similarity_lsh['recipe_id_1'] == '2')
+                                                & (pd_df_similarity_lsh['recipe_id_2'] == '6')]['similarity']
+        self.assertAlmostEqual(check_id_2_6.values[0], 2 / 3)
+
+        check_id_5 = pd_df_similarity_lsh.loc[pd_df_similarity_lsh['recipe_id_1'] == '5']
+        self.assertEqual(check_id_5.shape[0], 1)
+
+        for _, pd_df_group in pd_df_similarity_lsh.groupby('recipe_id_1'):
+            self.assertEqual(pd_df_group['rank'].tolist(), list(range(1, pd_df_group.shape[0] + 1)))
+            self.assertTrue(pd_df_group['similarity'].is_monotonic_decreasing)
+
+        similarity_lsh_top_k = Similarity(df_features=df_features_int, similarity_type='jaccard_lsh', top_k=1)
+        _, pd_df_similarity_lsh_top_k = similarity_lsh_top_k.generate()
+        self.assertEqual(pd_df_similarity_lsh_top_k.shape[0], df_features.count())
+
+        pd_df_report = similarity_lsh.evaluate_lsh(sample_size=3)
+        self.assertEqual(pd_df_report['num_bands'].values[0], 10)
+
+    def test_generate_multiple(self):
+
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
+
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        df_features_int = df_features
+        for col in columns_to_convert:
+            df_features_int = df_features_int.withColumn(col, f.col(col).cast(IntegerType()))
+
+        features = Features.from_spark(df_features_int)
+        mat_features = features.matrix.toarray()
 
-        pd_df_similarities_long = similarity._convert_to_long_format(pd_df_similarities_wide)
+        similarities = Similarity(df_features=features, similarity_type=GRAM_SIMILARITY_TYPES, seed=1).generate()
+        self.assertEqual(sorted(similarities), sorted(GRAM_SIMILARITY_TYPES))
 
-        self.assertEqual(pd_df_similarities_long.shape[0],
-                         pd_df_similarities_wide.shape[0]*pd_df_similarities_wide.shape[1])
+        for similarity_type in ['cosine', 'euclidean']:
+            pd_df_wide_expected, _ = Similarity(df_features=features, similarity_type=similarity_type).generate()
+            pd_df_wide, pd_df_long = similarities[similarity_type]
 
-        check_1_3 = pd_df_similarities_long.loc[(pd_df_similarities_long['recipe_id_1'] == 1)
-                                                & (pd_df_similarities_long['recipe_id_2'] == '3')]['similarity'].values[0]
-        self.assertEqual(check_1_3, 9)
+            self.assertTrue((pd_df_wide - pd_df_wide_expected).abs().max().max() < 1e-9)
+            self.assertEqual(pd_df_long.shape[0], features.matrix.shape[0] ** 2)
 
-        check_3_1 = pd_df_similarities_long.loc[(pd_df_similarities_long['recipe_id_1'] == 3)
-                                                & (pd_df_similarities_long['recipe_id_2'] == '1')]['similarity'].values[0]
-        self.assertEqual(check_3_1, 6)
+        pd_df_jaccard, _ = similarities['jaccard']
+        self.assertTrue(np.allclose(pd_df_jaccard.values, jaccard_similarity(mat_features, mat_features)))
 
-        check_2_3 = pd_df_similarities_long.loc[(pd_df_similarities_long['recipe_id_1'] == 2)
-                                                & (pd_df_similarities_long['recipe_id_2'] == '3')]['similarity'].values[0]
-        self.assertEqual(check_2_3, 1)
+        pd_df_overlap, _ = similarities['overlap']
+        self.assertAlmostEqual(pd_df_overlap.loc['recipe_id_1', 'recipe_id_2'], 1)
+        self.assertAlmostEqual(pd_df_overlap.loc['recipe_id_2', 'recipe_id_1'], 1)
 
-        check_1_2 = pd_df_similarities_long.loc[(pd_df_similarities_long['recipe_id_1'] == 1)
-                                                & (pd_df_similarities_long['recipe_id_2'] == '2')]['similarity'].values[0]
-        self.assertEqual(check_1_2, 6)
+        similarities_top_k = Similarity(df_features=features, similarity_type=['jaccard', 'euclidean'], top_k=2,
+                                        block_size=4, seed=1).generate()
+        pd_df_blocks = list(Similarity(df_features=features, similarity_type=['jaccard', 'euclidean'], top_k=2,
+                                       block_size=4, seed=1).generate_long_blocks())
 
+        for similarity_type in ['jaccard', 'euclidean']:
+            pd_df_wide, pd_df_long = similarities_top_k[similarity_type]
+            _, pd_df_long_expected = Similarity(df_features=features, similarity_type=similarity_type,
+                                                top_k=2).generate()
+
+            self.assertIsNone(pd_df_wide)
+            self.assertEqual(pd_df_long['similarity'].round(9).tolist(),
+                             pd_df_long_expected['similarity'].round(9).tolist())
+            self.assertTrue(pd.concat([pd_df_block[similarity_type] for pd_df_block in pd_df_blocks],
+                                      ignore_index=True).equals(pd_df_long))
+
+        similarity_uint8 = Similarity(df_features=features, similarity_type=['cosine', 'euclidean'], precision='uint8')
+        similarity_uint8.generate()
+        self.assertEqual(similarity_uint8.quantisation['cosine']['offset'], 0)
+        self.assertGreater(similarity_uint8.quantisation['euclidean']['scale'],
+                           similarity_uint8.quantisation['cosine']['scale'])
+
+        with self.assertRaises(AssertionError):
+            Similarity(df_features=features, similarity_type=['cosine', 'jaccard_lsh'])
+
+        with self.assertRaises(AssertionError):
+            Similarity(df_features=Features(features.indexes, mat_features * 2, features.columns),
+                       similarity_type='jaccard').generate()
@@ -0,0 +1,81 @@
+from tests import PySparkTestCase
+
+import pyspark.sql.functions as f
+from pyspark.sql.types import *
+
+from similarity import Similarity
+from spark_similarity import SparkSimilarity
+from features import Features
+
+
+class TestSparkSimilarity(PySparkTestCase):
+
+    def _read_features(self):
+
+        df_features = self.spark.read.csv('tests/fixtures/similarity/features.csv', header=True)
+
+        columns_to_convert = [col for col in df_features.columns if 'id' not in col]
+        for col in columns_to_convert:
+            df_features = df_features.withColumn(col, f.col(col).cast(IntegerType()))
+
+        return df_features
+
+    def test_generate(self):
+
+        df_features = self._read_features()
+
+        for similarity_type in ['cosine', 'euclidean']:
+            _, pd_df_similarity_expected = Similarity(df_features=df_features,
+                                                      similarity_type=similarity_type).generate()
+
+            df_similarity_long = SparkSimilarity(df_features=df_features,
+                                                 similarity_type=similarity_type,
+                                                 num_partitions=2).generate()
+            pd_df_similarity_long = df_similarity_long.toPandas()
+
+            self.assertEqual(pd_df_similarity_long.columns.tolist(), pd_df_similarity_expected.columns.tolist())
+            self.assertEqual(pd_df_similarity_long.shape[0], pd_df_similarity_expected.shape[0])
+
+            pd_df_check = pd_df_similarity_long.merge(pd_df_similarity_expected,
+                                                      on=['recipe_id_1', 'recipe_id_2'],
+                                                      suffixes=('', '_expected'))
+            self.assertTrue(((pd_df_check['similarity'] - pd_df_check['similarity_expected']).abs() < 1e-9).all())
+
+            for _, pd_df_group in pd_df_similarity_long.groupby('recipe_id_1'):
+                similarities_by_rank = pd_df_group.sort_values('rank')['similarity']
+                if similarity_type == 'cosine':
+                    self.assertTrue(similarities_by_rank.is_monotonic_decreasing)
+                else:
+                    self.assertTrue(similarities_by_rank.is_monotonic_increasing)
+
+        df_similarity_top_k = SparkSimilarity(df_features=df_features, top_k=2).generate()
+        self.assertEqual(df_similarity_top_k.count(), df_features.count()*2)
+
+        with self.assertRaises(ValueError):
+            SparkSimilarity(df_features=df_features, similarity_type='test').generate()
+
+    def test__create_vectors(self):
+
+        df_features = self._read_features()
+
+        vectors_cosine = SparkSimilarity(df_features=df_features, similarity_type='cosine')\
+            ._create_vectors()\
+            .orderBy('recipe_id')\
+            .collect()
+
+        self.assertAlmostEqual(sum(x * x for x in vectors_cosine[1]['features']), 1)
+        self.assertEqual(vectors_cosine[4]['features'], [0., 0., 0.])
+
+        vectors_euclidean = SparkSimilarity(df_features=df_features, similarity_type='euclidean')\
+            ._create_vectors()\
+            .orderBy('recipe_id')\
+            .collect()
+
+        self.assertEqual(vectors_euclidean[1]['features'], [1., 0., 1.])
+
+    def test__check_is_spark_data_frame(self):
+
+        df_features = self._read_features()
+
+        with self.assertRaises(AssertionError):
+            SparkSimilarity(df_features=Features.from_spark(df_features))
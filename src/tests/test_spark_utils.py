@@ -0,0 +1,28 @@
+from tests import PySparkTestCase
+
+from spark_utils import count_nulls
+from spark_utils import count_duplicates
+
+
+class TestSparkUtils(PySparkTestCase):
+
+    def test_count_nulls(self):
+
+        df_nulls_attributes = self.spark.read.csv('tests/fixtures/preprocess/nulls_attributes.csv', header=True)
+
+        null_report = count_nulls(df_nulls_attributes, df_nulls_attributes.columns)
+
+        self.assertEqual(null_report, {'recipe_id': 0, 'country': 0, 'diet_type': 1})
+
+        null_report_empty = count_nulls(df_nulls_attributes.filter('false'), ['country'])
+
+        self.assertEqual(null_report_empty, {'country': 0})
+        self.assertEqual(count_nulls(df_nulls_attributes, []), {})
+
+    def test_count_duplicates(self):
+
+        df_duplicate_recipes = self.spark.read.csv('tests/fixtures/preprocess/duplicate_recipes.csv', header=True)
+
+        self.assertEqual(count_duplicates(df_duplicate_recipes, 'recipe_id'), 1)
+        self.assertEqual(count_duplicates(df_duplicate_recipes.dropDuplicates(['recipe_id']), 'recipe_id'), 0)
+        self.assertEqual(count_duplicates(df_duplicate_recipes.filter('false'), 'recipe_id'), 0)
@@ -0,0 +1,27 @@
+import unittest
+
+from synthetic import generate_labels
+
+import pandas as pd
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def test_generate_labels(self):
+
+        pd_df_labels = generate_labels(row_count=200, column_count=3, cardinality=12, seed=0)
+
+        self.assertEqual(pd_df_labels.columns.tolist(), ['recipe_id', 'country', 'attribute_1', 'attribute_2'])
+        self.assertEqual(pd_df_labels.shape[0], 200)
+        self.assertTrue(pd_df_labels['recipe_id'].is_unique)
+        self.assertTrue((pd_df_labels.drop(columns=['recipe_id']).nunique() <= 12).all())
+        self.assertTrue(pd_df_labels['country'].str.startswith('Country ').any())
+        pd.testing.assert_frame_equal(pd_df_labels, generate_labels(row_count=200, column_count=3, cardinality=12,
+                                                                    seed=0))
+
+        pd_df_labels = generate_labels(row_count=1000, column_count=1, cardinality=2, na_share=.5, seed=0)
+        self.assertTrue(400 < (pd_df_labels['country'] == '#N/A').sum() < 600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,19 @@ import unittest
 
 from utils import create_timestamp
 from utils import create_parameters_table
+from utils import convert_long_types
+from utils import create_id_table
+from utils import decode_ids
+from utils import write_table
+from utils import read_table
+from utils import write_blocks
+from utils import OUTPUT_FORMATS
+
+import pandas as pd
+import numpy as np
+
+import os
+import tempfile
 
 
 class TestUtils(unittest.TestCase):
@@ -25,15 +38,121 @@ class TestUtils(unittest.TestCase):
                                             index_column=index_column)
 
         self.assertEqual(pd_df_all.shape[0], 1)
-        self.assertEqual(pd_df_all.shape[1], 3)
+        self.assertEqual(pd_df_all.shape[1], 6)
 
         pd_df_sub = create_parameters_table(similarity_type=similarity_type,
                                             columns=columns_sub,
                                             index_column=index_column)
 
         self.assertEqual(pd_df_sub.shape[0], 1)
-        self.assertEqual(pd_df_sub.shape[1], 3)
+        self.assertEqual(pd_df_sub.shape[1], 6)
 
         columns_sub_check = list(pd_df_sub['columns'].values)[0]
         self.assertEqual(columns_sub_check, 'country, protein')
 
+        pd_df_uint8 = create_parameters_table(similarity_type=similarity_type,
+                                              columns=columns_sub,
+                                              index_column=index_column,
+                                              precision='uint8',
+                                              quantisation={'scale': 1 / 255, 'offset': 0.})
+
+        self.assertEqual(pd_df_uint8['precision'].values[0], 'uint8')
+        self.assertAlmostEqual(pd_df_uint8['similarity_scale'].values[0], 1 / 255)
+
+
+    def test_convert_long_types(self):
+
+        pd_df_long = pd.read_csv('tests/fixtures/similarity/similarities_long.csv')
+        pd_df_long['rank'] = 1
+
+        pd_df_long_converted = convert_long_types(pd_df_long)
+
+        self.assertEqual(pd_df_long_converted['similarity'].dtype, np.float32)
+        self.assertEqual(pd_df_long_converted['rank'].dtype, np.int32)
+        self.assertEqual(pd_df_long_converted['id_1'].dtype, pd_df_long['id_1'].dtype)
+
+        pd_df_long['similarity'] = pd_df_long['similarity'].abs().astype(np.uint8)
+        self.assertEqual(convert_long_types(pd_df_long)['similarity'].dtype, np.uint8)
+
+    def test_decode_ids(self):
+
+        pd_df_ids = create_id_table(np.array(['a', 'b', 'c'], dtype=object), 'id')
+
+        self.assertEqual(pd_df_ids.columns.tolist(), ['id_code', 'id'])
+        self.assertEqual(pd_df_ids['id_code'].dtype, np.int32)
+
+        pd_df_long = pd.DataFrame({'id_1': np.array([2, 2, 0], dtype=np.int32),
+                                   'id_2': np.array([2, 1, 0], dtype=np.int32),
+                                   'similarity': [1., .5, 1.]})
+        pd_df_decoded = decode_ids(pd_df_long, pd_df_ids.iloc[::-1], 'id')
+
+        self.assertEqual(pd_df_decoded['id_1'].tolist(), ['c', 'c', 'a'])
+        self.assertEqual(pd_df_decoded['id_2'].tolist(), ['c', 'b', 'a'])
+        self.assertEqual(pd_df_decoded['similarity'].tolist(), pd_df_long['similarity'].tolist())
+        self.assertEqual(pd_df_long['id_1'].dtype, np.int32)
+
+    def test_write_table(self):
+
+        pd_df_long = pd.read_csv('tests/fixtures/similarity/similarities_long.csv', dtype={'id_1': str, 'id_2': str})
+        pd_df_wide = pd.read_csv('tests/fixtures/similarity/similarities_wide.csv', index_col=0)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for output_format in OUTPUT_FORMATS:
+                path = write_table(pd_df_long, f'{temp_dir}/long', output_format=output_format)
+                self.assertTrue(os.path.isfile(path))
+
+                pd_df_read = read_table(f'{temp_dir}/long', output_format=output_format,
+                                        dtype={'id_1': str, 'id_2': str})
+                self.assertTrue(pd_df_read.equals(pd_df_long))
+
+            write_table(pd_df_wide, f'{temp_dir}/wide', output_format='parquet', index=True)
+            pd_df_wide_read = read_table(f'{temp_dir}/wide', output_format='parquet')
+            self.assertEqual(pd_df_wide_read.index.tolist(), pd_df_wide.index.tolist())
+
+            path = write_table(pd_df_long, f'{temp_dir}/long_partitioned', output_format='parquet',
+                               partition_cols=['id_1'])
+            self.assertTrue(os.path.isdir(path))
+            self.assertEqual(len(os.listdir(path)), pd_df_long['id_1'].nunique())
+
+            pd_df_partitioned = read_table(path, output_format='parquet', dtype={'id_1': str})
+            self.assertEqual(pd_df_partitioned.shape, pd_df_long.shape)
+
+            with self.assertRaises(ValueError):
+                write_table(pd_df_long, f'{temp_dir}/long', output_format='json')
+
+    def test_write_table_float16(self):
+
+        pd_df_long = pd.read_csv('tests/fixtures/similarity/similarities_long.csv', dtype={'id_1': str, 'id_2': str})
+        pd_df_long['similarity'] = pd_df_long['similarity'].astype(np.float16)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_table(pd_df_long, f'{temp_dir}/long', output_format='parquet')
+            write_blocks(iter([pd_df_long.iloc[:3], pd_df_long.iloc[3:]]), f'{temp_dir}/long_blocks',
+                         output_format='parquet')
+
+            for path in [f'{temp_dir}/long', f'{temp_dir}/long_blocks']:
+                pd_df_read = read_table(path, output_format='parquet', dtype={'id_1': str, 'id_2': str})
+                self.assertEqual(pd_df_read['similarity'].dtype, np.float32)
+                np.testing.assert_array_equal(pd_df_read['similarity'].values,
+                                              pd_df_long['similarity'].values.astype(np.float32))
+
+            self.assertEqual(pd_df_long['similarity'].dtype, np.float16)
+
+    def test_write_blocks(self):
+
+        pd_df_long = pd.read_csv('tests/fixtures/similarity/similarities_long.csv', dtype={'id_1': str, 'id_2': str})
+        pd_df_blocks = [pd_df_long.iloc[:3], pd_df_long.iloc[3:]]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for output_format in OUTPUT_FORMATS:
+                path = write_blocks(iter(pd_df_blocks), f'{temp_dir}/long', output_format=output_format)
+                self.assertTrue(os.path.isfile(path))
+
+                pd_df_read = read_table(f'{temp_dir}/long', output_format=output_format,
+                                        dtype={'id_1': str, 'id_2': str})
+                self.assertTrue(pd_df_read.equals(pd_df_long))
+
+            path = write_blocks(iter(pd_df_blocks), f'{temp_dir}/long_partitioned', output_format='parquet',
+                                partition_cols=['id_1'])
+            pd_df_partitioned = read_table(path, output_format='parquet', dtype={'id_1': str})
+            self.assertEqual(pd_df_partitioned.shape, pd_df_long.shape)
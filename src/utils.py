@@ -1,5 +1,11 @@
 import datetime
 import pandas as pd
+import numpy as np
+
+import os
+
+
+OUTPUT_FORMATS = ['csv', 'parquet', 'arrow']
 
 
 def create_timestamp():
@@ -13,20 +19,272 @@ def create_timestamp():
     return timestamp
 
 
-def create_parameters_table(similarity_type, columns, index_column):
+def create_parameters_table(similarity_type, columns, index_column, precision='float64', quantisation=None):
     """
     Creates a table with run parameters.
 
     :param similarity_type: string
     :param columns: string or list of strings
     :param index_column: string
+    :param precision: string
+    :param quantisation: dictionary with "scale" and "offset" of uint8 similarities
     :return: pandas data frame
     """
 
     if isinstance(columns, list):
         columns = ', '.join(columns)
-    data = [similarity_type, columns, index_column]
-    pd_df = pd.DataFrame(columns=['similarity_type', 'columns', 'index_column'], data=[data])
+    if quantisation is None:
+        quantisation = {'scale': None, 'offset': None}
+    data = [similarity_type, columns, index_column, precision, quantisation['scale'], quantisation['offset']]
+    pd_df = pd.DataFrame(columns=['similarity_type', 'columns', 'index_column', 'precision', 'similarity_scale',
+                                  'similarity_offset'],
+                         data=[data])
     return pd_df
 
 
+def convert_long_types(pd_df_similarity_long):
+    """
+    Casts "similarity" to float32 (unless already stored with lower precision) and "rank" to int32 in long
+    similarities.
+
+    :param pd_df_similarity_long: pandas data frame
+    :return: pandas data frame
+    """
+
+    types = {'rank': np.int32}
+    if 'similarity' in pd_df_similarity_long.columns and pd_df_similarity_long['similarity'].dtype == np.float64:
+        types['similarity'] = np.float32
+
+    return pd_df_similarity_long.astype({col: types[col] for col in types if col in pd_df_similarity_long.columns})
+
+
+def create_id_table(indexes, index_column):
+    """
+    Creates the dictionary of the int32 row codes stored in long similarities with encoded ids to their indexes.
+
+    :param indexes: numpy array, indexes of the collected features in row order
+    :param index_column: string
+    :return: pandas data frame with columns "{index_column}_code" and index_column
+    """
+
+    return pd.DataFrame({index_column+'_code': np.arange(len(indexes), dtype=np.int32),
+                         index_column: indexes})
+
+
+def decode_ids(pd_df_similarity_long, pd_df_ids, index_column):
+    """
+    Replaces the row codes in "{index_column}_1" and "{index_column}_2" of long similarities by their indexes.
+
+    :param pd_df_similarity_long: pandas data frame, long similarities with encoded ids
+    :param pd_df_ids: pandas data frame, see create_id_table
+    :param index_column: string
+    :return: pandas data frame
+    """
+
+    ids = np.empty(pd_df_ids.shape[0], dtype=object)
+    ids[pd_df_ids[index_column+'_code'].values] = pd_df_ids[index_column].values
+
+    return pd_df_similarity_long.assign(**{col: ids[np.asarray(pd_df_similarity_long[col], dtype=np.int64)]
+                                           for col in [index_column+'_1', index_column+'_2']})
+
+
+def write_table(pd_df, path, output_format='csv', index=False, partition_cols=None):
+    """
+    Writes a table as "{path}.csv", "{path}.parquet" or "{path}.arrow" (arrow ipc file).
+
+    Parquet tables with partition_cols are written as a folder "{path}" with one sub folder per partition.
+
+    :param pd_df: pandas data frame
+    :param path: string, without extension
+    :param output_format: string, one of OUTPUT_FORMATS
+    :param index: boolean, write the index of pd_df
+    :param partition_cols: list of strings, parquet only
+    :return: string, path written
+    """
+
+    if output_format == 'csv':
+        pd_df.to_csv(f'{path}.csv', index=index)
+        return f'{path}.csv'
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Unknown "output_format".')
+
+    import pyarrow as pa
+
+    table = _create_arrow_table(pd_df, output_format, index=index)
+
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        if partition_cols:
+            pq.write_to_dataset(table, root_path=path, partition_cols=partition_cols)
+            return path
+
+        pq.write_table(table, f'{path}.parquet')
+        return f'{path}.parquet'
+
+    with pa.OSFile(f'{path}.arrow', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    return f'{path}.arrow'
+
+
+def _create_arrow_table(pd_df, output_format, index=False):
+    """
+    Converts a pandas data frame to an arrow table, with float16 columns as float32 for parquet, which can not store
+    half floats.
+
+    :param pd_df: pandas data frame
+    :param output_format: string, "parquet" or "arrow"
+    :param index: boolean, keep the index of pd_df
+    :return: pyarrow table
+    """
+
+    import pyarrow as pa
+
+    if output_format == 'parquet':
+        float16_columns = [col for col in pd_df.columns if pd_df[col].dtype == np.float16]
+        if float16_columns:
+            pd_df = pd_df.astype({col: np.float32 for col in float16_columns})
+        if index and pd_df.index.dtype == np.float16:
+            pd_df = pd_df.set_index(pd_df.index.astype(np.float32))
+
+    return pa.Table.from_pandas(pd_df, preserve_index=index)
+
+
+def write_blocks(pd_df_blocks, path, output_format='csv', partition_cols=None):
+    """
+    Writes blocks of a table one by one to a single table, so the full table never has to fit in memory.
+
+    Files are named as in write_table.
+
+    :param pd_df_blocks: iterable of pandas data frames with the same columns
+    :param path: string, without extension
+    :param output_format: string, one of OUTPUT_FORMATS
+    :param partition_cols: list of strings, parquet only
+    :return: string, path written
+    """
+
+    with BlockWriter(path, output_format=output_format, partition_cols=partition_cols) as writer:
+        for pd_df_block in pd_df_blocks:
+            writer.write(pd_df_block)
+
+    return writer.path_written
+
+
+class BlockWriter(object):
+    """
+    Writes blocks of a table one by one to a single table, so several tables can be written side by side.
+
+    """
+
+    def __init__(self, path, output_format='csv', partition_cols=None):
+        """
+
+        :param path: string, without extension
+        :param output_format: string, one of OUTPUT_FORMATS
+        :param partition_cols: list of strings, parquet only
+        """
+
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError('Unknown "output_format".')
+
+        self.path = path
+        self.output_format = output_format
+        self.partition_cols = partition_cols
+        self.path_written = path if output_format == 'parquet' and partition_cols else f'{path}.{output_format}'
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
+
+    def write(self, pd_df_block):
+        """
+        Appends a block to the table.
+
+        :param pd_df_block: pandas data frame
+        :return:
+        """
+
+        if self.output_format == 'csv':
+            is_first = self._file is None
+            if is_first:
+                self._file = open(self.path_written, 'w', newline='')
+            pd_df_block.to_csv(self._file, index=False, header=is_first)
+            return
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = _create_arrow_table(pd_df_block, self.output_format)
+
+        if self.output_format == 'parquet' and self.partition_cols:
+            pq.write_to_dataset(table, root_path=self.path, partition_cols=self.partition_cols)
+            return
+
+        if self._writer is None:
+            if self.output_format == 'parquet':
+                self._writer = pq.ParquetWriter(self.path_written, table.schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path_written, table.schema)
+
+        self._writer.write_table(table)
+
+    def close(self):
+        """
+        Closes the table.
+
+        :return: string, path written
+        """
+
+        if self.output_format == 'csv' and self._file is None:
+            self._file = open(self.path_written, 'a', newline='')
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+        return self.path_written
+
+
+def read_table(path, output_format='csv', dtype=None):
+    """
+    Reads a table written by write_table.
+
+    :param path: string, without extension
+    :param output_format: string, one of OUTPUT_FORMATS
+    :param dtype: dictionary, column name to type
+    :return: pandas data frame
+    """
+
+    if output_format == 'csv':
+        return pd.read_csv(f'{path}.csv', dtype=dtype)
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Unknown "output_format".')
+
+    import pyarrow as pa
+
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        pd_df = pq.read_table(path if os.path.isdir(path) else f'{path}.parquet').to_pandas()
+    else:
+        with pa.memory_map(f'{path}.arrow', 'r') as source:
+            pd_df = pa.ipc.open_file(source).read_pandas()
+
+    if dtype:
+        pd_df = pd_df.astype(dtype)
+
+    return pd_df